@@ -1,38 +1,25 @@
 import os
 import time
-import glob
 from flask import Flask
 
-def _cleanup_stale_cancel_files(app):
+def _cleanup_stale_cancel_requests(app):
     """
-    アプリケーション起動時に、古くなったキャンセルシグナルファイルを削除する。
+    アプリケーション起動時に、古くなったキャンセル要求を削除する。
     """
     try:
-        instance_path = app.instance_path
-        if not os.path.isdir(instance_path):
-            return
-
         lifetime = app.config.get('STALE_CANCEL_FILE_LIFETIME_SECONDS', 86400)
-        current_time = time.time()
-
-        for f in glob.glob(os.path.join(instance_path, '*.cancel')):
-            try:
-                file_mtime = os.path.getmtime(f)
-                if (current_time - file_mtime) > lifetime:
-                    os.remove(f)
-                    app.logger.info(f"Removed stale cancel file: {os.path.basename(f)}")
-            except (OSError, ValueError) as e:
-                # ファイルの読み取り/削除エラーはログに記録するが、起動は妨げない
-                app.logger.warning(f"Error processing stale cancel file {f}: {e}")
+        app.extensions['cancellation'].purge(time.time() - lifetime)
     except Exception as e:
-        app.logger.error(f"Failed to run cancel file cleanup: {e}")
+        # 削除に失敗しても起動は妨げない
+        app.logger.error(f"Failed to run cancel request cleanup: {e}")
 
 
-def create_app(test_config=None):
+def create_app(test_config=None, instance_path=None):
     """
     Flaskアプリケーションインスタンスを作成し、設定を行うApplication Factory。
+    instance_pathを省略した場合は、プロジェクト直下のinstanceフォルダを使用する。
     """
-    app = Flask(__name__, instance_relative_config=True)
+    app = Flask(__name__, instance_path=instance_path, instance_relative_config=True)
 
     # 設定はconfig.pyから読み込む
     app.config.from_object('config')
@@ -51,13 +38,34 @@ def create_app(test_config=None):
     from . import db
     db.init_app(app)
 
+    # ジョブのキャンセル要求（プロセス内はEventで即時に、他ワーカーへはinstance_path下のSQLiteで通知）
+    from .main.services.cancellation import CancellationRegistry
+    app.extensions['cancellation'] = CancellationRegistry(
+        app.instance_path, app.config['CANCEL_FILE_TIMEOUT_SECONDS']
+    )
+
+    # 同じURLへの同時リクエストを1回にまとめる（プロセス内の全ジョブで共有）
+    from .main.services.single_flight import SingleFlight
+    app.extensions['single_flight'] = SingleFlight()
+
+    # バックグラウンドジョブの実行基盤（スクレイピング・Instagram検索はリクエストとは別スレッドで実行）
+    from .main.services.job_runner import JobRunner
+    app.extensions['job_runner'] = JobRunner(
+        app, app.config['JOB_MAX_WORKERS'], app.config['JOB_RETENTION_SECONDS'], app.config['SSE_HEARTBEAT_SECONDS']
+    )
+
     # ブループリントの登録
     from .main import routes
     app.register_blueprint(routes.bp)
 
     # アプリケーションコンテキスト内で起動時処理を実行
     with app.app_context():
-        # 古いキャンセルファイルをクリーンアップ
-        _cleanup_stale_cancel_files(app)
+        # 古いキャンセル要求をクリーンアップ
+        _cleanup_stale_cancel_requests(app)
+        # 後から追加されたテーブル（salons等）を既存DBに作成
+        try:
+            db.create_missing_tables()
+        except Exception as e:
+            app.logger.error(f"Failed to create missing tables: {e}")
 
     return app 
\ No newline at end of file
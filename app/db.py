@@ -6,7 +6,7 @@ from flask import current_app, g
 from flask.cli import with_appcontext
 from sqlalchemy import (
     create_engine, inspect, text,
-    MetaData, Table, Column, Integer, String
+    MetaData, Table, Column, Integer, String, Text, Boolean, DateTime
 )
 
 # --- SQLAlchemy Metadata and Table Definition ---
@@ -22,6 +22,31 @@ areas_table = Table('areas', metadata,
     Column('name', String, nullable=False),
     Column('url', String, nullable=False, unique=True)
 )
+
+# salonsテーブルの定義
+# HPBのサロンID (slnH...) をキーに、スクレイピング結果と最終取得日時を保持する
+salons_table = Table('salons', metadata,
+    Column('salon_id', String, primary_key=True),
+    Column('name', String),
+    Column('phone', String),
+    Column('address', String),
+    Column('staff_count', String),
+    Column('related_links', Text),
+    Column('related_links_count', Integer),
+    Column('url', String, nullable=False),
+    # 除外判定は保存せず、判定に使う特徴量を保存する（ルール変更時に再スクレイピングなしで判定し直すため）
+    Column('has_special_feature', Boolean),
+    Column('last_scraped_at', DateTime, nullable=False, index=True)
+)
+
+# instagram_searchesテーブルの定義
+# 正規化した検索キー（サロン名・gl・hl）ごとに、Serper APIで見つかったInstagram URLと検索日時を保持する
+instagram_searches_table = Table('instagram_searches', metadata,
+    Column('search_key', String, primary_key=True),
+    # Instagram URLのJSON配列。見つからなかった場合は空配列
+    Column('urls', Text, nullable=False),
+    Column('searched_at', DateTime, nullable=False, index=True)
+)
 # ----------------------------------------------
 
 def get_db():
@@ -63,6 +88,32 @@ def init_db():
                 df = pd.read_csv(csv_path)
                 df.to_sql('areas', connection, if_exists='append', index=False)
 
+def create_missing_tables():
+    """
+    メタデータに定義されたテーブルのうち、まだ存在しないものだけを作成する。
+    既存データは削除しないため、アプリ起動時に呼び出しても安全。
+    """
+    if engine is None:
+        raise RuntimeError("Database engine not initialized. Call init_app first.")
+    metadata.create_all(engine, checkfirst=True)
+    add_missing_columns()
+
+def add_missing_columns():
+    """
+    既存テーブルに、メタデータに後から追加されたカラムを追加する（NULL許容のカラムのみ）。
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+
 @click.command('init-db')
 @with_appcontext
 def init_db_command():
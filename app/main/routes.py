@@ -1,14 +1,23 @@
 import os
+import re
+import json
 import uuid
 from flask import (
     Blueprint, render_template, current_app, request, jsonify, send_from_directory, Response
 )
 from sqlalchemy import text
-import time
+from werkzeug.security import safe_join
+import sqlite3
 from . import bp
 from ..db import get_db
 from .services.scraping_service import ScrapingService
 from .services.instagram_service import InstagramSearchService
+from .services.job_runner import get_job_runner, JobCheckpoint
+from .services.cancellation import get_cancellation_registry
+from .services.result_files import render_download
+
+# 1つの入力欄で複数のフリーワードを指定するときの区切り文字（空白はHPBのAND検索として1つのキーワードに含める）
+FREEWORD_SEPARATOR = re.compile(r'[,，、\r\n]')
 
 @bp.route('/')
 def index():
@@ -51,44 +60,148 @@ def index():
 
     return render_template('index.html', grouped_areas=grouped_areas)
 
+def _error_stream(message):
+    """エラーイベントを1件だけ返すSSEレスポンスを作成する。"""
+    def error_generator():
+        yield f"event: error\ndata: {json.dumps({'error': message}, ensure_ascii=False)}\n\n"
+    return Response(error_generator(), mimetype='text/event-stream')
+
+def _submit_scrape_job(params):
+    """
+    スクレイピングジョブをJobRunnerに登録し、job_idを返す。
+    area_idは複数指定でき、prefectureを指定するとその都道府県のすべてのエリアを対象にする。
+    freewordも複数指定でき、キーワードが1つの場合は従来どおり文字列で、複数の場合はリストで渡す。
+    パラメータが不正な場合はValueErrorを送出する。
+    """
+    area_ids = [area_id for area_id in params.getlist('area_id') if area_id]
+    prefecture = (params.get('prefecture') or '').strip() or None  # 都道府県全体（任意）
+    # フリーワード絞り込み（任意。Flaskが自動URLデコード）。複数指定またはカンマ・改行区切りで複数のキーワードを指定できる
+    freewords = [
+        word.strip() for value in params.getlist('freeword') for word in FREEWORD_SEPARATOR.split(value) if word.strip()
+    ]
+    freeword = freewords[0] if len(freewords) == 1 else (freewords or None)
+    incremental = params.get('incremental') == '1'  # 差分取得（任意）
+    if not area_ids and not prefecture:
+        raise ValueError('エリアが選択されていません。')
+
+    job_id = uuid.uuid4().hex
+    # エリアが1つの場合は従来どおりIDをそのまま保存する
+    area_id = area_ids[0] if len(area_ids) == 1 else area_ids
+    job_params = {'area_id': area_id, 'prefecture': prefecture, 'freeword': freeword, 'incremental': incremental}
+    return get_job_runner().submit('scrape', job_id, _scrape_job(job_id, job_params), job_params)
+
+def _scrape_job(job_id, params):
+    """
+    スクレイピングジョブの実行関数を作成する。
+    実行中の状態はJobCheckpointに定期的に保存され、チェックポイントがあればその続きから再開する。
+    """
+    def run():
+        service = ScrapingService()
+        checkpoint = JobCheckpoint(get_job_runner().store, job_id)
+        return service.run_scraping(
+            params['area_id'], job_id, params['freeword'], incremental=params['incremental'], checkpoint=checkpoint,
+            prefecture=params.get('prefecture'),
+        )
+    return run
+
+def _submit_instagram_job(params):
+    """
+    Instagram検索ジョブをJobRunnerに登録し、job_idを返す。
+    パラメータが不正な場合はValueErrorを送出する。
+    """
+    target_file = params.get('target_file')
+    # スクレイピングジョブのID（任意）。指定された場合はジョブの結果を使い、Excelファイルを読み込まない
+    scrape_job_id = params.get('scrape_job_id') or None
+    if not target_file and not scrape_job_id:
+        raise ValueError('対象ファイルが指定されていません。')
+    if scrape_job_id and not scrape_job_id.isalnum():
+        raise ValueError('無効なジョブIDです。')
+    # パストラバーサル対策: ファイル名のみを許可
+    safe_filename = os.path.basename(target_file) if target_file else None
+    if safe_filename != target_file:
+        raise ValueError('無効なファイル名です。')
+
+    def run():
+        service = InstagramSearchService()
+        return service.run_instagram_search(safe_filename, job_id, scrape_job_id)
+
+    job_id = uuid.uuid4().hex
+    return get_job_runner().submit(
+        'instagram', job_id, run, {'target_file': safe_filename, 'scrape_job_id': scrape_job_id}
+    )
+
+def _stream_job(job_id, last_event_id=0):
+    return Response(get_job_runner().stream(job_id, last_event_id), mimetype='text/event-stream')
+
 @bp.route('/scrape')
 def scrape():
     """
-    スクレイピング実行リクエストを受け取り、進捗をストリーミング配信する。
+    スクレイピングジョブを登録し、その進捗をストリーミング配信する。
+    ジョブはリクエストとは別スレッドで実行されるため、接続が切れても中断されない。
     """
-    area_id = request.args.get('area_id')
-    freeword = request.args.get('freeword')  # フリーワード絞り込み（任意。Flaskが自動URLデコード）
-    app = current_app._get_current_object()
-    job_id = uuid.uuid4().hex
+    try:
+        job_id = _submit_scrape_job(request.args)
+    except ValueError as e:
+        return _error_stream(str(e))
+    return _stream_job(job_id)
 
-    if not area_id:
-        def error_generator():
-            yield "event: error\ndata: {\"error\": \"エリアが選択されていません。\"}\n\n"
-        return Response(error_generator(), mimetype='text/event-stream')
-
-    def stream_with_context(app_context, area_id_param, job_id_param, freeword_param):
-        """ジェネレータがアプリコンテキスト内で実行されるようにするラッパー"""
-        cancel_file = os.path.join(app_context.instance_path, f"{job_id_param}.cancel")
-        try:
-            with app_context.app_context():
-                yield f"event: job_id\ndata: {job_id_param}\n\n"
-
-                service = ScrapingService()
-                yield from service.run_scraping(area_id_param, job_id_param, freeword_param)
-        finally:
-            # ジョブ完了後、キャンセルシグナルファイルを削除
-            if os.path.exists(cancel_file):
-                try:
-                    os.remove(cancel_file)
-                except OSError as e:
-                    app_context.logger.error(f"Error removing cancel file {cancel_file}: {e}")
-
-    return Response(stream_with_context(app, area_id, job_id, freeword), mimetype='text/event-stream')
+@bp.route('/scrape/jobs', methods=['POST'])
+def scrape_job():
+    """
+    スクレイピングジョブを登録し、job_idを返す。
+    進捗は /jobs/<job_id>/events から受信する。
+    """
+    try:
+        job_id = _submit_scrape_job(request.values)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 400
+    return jsonify({'job_id': job_id}), 202
+
+@bp.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """
+    ジョブの進捗イベントを配信する。
+    Last-Event-IDヘッダー（またはlast_event_idクエリ）より後のイベントから再送するため、
+    切断後に再接続しても取りこぼしなく続きを受信できる。
+    """
+    if not job_id.isalnum():
+        return _error_stream('無効なジョブIDです。')
+    runner = get_job_runner()
+    job = runner.store.get(job_id)
+    if job is None:
+        return _error_stream('ジョブが見つかりません。')
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or '0'
+    try:
+        last_event_id = int(last_event_id)
+    except ValueError:
+        last_event_id = 0
+    if job['status'] == 'finished' and not runner.store.events_after(job_id, last_event_id):
+        # すべて受信済みの終了したジョブには204を返し、EventSourceの再接続を止める
+        return Response(status=204)
+    return _stream_job(job_id, last_event_id)
+
+@bp.route('/jobs/<job_id>/resume', methods=['POST'])
+def job_resume(job_id):
+    """
+    ワーカーの再起動などで途中終了したスクレイピングジョブを、チェックポイントから再開する。
+    取得済みのページは再取得しない。進捗は引き続き /jobs/<job_id>/events から受信する。
+    """
+    if not job_id.isalnum():
+        return jsonify({'status': 'error', 'error': '無効なジョブIDです。'}), 400
+    runner = get_job_runner()
+    job = runner.store.get(job_id)
+    if job is None or job['kind'] != 'scrape':
+        return jsonify({'status': 'error', 'error': 'ジョブが見つかりません。'}), 404
+    if not runner.resume(job_id, _scrape_job(job_id, job['params'])):
+        return jsonify({'status': 'error', 'error': '再開できるチェックポイントがありません。'}), 409
+    return jsonify({'job_id': job_id}), 202
 
 @bp.route('/scrape/cancel', methods=['POST'])
 def scrape_cancel():
     """
-    キャンセルシグナルファイルを作成することで、処理の中断をリクエストする。
+    キャンセル要求を登録することで、処理の中断をリクエストする。
+    ジョブを実行中のワーカーには、別のワーカーで受け付けた要求も通知される。
     """
     data = request.get_json()
     job_id = data.get('job_id')
@@ -97,14 +210,11 @@ def scrape_cancel():
         return jsonify({'status': 'error', 'message': 'Invalid job ID'}), 400
 
     try:
-        cancel_file_path = os.path.join(current_app.instance_path, f"{job_id}.cancel")
-        # タイムスタンプをファイルに書き込む
-        with open(cancel_file_path, 'w') as f:
-            f.write(str(time.time()))
-        current_app.logger.info(f"Cancellation signal created for job: {job_id}")
+        get_cancellation_registry().request(job_id)
+        current_app.logger.info(f"Cancellation requested for job: {job_id}")
         return jsonify({'status': 'cancellation_requested'})
-    except IOError as e:
-        current_app.logger.error(f"Error creating cancel file for job {job_id}: {e}")
+    except sqlite3.Error as e:
+        current_app.logger.error(f"Error requesting cancellation for job {job_id}: {e}")
         return jsonify({'status': 'error', 'message': 'Failed to signal cancellation'}), 500
 
 @bp.route('/api/instagram-search-available')
@@ -114,42 +224,36 @@ def instagram_search_available():
 
 @bp.route('/instagram-search')
 def instagram_search():
-    target_file = request.args.get('target_file')
-    app = current_app._get_current_object()
-    job_id = uuid.uuid4().hex
-
-    if not target_file:
-        def error_generator():
-            yield 'event: error\ndata: {"error": "対象ファイルが指定されていません。"}\n\n'
-        return Response(error_generator(), mimetype='text/event-stream')
+    """
+    Instagram検索ジョブを登録し、その進捗をストリーミング配信する。
+    """
+    try:
+        job_id = _submit_instagram_job(request.args)
+    except ValueError as e:
+        return _error_stream(str(e))
+    return _stream_job(job_id)
 
-    # パストラバーサル対策: ファイル名のみを許可
-    safe_filename = os.path.basename(target_file)
-    if safe_filename != target_file:
-        def error_generator():
-            yield 'event: error\ndata: {"error": "無効なファイル名です。"}\n\n'
-        return Response(error_generator(), mimetype='text/event-stream')
-
-    def stream_with_context(app_context, file_name_param, job_id_param):
-        cancel_file = os.path.join(app_context.instance_path, f"{job_id_param}.cancel")
-        try:
-            with app_context.app_context():
-                yield f"event: job_id\ndata: {job_id_param}\n\n"
-                service = InstagramSearchService()
-                yield from service.run_instagram_search(file_name_param, job_id_param)
-        finally:
-            if os.path.exists(cancel_file):
-                try:
-                    os.remove(cancel_file)
-                except OSError as e:
-                    app_context.logger.error(f"Error removing cancel file {cancel_file}: {e}")
-
-    return Response(stream_with_context(app, safe_filename, job_id), mimetype='text/event-stream')
+@bp.route('/instagram-search/jobs', methods=['POST'])
+def instagram_search_job():
+    """
+    Instagram検索ジョブを登録し、job_idを返す。
+    進捗は /jobs/<job_id>/events から受信する。
+    """
+    try:
+        job_id = _submit_instagram_job(request.values)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 400
+    return jsonify({'job_id': job_id}), 202
 
 @bp.route('/download/<path:filename>')
 def download(filename):
     """
-    生成されたExcelファイルをダウンロードさせる。
+    ジョブの結果をダウンロードさせる。
+    結果はParquetファイルとして保存されており、拡張子（.xlsx/.csv/.json）の形式のファイルを
+    初回のダウンロード時に作成して以降は保存したものを返す。
     """
     directory = os.path.join(current_app.root_path, '..', current_app.config['OUTPUT_DIR'])
+    # パストラバーサル対策: OUTPUT_DIRの外のファイルは作成しない（配信はsend_from_directoryが同様に検査する）
+    if safe_join(directory, filename) is not None:
+        render_download(directory, filename)
     return send_from_directory(directory, filename, as_attachment=True) 
\ No newline at end of file
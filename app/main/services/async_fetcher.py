@@ -0,0 +1,107 @@
+import asyncio
+import threading
+from concurrent.futures import wait as wait_futures
+
+import aiohttp
+
+
+class BufferedResponse:
+    """
+    本文まで読み切ったレスポンスを保持する、requests.Response互換の最小クラス。
+    aiohttpのレスポンスやHTTPキャッシュの内容を、同期エンジンと同じパース処理(url, text)に渡すために使う。
+    """
+
+    def __init__(self, url, status_code, content, encoding, headers):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.encoding = encoding
+        self.headers = headers
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or 'utf-8', errors='replace')
+
+
+class AsyncFetchExecutor:
+    """
+    専用スレッド上の1つのイベントループでコルーチンを実行するExecutor。
+    submit()はconcurrent.futures.Futureを返すため、ThreadPoolExecutorと同じくas_completedで待機できる。
+    実行中のHTTPリクエスト数はmax_in_flightで全体的に制限される。
+    """
+
+    def __init__(self, max_in_flight, headers=None, timeout=10):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name='async-fetch-loop', daemon=True)
+        self._thread.start()
+        self._futures = set()
+        self._lock = threading.Lock()
+        self._closed = False
+        asyncio.run_coroutine_threadsafe(
+            self._setup(max_in_flight, headers or {}, timeout), self.loop
+        ).result()
+
+    async def _setup(self, max_in_flight, headers, timeout):
+        # Semaphore/ClientSessionはループ上で生成する必要がある
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._session = aiohttp.ClientSession(
+            headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)
+        )
+
+    def submit(self, coro_fn, *args, **kwargs):
+        """コルーチン関数をイベントループに投入し、concurrent.futures.Futureを返す。"""
+        if self._closed:
+            raise RuntimeError('cannot schedule new futures after shutdown')
+        future = asyncio.run_coroutine_threadsafe(coro_fn(*args, **kwargs), self.loop)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._discard_future)
+        return future
+
+    def _discard_future(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    async def get(self, url, headers=None):
+        """同時実行数の上限内でGETし、本文を読み切ったBufferedResponseを返す。"""
+        async with self._semaphore:
+            async with self._session.get(url, headers=headers) as resp:
+                resp.raise_for_status()
+                content = await resp.read()
+                return BufferedResponse(str(resp.url), resp.status, content, resp.charset, resp.headers)
+
+    async def _close(self):
+        # キャンセル済みタスクの後始末を待ってからセッションを閉じる
+        current = asyncio.current_task()
+        tasks = [t for t in asyncio.all_tasks() if t is not current]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        await self._session.close()
+        # asyncio.to_threadで使われた既定のスレッドプールも停止する
+        await self.loop.shutdown_default_executor()
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        """ThreadPoolExecutor.shutdownと同じ引数で、ループとセッションを停止する。"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            pending = list(self._futures)
+
+        if cancel_futures:
+            for future in pending:
+                future.cancel()
+        elif wait and pending:
+            wait_futures(pending)
+
+        asyncio.run_coroutine_threadsafe(self._close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown(wait=True)
+        return False
@@ -0,0 +1,156 @@
+import os
+import time
+import sqlite3
+import threading
+from concurrent.futures import Future
+
+from flask import current_app
+
+
+class CancellationRegistry:
+    """
+    ジョブのキャンセル要求を管理するクラス。
+    プロセス内ではジョブごとのthreading.Eventで通知し、is_cancelled()はEventを参照するだけで済む。
+    別のgunicornワーカーからの要求はinstance_path下のSQLiteファイルに記録され、
+    監視スレッドがPOLL_INTERVAL秒ごとに、このプロセスで監視中のジョブ分だけまとめて確認する。
+    """
+
+    DB_FILE_NAME = 'cancellations.sqlite3'
+    # 他ワーカーからのキャンセル要求を確認する間隔 (秒)
+    POLL_INTERVAL = 0.2
+
+    def __init__(self, instance_path, timeout_seconds):
+        self.db_path = os.path.join(instance_path, self.DB_FILE_NAME)
+        self.timeout_seconds = timeout_seconds
+        self._events = {}
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._watcher = None
+        # 監視スレッドの待機用（常にセットしないため、POLL_INTERVAL秒のタイマーとして働く）
+        self._idle = threading.Event()
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cancellations (job_id TEXT PRIMARY KEY, requested_at REAL NOT NULL)'
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def request(self, job_id):
+        """ジョブのキャンセルを要求する。このプロセスで実行中のジョブには即座に通知される。"""
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO cancellations (job_id, requested_at) VALUES (?, ?)',
+                    (job_id, time.time())
+                )
+        finally:
+            conn.close()
+        with self._lock:
+            watched = job_id in self._events
+        if watched:
+            self._set(job_id)
+
+    def is_cancelled(self, job_id):
+        """キャンセルが要求されているかどうかを返す。初回呼び出し時にジョブの監視を始める。"""
+        return self._event(job_id).is_set()
+
+    def wait(self, job_id, seconds):
+        """
+        最大seconds秒待機する。待機中にキャンセルされた場合は即座に戻り、Trueを返す。
+        time.sleepの代わりに使い、リトライ前や送信レート制限の待機を中断できるようにする。
+        """
+        return self._event(job_id).wait(seconds)
+
+    def future(self, job_id):
+        """
+        キャンセル時に完了するconcurrent.futures.Futureを返す。
+        タスクのFutureと一緒にconcurrent.futures.waitへ渡し、待機をキャンセルで打ち切るために使う。
+        """
+        event = self._event(job_id)
+        with self._lock:
+            future = self._futures.setdefault(job_id, Future())
+        if event.is_set() and not future.done():
+            future.set_result(True)
+        return future
+
+    def release(self, job_id):
+        """ジョブの終了時に呼び出し、キャンセル要求と監視を破棄する。"""
+        with self._lock:
+            self._events.pop(job_id, None)
+            self._futures.pop(job_id, None)
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('DELETE FROM cancellations WHERE job_id = ?', (job_id,))
+        finally:
+            conn.close()
+
+    def purge(self, older_than):
+        """older_thanより前に要求され、対応するジョブが終了しなかったキャンセル要求を削除する。"""
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('DELETE FROM cancellations WHERE requested_at < ?', (older_than,))
+        finally:
+            conn.close()
+
+    def _event(self, job_id):
+        with self._lock:
+            event = self._events.get(job_id)
+            if event is not None:
+                return event
+            event = self._events[job_id] = threading.Event()
+            if self._watcher is None or not self._watcher.is_alive():
+                self._watcher = threading.Thread(target=self._watch, name='cancellation-watcher', daemon=True)
+                self._watcher.start()
+        # 監視を始める前に要求されていた場合に備え、初回のみ同期的に確認する
+        if self._requested([job_id]):
+            self._set(job_id)
+        return event
+
+    def _set(self, job_id):
+        with self._lock:
+            event = self._events.get(job_id)
+            future = self._futures.get(job_id)
+        if event is not None:
+            event.set()
+        if future is not None and not future.done():
+            future.set_result(True)
+
+    def _requested(self, job_ids):
+        """job_idsのうち、有効期間内のキャンセル要求があるものを返す。"""
+        placeholders = ','.join('?' * len(job_ids))
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f'SELECT job_id FROM cancellations WHERE job_id IN ({placeholders}) AND requested_at >= ?',
+                (*job_ids, time.time() - self.timeout_seconds)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [job_id for job_id, in rows]
+
+    def _watch(self):
+        """監視中のジョブがなくなるまで、他ワーカーからのキャンセル要求を確認し続ける。"""
+        while True:
+            self._idle.wait(self.POLL_INTERVAL)
+            with self._lock:
+                job_ids = [job_id for job_id, event in self._events.items() if not event.is_set()]
+                if not self._events:
+                    self._watcher = None
+                    return
+            if not job_ids:
+                continue
+            try:
+                for job_id in self._requested(job_ids):
+                    self._set(job_id)
+            except sqlite3.Error:
+                # 一時的なロック競合などは次の確認で再試行する
+                continue
+
+
+def get_cancellation_registry():
+    """現在のアプリケーションのCancellationRegistryを返す。"""
+    return current_app.extensions['cancellation']
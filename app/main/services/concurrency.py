@@ -0,0 +1,117 @@
+import math
+import time
+import threading
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD方式で同時実行数の上限を調整するクラス。
+    - 成功が現在の上限と同じ件数だけ続くごとに、上限を1つ増やす（maximumまで）。
+    - スロットリング（HTTP 429など）を受けると上限を半分にし（minimumまで）、backoff秒間は新たな実行を止める。
+      スロットリングが続くたびにbackoffは倍になり（max_backoff_secondsまで）、成功すると元に戻る。
+    呼び出し側はacquire()で実行枠を取得し、終わったらrelease()で返す。
+    """
+
+    def __init__(self, initial, minimum=1, maximum=None, backoff_seconds=1.0, max_backoff_seconds=16.0,
+                 clock=time.monotonic):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum or initial)
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self._clock = clock
+        self._limit = min(max(initial, self.minimum), self.maximum)
+        self._in_use = 0
+        self._successes = 0
+        self._consecutive_throttles = 0
+        self._paused_until = 0.0
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self):
+        return self._limit
+
+    def acquire(self, timeout=None):
+        """実行枠を取得する。timeout秒以内に取得できなければFalseを返す。"""
+        deadline = None if timeout is None else self._clock() + timeout
+        with self._condition:
+            while True:
+                now = self._clock()
+                if self._in_use < self._limit and now >= self._paused_until:
+                    self._in_use += 1
+                    return True
+                wait = self._paused_until - now if now < self._paused_until else None
+                if deadline is not None:
+                    if now >= deadline:
+                        return False
+                    wait = deadline - now if wait is None else min(wait, deadline - now)
+                self._condition.wait(wait)
+
+    def release(self):
+        with self._condition:
+            self._in_use -= 1
+            self._condition.notify_all()
+
+    def record_success(self):
+        with self._condition:
+            self._consecutive_throttles = 0
+            self._successes += 1
+            if self._successes >= self._limit and self._limit < self.maximum:
+                self._limit += 1
+                self._successes = 0
+                self._condition.notify_all()
+
+    def record_throttled(self):
+        """スロットリングを記録し、このあと実行を止める秒数を返す。"""
+        with self._condition:
+            self._limit = max(self.minimum, self._limit // 2)
+            self._successes = 0
+            backoff = min(self.backoff_seconds * 2 ** self._consecutive_throttles, self.max_backoff_seconds)
+            self._consecutive_throttles += 1
+            self._paused_until = max(self._paused_until, self._clock() + backoff)
+            return backoff
+
+
+class LatencyAwareConcurrency(AdaptiveConcurrency):
+    """
+    AdaptiveConcurrencyの上限を、応答時間とエラー率でも調整するクラス。
+    - record()でリクエストごとの応答時間と成否を記録し、window件ごとに判定する。
+      応答時間のp95がtarget_p95_seconds以下、かつエラー率がmax_error_rate以下なら上限を1つ増やし（maximumまで）、
+      どちらかを超えていれば上限を半分にする（minimumまで）。
+    - スロットリング（HTTP 429/503など）はrecord_throttled()で記録し、判定を待たずに上限を半分にする。
+      同時に送っていたリクエストがまとめて受けた分で何度も半分にしないよう、前回の減少後のバックオフ中に
+      受けたスロットリングでは上限を変えない。
+    直近の判定に使ったp95とエラー率はlast_p95_seconds・last_error_rateで参照できる。
+    """
+
+    def __init__(self, initial, target_p95_seconds, max_error_rate, window=20, **kwargs):
+        super().__init__(initial, **kwargs)
+        self.target_p95_seconds = target_p95_seconds
+        self.max_error_rate = max_error_rate
+        self.window = max(1, window)
+        self.last_p95_seconds = None
+        self.last_error_rate = None
+        self._samples = []
+
+    def record(self, seconds, error=False):
+        """1件のリクエストの応答時間（秒）と、失敗したかどうかを記録する。"""
+        with self._condition:
+            self._samples.append((seconds, error))
+            if len(self._samples) < self.window:
+                return
+            latencies = sorted(seconds for seconds, _ in self._samples)
+            self.last_p95_seconds = latencies[math.ceil(len(latencies) * 0.95) - 1]
+            self.last_error_rate = sum(error for _, error in self._samples) / len(self._samples)
+            self._samples = []
+            if self.last_p95_seconds > self.target_p95_seconds or self.last_error_rate > self.max_error_rate:
+                self._limit = max(self.minimum, self._limit // 2)
+            elif self._limit < self.maximum:
+                self._limit += 1
+                self._condition.notify_all()
+
+    def record_throttled(self):
+        """スロットリングを記録し、このあと実行を止める秒数を返す。バックオフ中なら残りの秒数を返すだけにする。"""
+        with self._condition:
+            now = self._clock()
+            if now < self._paused_until:
+                return self._paused_until - now
+            return super().record_throttled()
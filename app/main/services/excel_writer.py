@@ -0,0 +1,115 @@
+import re
+from datetime import datetime
+
+import pandas as pd
+
+from .result_files import ColumnarWriter, result_path
+
+# 営業対象リストのカラム構成（is_excluded、exclusion_reason等の判定用カラムは出力しない）
+TARGET_COLUMNS = ['サロン名', '電話番号', '住所', 'スタッフ数', '関連リンク', '関連リンク数', 'サロンURL']
+# 除外リストのカラム構成（除外理由を先頭に配置）
+EXCLUDED_COLUMNS = ['除外理由'] + TARGET_COLUMNS
+
+
+def build_file_name(area_name, freeword=None, prefix='', timestamp=None):
+    """{prefix}{エリア名}_{フリーワード}_{タイムスタンプ}.xlsx 形式のファイル名を返す。"""
+    timestamp = timestamp or datetime.now().strftime('%Y%m%d_%H%M%S')
+    safe_area_name = re.sub(r'[\\/*?:"<>|]', "", area_name)
+    safe_freeword = re.sub(r'[\\/*?:"<>|\x00-\x1f]', "", freeword).strip() if freeword else ''
+    if safe_freeword:
+        return f"{prefix}{safe_area_name}_{safe_freeword}_{timestamp}.xlsx"
+    return f"{prefix}{safe_area_name}_{timestamp}.xlsx"
+
+
+def _cell_value(value):
+    # 欠損値は空セルにする（to_excelと同じ）
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return None
+    return value
+
+
+class SalonListWriter:
+    """
+    スクレイピング結果を、到着順に営業対象リストと除外リストへ同時に書き出すクラス。
+    各リストはOUTPUT_DIRに結果のParquetファイルとして保存し、xlsxはダウンロード時に作成する
+    （file_name・excluded_file_nameはダウンロード時のファイル名）。
+    - 重複は(電話番号, サロンURL)のキー集合で逐次除去する。
+    - 除外判定はbatch_size件ごとにExclusionRulesでまとめて行う。
+    - 除外リストのファイルは、除外対象が1件以上ある場合のみ作成する。
+    extra_columnsには、TARGET_COLUMNSの前に出力するカラム（複数エリアのジョブの「エリア」など）を指定する。
+    ワークキューからはlistと同じくappend()で渡される。
+    """
+
+    def __init__(self, output_dir, area_name, freeword, exclusion_rules, batch_size=200, preview_size=5,
+                 extra_columns=()):
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.output_dir = output_dir
+        self.file_name = build_file_name(area_name, freeword, timestamp=timestamp)
+        self.excluded_file_name = build_file_name(area_name, freeword, prefix='除外リスト_', timestamp=timestamp)
+        self.exclusion_rules = exclusion_rules
+        self.batch_size = batch_size
+        self.preview_size = preview_size
+        self.columns = [*extra_columns, *TARGET_COLUMNS]
+        self.received = 0
+        self.duplicates = 0
+        self.preview = []
+        self._keys = set()
+        self._pending = []
+        self._target = ColumnarWriter(result_path(output_dir, self.file_name), 'サロンリスト', self.columns)
+        self._excluded = None
+
+    @property
+    def target_count(self):
+        return self._target.rows
+
+    @property
+    def excluded_count(self):
+        return self._excluded.rows if self._excluded is not None else 0
+
+    def __len__(self):
+        return self.received
+
+    def append(self, record):
+        self.received += 1
+        key = (record.get('電話番号'), record.get('サロンURL'))
+        if key in self._keys:
+            self.duplicates += 1
+            return
+        self._keys.add(key)
+        self._pending.append(record)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """保留中のレコードに除外判定を行い、それぞれのファイルに書き込む。"""
+        if not self._pending:
+            return
+        df = self.exclusion_rules.apply(pd.DataFrame(self._pending))
+        self._pending = []
+        for record in df.to_dict('records'):
+            if record['is_excluded']:
+                if self._excluded is None:
+                    self._excluded = ColumnarWriter(
+                        result_path(self.output_dir, self.excluded_file_name), '除外リスト', ['除外理由', *self.columns]
+                    )
+                self._excluded.append(dict(record, 除外理由=record['exclusion_reason']))
+            else:
+                self._target.append(record)
+                if len(self.preview) < self.preview_size:
+                    self.preview.append({column: _cell_value(record.get(column)) for column in self.columns})
+
+    def close(self):
+        """ファイルを保存し、(営業対象リストのファイル名, 除外リストのファイル名またはNone)を返す。"""
+        self.flush()
+        self._target.close()
+        if self._excluded is None:
+            return self.file_name, None
+        self._excluded.close()
+        return self.file_name, self.excluded_file_name
+
+    def discard(self):
+        """中断時に、書きかけのファイルを残さず破棄する。"""
+        self._pending = []
+        self._target.discard()
+        if self._excluded is not None:
+            self._excluded.discard()
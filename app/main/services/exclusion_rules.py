@@ -0,0 +1,72 @@
+import re
+
+import pandas as pd
+
+# 除外ルール名と、Excelに出力する除外理由（この順に並べて出力する）
+EXCLUSION_REASONS = {
+    'eprp': 'EPRP',
+    'este_relax': 'エステ/リラク',
+    'no_phone': '電話番号なし',
+    'single_stylist': 'スタッフ数',
+    'related_links': '関連リンク数',
+}
+
+# 「スタイリスト1人」の表記ゆれ（スタイリスト：1人、スタイリスト 1名、スタイリスト1人 など）
+SINGLE_STYLIST_PATTERN = re.compile(r'スタイリスト\s*[：:]?\s*1\s*[人名]')
+
+
+class ExclusionRules:
+    """
+    スクレイピングで取得した生の特徴量から、営業対象外のサロンを判定するルール群。
+    DataFrame全体に対して列単位（ベクトル化）で判定するため、保存済みのサロン情報にも
+    再スクレイピングなしで適用し直せる。
+
+    - eprp: 特集セクションがない (has_special_feature=False)
+    - este_relax: サロンURLに/kr/が含まれる（エステ/リラク）
+    - no_phone: 電話番号が空
+    - single_stylist: スタイリスト1人かつアシスタントなし
+    - related_links: 関連リンク数がrelated_links_threshold以上
+    """
+
+    def __init__(self, enabled=None, related_links_threshold=4):
+        enabled = list(EXCLUSION_REASONS) if enabled is None else list(enabled)
+        unknown = set(enabled) - set(EXCLUSION_REASONS)
+        if unknown:
+            raise ValueError(f"Unknown exclusion rules: {', '.join(sorted(unknown))}")
+        self.enabled = [name for name in EXCLUSION_REASONS if name in enabled]
+        self.related_links_threshold = related_links_threshold
+
+    @staticmethod
+    def _column(df, name, default):
+        if name in df.columns:
+            return df[name]
+        return pd.Series(default, index=df.index)
+
+    def masks(self, df):
+        """有効なルールごとに、該当するサロンをTrueとするbool列を返す。"""
+        staff = self._column(df, 'スタッフ数', '').fillna('').astype(str)
+        masks = {
+            # 特集セクションの有無が不明なサロンはEPRPとしない
+            'eprp': self._column(df, 'has_special_feature', True).fillna(True).astype(bool).eq(False),
+            'este_relax': self._column(df, 'サロンURL', '').fillna('').astype(str).str.contains('/kr/', regex=False),
+            'no_phone': self._column(df, '電話番号', '').fillna('').astype(str).str.strip().eq(''),
+            'single_stylist': (
+                staff.str.contains(SINGLE_STYLIST_PATTERN)
+                & ~staff.str.contains('アシスタント', regex=False)
+            ),
+            'related_links': (
+                pd.to_numeric(self._column(df, '関連リンク数', 0), errors='coerce').fillna(0)
+                >= self.related_links_threshold
+            ),
+        }
+        return {name: masks[name] for name in self.enabled}
+
+    def apply(self, df):
+        """is_excluded と exclusion_reason（カンマ区切りの除外理由）の列を付けたDataFrameを返す。"""
+        df = df.copy()
+        reasons = pd.Series('', index=df.index, dtype=object)
+        for name, mask in self.masks(df).items():
+            reasons = reasons.mask(mask, reasons + EXCLUSION_REASONS[name] + ', ')
+        df['exclusion_reason'] = reasons.str.removesuffix(', ')
+        df['is_excluded'] = df['exclusion_reason'] != ''
+        return df
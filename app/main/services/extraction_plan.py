@@ -0,0 +1,109 @@
+import os
+import json
+import threading
+
+from .html_parser import get_parser
+
+
+class ExtractionPlan:
+    """
+    selectors.jsonから構築する抽出プラン。
+    CSSセレクタは構築時にパーサーバックエンド向けにコンパイルしておき、ページごとの解析では再利用する。
+    詳細ページのテーブルは1回だけ走査してth→tdの対応表を作り、住所・スタッフ数をそこから引く。
+    """
+
+    # 住所・スタッフ数を探すテーブル
+    DATA_TABLE_SELECTOR = 'table.slnDataTbl'
+
+    def __init__(self, selectors, parser):
+        self.selectors = selectors
+        self.parser = parser
+        area_page = selectors['area_page']
+        salon_detail = selectors['salon_detail']
+        compile_css = parser.compile
+        self._pagination = compile_css(area_page['pagination'])
+        self._salon_link = compile_css(area_page['salon_url_in_list'])
+        self._name = compile_css(salon_detail['name'])
+        self._related_links = compile_css(salon_detail['related_links'])
+        self._phone_page_link = compile_css(salon_detail['phone_page_link'])
+        self._special_feature = compile_css(salon_detail['special_feature_section'])
+        self._data_table = compile_css(self.DATA_TABLE_SELECTOR)
+        self._phone_number = compile_css(selectors['phone_page']['phone_number'])
+        self._address_label = salon_detail['address_label']
+        self._staff_count_label = salon_detail['staff_count_label']
+
+    def parse(self, content, encoding=None):
+        return self.parser.parse(content, encoding)
+
+    def _text(self, doc, compiled):
+        element = self.parser.select_one(doc, compiled)
+        return self.parser.text(element) if element is not None else ''
+
+    def _hrefs(self, doc, compiled):
+        hrefs = (self.parser.attr(link, 'href') for link in self.parser.select(doc, compiled))
+        return [href for href in hrefs if href is not None]
+
+    def pagination_text(self, doc):
+        """一覧ページのページ送り表示のテキストを返す。要素がなければNoneを返す。"""
+        element = self.parser.select_one(doc, self._pagination)
+        return self.parser.text(element) if element is not None else None
+
+    def salon_hrefs(self, doc):
+        """一覧ページに掲載されたサロンへのリンク(href)を返す。"""
+        return self._hrefs(doc, self._salon_link)
+
+    def salon_fields(self, doc):
+        """詳細ページから、サロン情報の組み立てに必要な値をまとめて取り出す。"""
+        table = self.parser.select_one(doc, self._data_table)
+        th_values = self.parser.th_map(table) if table is not None else {}
+        phone_page_links = self._hrefs(doc, self._phone_page_link)
+        return {
+            'name': self._text(doc, self._name),
+            'address': self._th_value(th_values, self._address_label),
+            'staff_count': self._th_value(th_values, self._staff_count_label),
+            'related_links': self._hrefs(doc, self._related_links),
+            'phone_page_href': phone_page_links[0] if phone_page_links else None,
+            'has_special_feature': self.parser.select_one(doc, self._special_feature) is not None,
+        }
+
+    @staticmethod
+    def _th_value(th_values, label):
+        """labelを部分的に含む最初の<th>に対応する<td>のテキストを返す。"""
+        return next((value for th_text, value in th_values.items() if label in th_text), '')
+
+    def phone_number(self, doc):
+        """電話番号ページから電話番号を取り出す。"""
+        return self._text(doc, self._phone_number)
+
+
+# プロセス内で共有する抽出プラン {(selectors.jsonの絶対パス, パーサー名): (mtime, plan)}
+_plans = {}
+_plans_lock = threading.Lock()
+
+
+def get_extraction_plan(path, parser_name, logger=None):
+    """
+    プロセス内で共有する抽出プランを返す。
+    selectors.jsonの更新時刻が前回の構築時から変わった場合のみ読み込み直す。
+    読み込み直しに失敗した場合は、前回の抽出プランを使い続ける。
+    """
+    path = os.path.abspath(path)
+    key = (path, parser_name)
+    with _plans_lock:
+        cached = _plans.get(key)
+        try:
+            # エディタの保存処理などで一瞬ファイルが存在しない場合も、前回の抽出プランを使い続ける
+            mtime = os.stat(path).st_mtime_ns
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+            with open(path, 'r', encoding='utf-8') as f:
+                plan = ExtractionPlan(json.load(f), get_parser(parser_name))
+        except Exception as e:
+            if cached is None:
+                raise
+            if logger:
+                logger.error(f"Failed to reload {path}, keeping the previous selectors: {e}")
+            return cached[1]
+
+        _plans[key] = (mtime, plan)
+        return plan
@@ -0,0 +1,127 @@
+import threading
+
+import soupsieve
+from bs4 import BeautifulSoup
+
+
+class BeautifulSoupParser:
+    """
+    BeautifulSoup + html.parser によるパーサーバックエンド（純Python、追加の依存なし）。
+    パーサーバックエンドは、compile()で事前にコンパイルしたCSSセレクタで、parse()で生成した文書から
+    要素を取得し、text()/joined_text()/attr()で値を取り出す共通のインターフェースを持つ。
+    """
+
+    name = 'html.parser'
+
+    def parse(self, content, encoding=None):
+        """レスポンスのバイト列を解析する。encodingがNoneの場合はmetaタグ等から判定する。"""
+        return BeautifulSoup(content, 'html.parser', from_encoding=encoding)
+
+    def compile(self, selector):
+        return soupsieve.compile(selector)
+
+    def select(self, node, compiled):
+        return compiled.select(node)
+
+    def select_one(self, node, compiled):
+        return compiled.select_one(node)
+
+    def text(self, element):
+        """要素内の全テキストを連結し、前後の空白を除いて返す。"""
+        return element.text.strip()
+
+    def joined_text(self, element):
+        """要素内のテキストをそれぞれ前後の空白を除き、空白区切りで連結して返す。"""
+        return element.get_text(separator=' ', strip=True)
+
+    def attr(self, element, name):
+        return element.get(name)
+
+    def th_map(self, table):
+        """テーブル内の各<th>のテキストと、その隣の<td>のテキストの対応を文書順で返す。"""
+        values = {}
+        for th_element in table.find_all('th'):
+            td_element = th_element.find_next_sibling('td')
+            values.setdefault(
+                th_element.get_text().strip(), self.joined_text(td_element) if td_element is not None else ''
+            )
+        return values
+
+
+class LxmlParser:
+    """
+    lxml.html によるパーサーバックエンド。CSSセレクタはcssselectでXPathにコンパイルする。
+    lxmlのパーサーはスレッド間で共有できないため、スレッド・文字コードごとに生成して使い回す。
+    """
+
+    name = 'lxml'
+
+    def __init__(self):
+        import lxml.html
+        from lxml.cssselect import CSSSelector
+        self._html = lxml.html
+        self._css_selector = CSSSelector
+        self._local = threading.local()
+
+    def _parser(self, encoding):
+        parsers = self._local.__dict__.setdefault('parsers', {})
+        if encoding not in parsers:
+            try:
+                parsers[encoding] = self._html.HTMLParser(encoding=encoding)
+            except LookupError:
+                # lxmlが対応していない文字コード名の場合は、文書中の宣言から判定させる
+                parsers[encoding] = self._html.HTMLParser()
+        return parsers[encoding]
+
+    def parse(self, content, encoding=None):
+        """レスポンスのバイト列を解析する。encodingがNoneの場合はmetaタグ等から判定する。"""
+        if not content or not content.strip():
+            # lxmlは空文書を解析できないため、空のhtml要素を返す
+            return self._html.document_fromstring('<html></html>')
+        return self._html.document_fromstring(content, parser=self._parser(encoding))
+
+    def compile(self, selector):
+        return self._css_selector(selector, translator='html')
+
+    def select(self, node, compiled):
+        return compiled(node)
+
+    def select_one(self, node, compiled):
+        elements = compiled(node)
+        return elements[0] if elements else None
+
+    def text(self, element):
+        """要素内の全テキストを連結し、前後の空白を除いて返す。"""
+        return element.text_content().strip()
+
+    def joined_text(self, element):
+        """要素内のテキストをそれぞれ前後の空白を除き、空白区切りで連結して返す。"""
+        return ' '.join(s.strip() for s in element.xpath('.//text()') if s.strip())
+
+    def attr(self, element, name):
+        return element.get(name)
+
+    def th_map(self, table):
+        """テーブル内の各<th>のテキストと、その隣の<td>のテキストの対応を文書順で返す。"""
+        values = {}
+        for th_element in table.iter('th'):
+            td_element = next(th_element.itersiblings('td'), None)
+            values.setdefault(
+                th_element.text_content().strip(),
+                self.joined_text(td_element) if td_element is not None else ''
+            )
+        return values
+
+
+PARSER_BACKENDS = {
+    BeautifulSoupParser.name: BeautifulSoupParser,
+    LxmlParser.name: LxmlParser,
+}
+
+
+def get_parser(name):
+    """HTML_PARSERの設定値に対応するパーサーバックエンドを返す。"""
+    try:
+        return PARSER_BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown HTML parser backend: {name}") from None
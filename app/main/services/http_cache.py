@@ -0,0 +1,162 @@
+import os
+import time
+import zlib
+import sqlite3
+import threading
+
+from .async_fetcher import BufferedResponse
+
+
+class HttpCache:
+    """
+    instance_path下のSQLiteファイルに保存する、全ワーカー共有のHTTPレスポンスキャッシュ。
+
+    - ページ種別('list', 'detail', 'phone')ごとにTTLを持ち、TTL内のエントリはそのまま返す。
+    - TTLを過ぎたエントリはETag/Last-Modifiedによる条件付きリクエストで再検証できる。
+    - 本文はzlibで圧縮して保存し、合計サイズがmax_bytesを超えたら最終アクセスが古い順に削除する。
+    ヒット数・ミス数はインスタンス（ジョブ）ごとに集計する。
+    clockには保存・アクセス時刻に使う時計（テストで差し替える）を渡す。
+    """
+
+    DB_FILE_NAME = 'http_cache.sqlite3'
+    # 何回保存するごとに容量チェック（LRU削除）を行うか
+    EVICTION_CHECK_INTERVAL = 20
+
+    def __init__(self, instance_path, ttls, max_bytes, clock=time.time):
+        self.db_path = os.path.join(instance_path, self.DB_FILE_NAME)
+        self._clock = clock
+        self.ttls = ttls
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._stores_since_check = 0
+        # saved_secondsは、ヒットしたエントリを最初に取得したときの所要時間の合計
+        self._stats = {'hits': 0, 'revalidated': 0, 'misses': 0, 'saved_seconds': 0.0}
+        conn = self._connect()
+        try:
+            # 複数ワーカーからの同時読み書きでロック待ちが起きにくいようWALモードにする
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'url TEXT PRIMARY KEY, page_type TEXT NOT NULL, final_url TEXT NOT NULL, '
+                'encoding TEXT, etag TEXT, last_modified TEXT, body BLOB NOT NULL, '
+                'size INTEGER NOT NULL, elapsed REAL NOT NULL, stored_at REAL NOT NULL, last_access REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def lookup(self, url):
+        """キャッシュエントリを辞書で返す。存在しなければNoneを返す。"""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                'SELECT page_type, final_url, encoding, etag, last_modified, body, elapsed, stored_at '
+                'FROM responses WHERE url = ?', (url,)
+            ).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        page_type, final_url, encoding, etag, last_modified, body, elapsed, stored_at = row
+        return {
+            'page_type': page_type,
+            'final_url': final_url,
+            'encoding': encoding,
+            'etag': etag,
+            'last_modified': last_modified,
+            'body': body,
+            'elapsed': elapsed,
+            'stored_at': stored_at,
+        }
+
+    def is_fresh(self, entry, page_type):
+        return self._clock() - entry['stored_at'] < self.ttls.get(page_type, 0)
+
+    def conditional_headers(self, entry):
+        """再検証用の条件付きリクエストヘッダーを返す。"""
+        headers = {}
+        if entry and entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def to_response(self, entry):
+        return BufferedResponse(entry['final_url'], 200, zlib.decompress(entry['body']), entry['encoding'], {})
+
+    def hit(self, url, entry, revalidated=False):
+        """TTL内ヒット、または304による再検証成功を記録し、レスポンスを返す。"""
+        now = self._clock()
+        conn = self._connect()
+        try:
+            with conn:
+                if revalidated:
+                    conn.execute('UPDATE responses SET stored_at = ?, last_access = ? WHERE url = ?', (now, now, url))
+                else:
+                    conn.execute('UPDATE responses SET last_access = ? WHERE url = ?', (now, url))
+        finally:
+            conn.close()
+
+        with self._lock:
+            if revalidated:
+                self._stats['revalidated'] += 1
+            else:
+                self._stats['hits'] += 1
+            self._stats['saved_seconds'] += entry['elapsed']
+        return self.to_response(entry)
+
+    def store(self, url, page_type, response, elapsed):
+        """ネットワークから取得したレスポンスを保存し、ミスとして記録する。"""
+        body = zlib.compress(response.content)
+        now = self._clock()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO responses '
+                    '(url, page_type, final_url, encoding, etag, last_modified, body, size, elapsed, stored_at, last_access) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (url, page_type, response.url, response.encoding,
+                     response.headers.get('ETag'), response.headers.get('Last-Modified'),
+                     body, len(body), elapsed, now, now)
+                )
+        finally:
+            conn.close()
+
+        with self._lock:
+            self._stats['misses'] += 1
+            self._stores_since_check += 1
+            check = self._stores_since_check >= self.EVICTION_CHECK_INTERVAL
+            if check:
+                self._stores_since_check = 0
+        if check:
+            self.evict()
+
+    def evict(self):
+        """合計サイズがmax_bytesを下回るまで、最終アクセスが古いエントリから削除する。"""
+        conn = self._connect()
+        try:
+            with conn:
+                total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+                if total <= self.max_bytes:
+                    return 0
+                removed = 0
+                for url, size in conn.execute('SELECT url, size FROM responses ORDER BY last_access').fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    conn.execute('DELETE FROM responses WHERE url = ?', (url,))
+                    total -= size
+                    removed += 1
+                return removed
+        finally:
+            conn.close()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['saved_seconds'] = round(stats['saved_seconds'], 2)
+        return stats
@@ -0,0 +1,72 @@
+import json
+import unicodedata
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, delete
+
+from ...db import get_db, instagram_searches_table
+
+
+def normalize_search_key(salon_name, gl, hl):
+    """
+    サロン名をNFKC正規化して空白をまとめ、gl・hlと組み合わせた検索キーを返す。
+    全角・半角や空白の違いだけのサロン名は同じキーになる。
+    """
+    name = ' '.join(unicodedata.normalize('NFKC', str(salon_name)).split())
+    return f'{gl}:{hl}:{name}'
+
+
+class InstagramSearchCache:
+    """
+    instagram_searchesテーブルへの読み書きを行うクラス。
+    Instagram URLが見つからなかった検索結果（空リスト）も、短い有効期間で保存する。
+    ジェネレータ（リクエストのアプリコンテキスト）のスレッドからのみ使用する。
+    """
+
+    # IN句に渡すパラメータ数の上限 (SQLiteの制限を考慮)
+    CHUNK_SIZE = 500
+
+    def __init__(self, ttl_days, negative_ttl_days):
+        self.ttl = timedelta(days=ttl_days)
+        self.negative_ttl = timedelta(days=negative_ttl_days)
+
+    def load(self, search_keys):
+        """
+        指定した検索キーのうち、有効期間内の検索結果を返す。
+        戻り値は {search_key: Instagram URLのリスト}。
+        """
+        now = datetime.now()
+        search_keys = list(search_keys)
+        results = {}
+        for start in range(0, len(search_keys), self.CHUNK_SIZE):
+            chunk = search_keys[start:start + self.CHUNK_SIZE]
+            rows = get_db().execute(
+                select(instagram_searches_table).where(
+                    instagram_searches_table.c.search_key.in_(chunk),
+                    instagram_searches_table.c.searched_at >= now - max(self.ttl, self.negative_ttl),
+                )
+            ).mappings().all()
+            for row in rows:
+                urls = json.loads(row['urls'])
+                ttl = self.ttl if urls else self.negative_ttl
+                if row['searched_at'] >= now - ttl:
+                    results[row['search_key']] = urls
+        return results
+
+    def save(self, results):
+        """{search_key: Instagram URLのリスト}を検索キーごとに上書き保存する。"""
+        if not results:
+            return 0
+        now = datetime.now()
+        db = get_db()
+        search_keys = list(results)
+        for start in range(0, len(search_keys), self.CHUNK_SIZE):
+            chunk = search_keys[start:start + self.CHUNK_SIZE]
+            # DBごとのUPSERT構文の違いを避けるため、削除してから挿入する
+            db.execute(delete(instagram_searches_table).where(instagram_searches_table.c.search_key.in_(chunk)))
+            db.execute(instagram_searches_table.insert(), [
+                {'search_key': key, 'urls': json.dumps(results[key], ensure_ascii=False), 'searched_at': now}
+                for key in chunk
+            ])
+        db.commit()
+        return len(results)
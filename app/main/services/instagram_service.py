@@ -2,12 +2,20 @@ import os
 import re
 import json
 import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
 
 import pandas as pd
 import requests
 from flask import current_app
 
+from .cancellation import get_cancellation_registry
+from .concurrency import AdaptiveConcurrency
+from .instagram_cache import InstagramSearchCache, normalize_search_key
+from .job_runner import get_job_runner
+from .result_files import read_result, result_path, write_result
+from .progress import ProgressThrottle
+
 
 class SerperAPIError(Exception):
     """致命的なSerper APIエラー (401/402等)"""
@@ -16,6 +24,11 @@ class SerperAPIError(Exception):
 
 class InstagramSearchService:
     SERPER_SEARCH_URL = 'https://google.serper.dev/search'
+    # 検索対象の国・言語（検索結果キャッシュのキーにも含める）
+    SEARCH_GL = 'jp'
+    SEARCH_HL = 'ja'
+    # 実行枠を待つ間にキャンセルを確認する間隔（秒）
+    ACQUIRE_POLL_SECONDS = 0.2
 
     def __init__(self):
         self.config = current_app.config
@@ -26,84 +39,141 @@ class InstagramSearchService:
         })
         self.instance_path = current_app.instance_path
         self.logger = current_app.logger
+        self.cancellation = get_cancellation_registry()
         self.max_urls = self.config.get('INSTAGRAM_MAX_URLS', 3)
+        # 同時実行数は1から始め、成功が続くとINSTAGRAM_MAX_CONCURRENCYまで増やす。
+        # 最初の1件でAPIキーやクレジットの問題（401/402）が分かれば、残りのサロンの検索は行わない。
+        self.concurrency = AdaptiveConcurrency(
+            1,
+            maximum=self.config['INSTAGRAM_MAX_CONCURRENCY'],
+            backoff_seconds=self.config['INSTAGRAM_THROTTLE_BACKOFF_SECONDS'],
+        )
+        self._fatal_error = None
+        self.search_cache = InstagramSearchCache(
+            self.config['INSTAGRAM_CACHE_TTL_DAYS'], self.config['INSTAGRAM_CACHE_NEGATIVE_TTL_DAYS']
+        )
 
     def _is_cancelled(self, job_id):
-        cancel_file = os.path.join(self.instance_path, f"{job_id}.cancel")
-        if not os.path.exists(cancel_file):
-            return False
-        try:
-            with open(cancel_file, 'r') as f:
-                timestamp_str = f.read().strip()
-            if not timestamp_str:
-                return False
-            timestamp = float(timestamp_str)
-            age = time.time() - timestamp
-            if age > self.config['CANCEL_FILE_TIMEOUT_SECONDS']:
-                return False
-            return True
-        except (ValueError, IOError):
-            return False
+        return self.cancellation.is_cancelled(job_id)
 
-    def _search_instagram(self, salon_name, job_id):
-        """1サロンのInstagram URLを検索する。最大max_urls件のURLリストを返す。"""
-        payload = {
+    def _build_query(self, salon_name):
+        return {
             'q': f'{salon_name} Instagram',
-            'gl': 'jp',
-            'hl': 'ja',
+            'gl': self.SEARCH_GL,
+            'hl': self.SEARCH_HL,
             'num': 10,
         }
 
+    def _extract_instagram_urls(self, data):
+        """検索結果のorganicから、最大max_urls件のInstagram URLを取り出す。"""
+        instagram_urls = []
+        for result in data.get('organic', []):
+            link = result.get('link', '')
+            if 'instagram.com' in link and len(instagram_urls) < self.max_urls:
+                instagram_urls.append(link)
+        return instagram_urls
+
+    def _post_serper(self, payload, label, job_id):
+        """
+        Serper APIにpayloadをPOSTし、レスポンスのJSONを返す。
+        429はAdaptiveConcurrencyで同時実行数を減らしてリトライし、ネットワークエラーはRETRY_COUNT回までリトライする。
+        キャンセルやエラーで取得できなかった場合はNoneを返す。401/402はSerperAPIErrorを発生させる。
+        """
         max_rate_limit_retries = 5
-        rate_limit_delays = [1, 2, 4, 8, 16]
         rate_limit_count = 0
         network_attempts = 0
         last_exception = None
 
         while network_attempts < self.config['RETRY_COUNT']:
-            if self._is_cancelled(job_id):
-                return []
+            # 429を受けた直後は、AdaptiveConcurrencyがバックオフの間だけ実行枠を渡さない
+            while not self.concurrency.acquire(timeout=self.ACQUIRE_POLL_SECONDS):
+                if self._is_cancelled(job_id):
+                    return None
             try:
+                if self._fatal_error is not None:
+                    raise self._fatal_error
+                if self._is_cancelled(job_id):
+                    return None
                 response = self.session.post(self.SERPER_SEARCH_URL, json=payload, timeout=10)
 
                 if response.status_code == 401:
-                    raise SerperAPIError('Serper APIキーが無効です。.envのSERPER_API_KEYを確認してください。')
+                    self._fatal_error = SerperAPIError('Serper APIキーが無効です。.envのSERPER_API_KEYを確認してください。')
+                    raise self._fatal_error
                 if response.status_code == 402:
-                    raise SerperAPIError('Serper APIのクレジットが不足しています。https://serper.dev/ で確認してください。')
+                    self._fatal_error = SerperAPIError('Serper APIのクレジットが不足しています。https://serper.dev/ で確認してください。')
+                    raise self._fatal_error
 
                 if response.status_code == 429:
                     rate_limit_count += 1
+                    delay = self.concurrency.record_throttled()
                     if rate_limit_count > max_rate_limit_retries:
-                        self.logger.error(f"Serper API rate limit exceeded {max_rate_limit_retries} times for '{salon_name}'")
-                        return []
-                    delay = rate_limit_delays[min(rate_limit_count - 1, len(rate_limit_delays) - 1)]
-                    self.logger.warning(f"Serper API rate limited. Retrying in {delay}s... ({rate_limit_count}/{max_rate_limit_retries})")
-                    time.sleep(delay)
+                        self.logger.error(f"Serper API rate limit exceeded {max_rate_limit_retries} times for {label}")
+                        return None
+                    self.logger.warning(
+                        f"Serper API rate limited. Pausing {delay}s, concurrency reduced to {self.concurrency.limit} "
+                        f"({rate_limit_count}/{max_rate_limit_retries})"
+                    )
                     continue  # 429はnetwork_attemptsを消費しない
 
                 response.raise_for_status()
                 data = response.json()
-
-                instagram_urls = []
-                for result in data.get('organic', []):
-                    link = result.get('link', '')
-                    if 'instagram.com' in link and len(instagram_urls) < self.max_urls:
-                        instagram_urls.append(link)
-                return instagram_urls
+                self.concurrency.record_success()
+                return data
 
             except SerperAPIError:
                 raise
             except requests.exceptions.RequestException as e:
                 network_attempts += 1
                 last_exception = e
-                self.logger.warning(f"Serper API request failed for '{salon_name}' (attempt {network_attempts}/{self.config['RETRY_COUNT']}): {e}")
+                self.logger.warning(f"Serper API request failed for {label} (attempt {network_attempts}/{self.config['RETRY_COUNT']}): {e}")
                 time.sleep(1)
+            finally:
+                self.concurrency.release()
 
-        self.logger.error(f"Serper API request failed for '{salon_name}' after {self.config['RETRY_COUNT']} attempts: {last_exception}")
-        return []
+        self.logger.error(f"Serper API request failed for {label} after {self.config['RETRY_COUNT']} attempts: {last_exception}")
+        return None
 
-    def _create_instagram_excel(self, df, source_file_name):
-        """Instagram検索結果のExcelファイルを作成する。"""
+    def _search_instagram(self, salon_name, job_id):
+        """
+        1サロンのInstagram URLを検索する。最大max_urls件のURLリストを返す。
+        キャンセルやエラーで検索できなかった場合はNoneを返す（見つからなかった場合の空リストと区別する）。
+        """
+        data = self._post_serper(self._build_query(salon_name), f"'{salon_name}'", job_id)
+        if data is None:
+            return None
+        return self._extract_instagram_urls(data)
+
+    def _search_instagram_batch(self, salon_names, job_id):
+        """
+        複数サロンのInstagram URLを1回のリクエスト（クエリの配列）で検索し、salon_namesと同じ順のリストを返す。
+        バッチ全体、または一部のクエリの結果が得られなかった場合は、そのサロンだけ1件ずつ検索し直す。
+        """
+        if len(salon_names) == 1:
+            return [self._search_instagram(salon_names[0], job_id)]
+
+        data = self._post_serper(
+            [self._build_query(name) for name in salon_names], f'batch of {len(salon_names)} queries', job_id
+        )
+        if isinstance(data, list) and len(data) == len(salon_names):
+            results = [
+                self._extract_instagram_urls(item) if isinstance(item, dict) and 'organic' in item else None
+                for item in data
+            ]
+        else:
+            if data is not None:
+                self.logger.warning(f"Unexpected Serper batch response for {len(salon_names)} queries. Falling back to single queries.")
+            results = [None] * len(salon_names)
+
+        for i, name in enumerate(salon_names):
+            if results[i] is None and not self._is_cancelled(job_id):
+                results[i] = self._search_instagram(name, job_id)
+        return results
+
+    def _save_instagram_result(self, df, source_file_name):
+        """
+        Instagram検索結果を結果のParquetファイルとして保存し、ダウンロード時のファイル名（.xlsx）を返す。
+        xlsxはダウンロード時に作成される。
+        """
         # ソースファイル名からエリア名を推定: 五所川原_20260319_153045.xlsx → 五所川原
         area_match = re.match(r'^(.+?)_\d{8}_\d{6}\.xlsx$', source_file_name)
         area_name = area_match.group(1) if area_match else 'unknown'
@@ -111,24 +181,38 @@ class InstagramSearchService:
 
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         file_name = f"Instagram_{safe_area_name}_{timestamp}.xlsx"
-        output_path = os.path.join(self.config['OUTPUT_DIR'], file_name)
-        os.makedirs(self.config['OUTPUT_DIR'], exist_ok=True)
-
-        df.to_excel(output_path, index=False, sheet_name='Instagram検索結果')
+        write_result(result_path(self.config['OUTPUT_DIR'], file_name), df, 'Instagram検索結果')
         return file_name
 
-    def run_instagram_search(self, target_file_name, job_id):
-        """Instagram検索を実行し、SSEイベントをyieldするジェネレータ。"""
+    def run_instagram_search(self, target_file_name, job_id, scrape_job_id=None):
+        """
+        Instagram検索を実行し、SSEイベントをyieldするジェネレータ。
+        scrape_job_idを指定した場合は、そのスクレイピングジョブのresultイベントから営業対象リストのファイル名を求める
+        （ジョブが残っていなければtarget_file_nameを使う）。
+        入力は結果のParquetファイルを読み込み、なければExcelファイルを読み込む。
+        """
         try:
-            # 入力ファイル読み込み
+            if scrape_job_id:
+                scrape_result = get_job_runner().store.result(scrape_job_id)
+                if scrape_result is not None:
+                    target_file_name = scrape_result['file_name']
+
+            if not target_file_name:
+                yield f'event: error\ndata: {json.dumps({"error": "スクレイピング結果が見つかりません。"})}\n\n'
+                return
+            # 入力ファイル読み込み（結果のParquetファイルがあればExcelファイルより優先する）
+            source_path = result_path(self.config['OUTPUT_DIR'], target_file_name)
             file_path = os.path.join(self.config['OUTPUT_DIR'], target_file_name)
-            if not os.path.exists(file_path):
+            if os.path.exists(source_path):
+                yield f'event: message\ndata: スクレイピング結果を読み込んでいます...\n\n'
+                df, _ = read_result(source_path)
+            elif os.path.exists(file_path):
+                yield f'event: message\ndata: Excelファイルを読み込んでいます...\n\n'
+                df = pd.read_excel(file_path)
+            else:
                 yield f'event: error\ndata: {json.dumps({"error": f"ファイルが見つかりません: {target_file_name}"})}\n\n'
                 return
 
-            yield f'event: message\ndata: Excelファイルを読み込んでいます...\n\n'
-            df = pd.read_excel(file_path)
-
             if 'サロン名' not in df.columns:
                 yield f'event: error\ndata: {json.dumps({"error": "Excelファイルにサロン名カラムが見つかりません。"})}\n\n'
                 return
@@ -146,29 +230,86 @@ class InstagramSearchService:
             # 行インデックス → Instagram URLリストのマッピング（同名サロン対応）
             results_map = {}
             found_count = 0
+            throttle = ProgressThrottle(self.config['PROGRESS_INTERVAL_SECONDS'])
 
-            for i, (row_idx, salon_name) in enumerate(salon_entries, 1):
-                if self._is_cancelled(job_id):
-                    yield f'event: cancelled\ndata: Instagram検索がユーザーによって中断されました。\n\n'
-                    return
-
-                try:
-                    urls = self._search_instagram(salon_name, job_id)
-                except SerperAPIError as e:
-                    yield f'event: error\ndata: {json.dumps({"error": str(e)})}\n\n'
-                    return
-
-                if self._is_cancelled(job_id):
-                    yield f'event: cancelled\ndata: Instagram検索がユーザーによって中断されました。\n\n'
-                    return
-
-                results_map[row_idx] = urls
+            # 有効期間内に検索済みのサロンはキャッシュの結果を使い、Serper APIを呼ばない
+            search_keys = {
+                row_idx: normalize_search_key(salon_name, self.SEARCH_GL, self.SEARCH_HL)
+                for row_idx, salon_name in salon_entries
+            }
+            cached = self.search_cache.load(set(search_keys.values()))
+            # 同名（正規化後に同じ）サロンは1回だけ検索し、結果を該当するすべての行に使う
+            to_search = {}  # search_key -> (検索するサロン名, 行インデックスのリスト)
+            for row_idx, salon_name in salon_entries:
+                urls = cached.get(search_keys[row_idx])
+                if urls is None:
+                    to_search.setdefault(search_keys[row_idx], (salon_name, []))[1].append(row_idx)
+                    continue
+                results_map[row_idx] = urls[:self.max_urls]
                 if urls:
                     found_count += 1
+            rows_to_search = sum(len(rows) for _, rows in to_search.values())
+            cache_hits = total - rows_to_search
+            saved_queries = rows_to_search - len(to_search)
+            searched = cache_hits
+            if cache_hits:
+                yield f'event: message\ndata: {cache_hits}件は保存済みの検索結果を使用します。\n\n'
+            if saved_queries:
+                yield f'event: message\ndata: 同名のサロン{saved_queries}件は検索結果を共有します。\n\n'
+            if cache_hits:
+                yield from throttle.update(
+                    'progress', {'current': searched, 'total': total, 'saved_queries': saved_queries}
+                )
 
-                yield f'event: progress\ndata: {json.dumps({"current": i, "total": total})}\n\n'
-
-            yield f'event: message\ndata: 検索完了。結果をExcelファイルに出力しています...\n\n'
+            new_results = {}
+            try:
+                with ThreadPoolExecutor(max_workers=self.config['INSTAGRAM_MAX_CONCURRENCY']) as executor:
+                    # INSTAGRAM_BATCH_SIZE件ずつ1回のリクエストにまとめて検索する
+                    batch_size = max(1, self.config['INSTAGRAM_BATCH_SIZE'])
+                    unique_keys = list(to_search)
+                    future_to_keys = {}
+                    for start in range(0, len(unique_keys), batch_size):
+                        batch = unique_keys[start:start + batch_size]
+                        future = executor.submit(self._search_instagram_batch, [to_search[key][0] for key in batch], job_id)
+                        future_to_keys[future] = batch
+                    # キャンセル用のFutureも待機対象に含め、検索中のサロンを待たずに中断できるようにする
+                    cancelled = self.cancellation.future(job_id)
+                    remaining = set(future_to_keys)
+                    while remaining:
+                        done, _ = wait([*remaining, cancelled], return_when=FIRST_COMPLETED)
+                        if self._is_cancelled(job_id):
+                            executor.shutdown(wait=False, cancel_futures=True)
+                            yield f'event: cancelled\ndata: Instagram検索がユーザーによって中断されました。\n\n'
+                            return
+
+                        for future in done:
+                            remaining.discard(future)
+                            try:
+                                batch_results = future.result()
+                            except SerperAPIError as e:
+                                executor.shutdown(wait=False, cancel_futures=True)
+                                yield f'event: error\ndata: {json.dumps({"error": str(e)})}\n\n'
+                                return
+
+                            for search_key, urls in zip(future_to_keys[future], batch_results):
+                                # 検索できなかったサロンはキャッシュせず、次回に検索し直す
+                                if urls is not None:
+                                    new_results[search_key] = urls
+                                for row_idx in to_search[search_key][1]:
+                                    results_map[row_idx] = urls or []
+                                    if urls:
+                                        found_count += 1
+                                    searched += 1
+                            yield from throttle.update(
+                                'progress', {'current': searched, 'total': total, 'saved_queries': saved_queries}
+                            )
+            finally:
+                # 中断・エラー時も、検索済みの結果（APIクレジットを消費済み）は保存する
+                self.search_cache.save(new_results)
+
+            yield from throttle.flush()
+
+            yield f'event: message\ndata: 検索完了。結果を保存しています...\n\n'
 
             # Instagram URL カラムを追加（行インデックスベース）
             for col_idx in range(1, self.max_urls + 1):
@@ -187,12 +328,14 @@ class InstagramSearchService:
             other_cols = [c for c in df.columns if c not in priority_cols]
             df = df[priority_cols + other_cols]
 
-            file_name = self._create_instagram_excel(df, target_file_name)
+            file_name = self._save_instagram_result(df, target_file_name)
 
             result_payload = {
                 'file_name': file_name,
                 'total_salons': total,
                 'found_count': found_count,
+                'cache_hits': cache_hits,
+                'saved_queries': saved_queries,
             }
             yield f'event: result\ndata: {json.dumps(result_payload)}\n\n'
 
@@ -0,0 +1,400 @@
+import os
+import time
+import json
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+
+def process_started_at(pid):
+    """
+    プロセスの起動時刻（Linuxの/proc/<pid>/statのstarttime、起動後のクロック数）を返す。
+    再起動後に同じPIDが再利用されても別のプロセスと見分けるために使う。取得できない場合はNoneを返す。
+    """
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # 2番目のフィールド(comm)は空白や括弧を含み得るため、最後の')'以降を分割する
+    fields = stat.rsplit(')', 1)[-1].split()
+    try:
+        return int(fields[19])
+    except (IndexError, ValueError):
+        return None
+
+
+class JobStore:
+    """
+    instance_path下のSQLiteファイルに、ジョブの状態とSSEイベントを保存するクラス。
+    全gunicornワーカーで共有されるため、ジョブを実行していないワーカーからも進捗を配信できる。
+    """
+
+    DB_FILE_NAME = 'jobs.sqlite3'
+
+    def __init__(self, instance_path):
+        self.db_path = os.path.join(instance_path, self.DB_FILE_NAME)
+        conn = self._connect()
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'job_id TEXT PRIMARY KEY, kind TEXT NOT NULL, params TEXT NOT NULL, status TEXT NOT NULL, '
+                'created_at REAL NOT NULL, finished_at REAL, pid INTEGER, pid_started INTEGER)'
+            )
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(jobs)')}
+            for column in ('pid', 'pid_started'):
+                if column not in columns:
+                    conn.execute(f'ALTER TABLE jobs ADD COLUMN {column} INTEGER')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS job_events ('
+                'job_id TEXT NOT NULL, seq INTEGER NOT NULL, data TEXT NOT NULL, PRIMARY KEY (job_id, seq))'
+            )
+            # チェックポイント: 待ち行列などの状態は上書きし、完了したサロン情報は追記する
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS job_checkpoints ('
+                'job_id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS job_checkpoint_records ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT NOT NULL, data TEXT NOT NULL)'
+            )
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS ix_job_checkpoint_records_job_id ON job_checkpoint_records (job_id)'
+            )
+            # 以前のバージョンが結果の写しを保存していたテーブル。結果はParquetファイルから読むため不要
+            conn.execute('DROP TABLE IF EXISTS job_results')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def create(self, job_id, kind, params):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    'INSERT INTO jobs (job_id, kind, params, status, created_at, pid, pid_started) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (job_id, kind, json.dumps(params, ensure_ascii=False), 'queued', time.time(), *self._owner())
+                )
+        finally:
+            conn.close()
+
+    def get(self, job_id):
+        """ジョブの情報を辞書で返す。存在しなければNoneを返す。"""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                'SELECT kind, params, status, created_at, finished_at, pid, pid_started FROM jobs WHERE job_id = ?',
+                (job_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        kind, params, status, created_at, finished_at, pid, pid_started = row
+        return {
+            'job_id': job_id,
+            'kind': kind,
+            'params': json.loads(params),
+            'status': status,
+            'created_at': created_at,
+            'finished_at': finished_at,
+            'pid': pid,
+            'pid_started': pid_started,
+        }
+
+    @staticmethod
+    def _owner():
+        """ジョブを担当するプロセスとして記録する(プロセスID, 起動時刻)。"""
+        pid = os.getpid()
+        return pid, process_started_at(pid)
+
+    def set_status(self, job_id, status):
+        """ジョブの状態を更新する。実行を担当するプロセスとして、現在のプロセスIDと起動時刻も記録する。"""
+        conn = self._connect()
+        try:
+            with conn:
+                finished_at = time.time() if status == 'finished' else None
+                conn.execute(
+                    'UPDATE jobs SET status = ?, finished_at = ?, pid = ?, pid_started = ? WHERE job_id = ?',
+                    (status, finished_at, *self._owner(), job_id)
+                )
+        finally:
+            conn.close()
+
+    def claim(self, job):
+        """
+        getで取得した時点から状態と担当プロセスが変わっていなければ、ジョブを実行待ちに戻して
+        現在のプロセスの担当にする。複数のリクエストが同時に呼び出しても、Trueを返すのは1つだけ。
+        """
+        conn = self._connect()
+        try:
+            with conn:
+                cursor = conn.execute(
+                    'UPDATE jobs SET status = ?, finished_at = NULL, pid = ?, pid_started = ? '
+                    'WHERE job_id = ? AND status = ? AND pid IS ? AND pid_started IS ?',
+                    ('queued', *self._owner(), job['job_id'], job['status'], job['pid'], job['pid_started'])
+                )
+        finally:
+            conn.close()
+        return cursor.rowcount == 1
+
+    def append_event(self, job_id, data):
+        """SSEイベントを追記し、採番したイベントIDを返す。"""
+        conn = self._connect()
+        try:
+            with conn:
+                seq = conn.execute(
+                    'SELECT COALESCE(MAX(seq), 0) + 1 FROM job_events WHERE job_id = ?', (job_id,)
+                ).fetchone()[0]
+                conn.execute('INSERT INTO job_events (job_id, seq, data) VALUES (?, ?, ?)', (job_id, seq, data))
+            return seq
+        finally:
+            conn.close()
+
+    def events_after(self, job_id, seq):
+        """イベントIDがseqより後のイベントを[(seq, data), ...]で返す。"""
+        conn = self._connect()
+        try:
+            return conn.execute(
+                'SELECT seq, data FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq', (job_id, seq)
+            ).fetchall()
+        finally:
+            conn.close()
+
+    def result(self, job_id):
+        """ジョブのresultイベントのデータ（辞書）を返す。resultイベントがなければNoneを返す。"""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT data FROM job_events WHERE job_id = ? AND data LIKE 'event: result%' ORDER BY seq DESC LIMIT 1",
+                (job_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        data = next(line[len('data: '):] for line in row[0].split('\n') if line.startswith('data: '))
+        return json.loads(data)
+
+    def purge(self, older_than):
+        """older_than(UNIX時刻)より前に終了したジョブとそのイベントを削除する。"""
+        conn = self._connect()
+        try:
+            with conn:
+                for table in ('job_events', 'job_checkpoints', 'job_checkpoint_records'):
+                    conn.execute(
+                        f'DELETE FROM {table} WHERE job_id IN '
+                        '(SELECT job_id FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?)', (older_than,)
+                    )
+                conn.execute('DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?', (older_than,))
+        finally:
+            conn.close()
+
+    def save_checkpoint(self, job_id, state, new_records):
+        """チェックポイントの状態を上書きし、前回以降に完了したサロン情報を追記する。"""
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    'INSERT INTO job_checkpoint_records (job_id, data) VALUES (?, ?)',
+                    [(job_id, json.dumps(record, ensure_ascii=False)) for record in new_records]
+                )
+                conn.execute(
+                    'INSERT OR REPLACE INTO job_checkpoints (job_id, state, updated_at) VALUES (?, ?, ?)',
+                    (job_id, json.dumps(state, ensure_ascii=False), time.time())
+                )
+        finally:
+            conn.close()
+
+    def load_checkpoint(self, job_id):
+        """(状態, 完了したサロン情報のリスト)を返す。チェックポイントがなければNoneを返す。"""
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT state FROM job_checkpoints WHERE job_id = ?', (job_id,)).fetchone()
+            if row is None:
+                return None
+            records = conn.execute(
+                'SELECT data FROM job_checkpoint_records WHERE job_id = ? ORDER BY id', (job_id,)
+            ).fetchall()
+        finally:
+            conn.close()
+        return json.loads(row[0]), [json.loads(data) for data, in records]
+
+    def has_checkpoint(self, job_id):
+        conn = self._connect()
+        try:
+            return conn.execute('SELECT 1 FROM job_checkpoints WHERE job_id = ?', (job_id,)).fetchone() is not None
+        finally:
+            conn.close()
+
+    def delete_checkpoint(self, job_id):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('DELETE FROM job_checkpoints WHERE job_id = ?', (job_id,))
+                conn.execute('DELETE FROM job_checkpoint_records WHERE job_id = ?', (job_id,))
+        finally:
+            conn.close()
+
+
+class JobCheckpoint:
+    """
+    1件のジョブのチェックポイント。ScrapingServiceに渡し、実行中の状態を定期的に保存させる。
+    ワーカーの再起動などでジョブが途中で止まっても、保存した時点から再開できる。
+    """
+
+    def __init__(self, store, job_id):
+        self.store = store
+        self.job_id = job_id
+
+    def load(self):
+        return self.store.load_checkpoint(self.job_id)
+
+    def save(self, state, new_records):
+        self.store.save_checkpoint(self.job_id, state, new_records)
+
+    def clear(self):
+        self.store.delete_checkpoint(self.job_id)
+
+
+class JobRunner:
+    """
+    スクレイピング・Instagram検索のジョブを、リクエスト処理とは別のスレッドで実行するクラス。
+    ジョブがyieldしたSSEイベントはJobStoreに保存され、クライアントはLast-Event-IDを指定して
+    切断後も続きから受信できる。ブラウザのタブを閉じてもジョブは最後まで実行される。
+    """
+
+    # 他ワーカーで実行中のジョブのイベントを確認する間隔 (秒)
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, app, max_workers, retention_seconds, heartbeat_seconds=15):
+        self.app = app
+        self.store = JobStore(app.instance_path)
+        self.cancellation = app.extensions['cancellation']
+        self.retention_seconds = retention_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job-runner')
+        self._max_workers = max_workers
+        self._running = 0
+        self._lock = threading.Lock()
+        self._new_event = threading.Condition()
+
+    def submit(self, kind, job_id, run, params=None):
+        """
+        ジョブを登録して実行を予約する。
+        runは、アプリコンテキスト内で呼び出され、SSEイベント文字列をyieldするジェネレータを返す関数。
+        """
+        self.store.purge(time.time() - self.retention_seconds)
+        self.store.create(job_id, kind, params or {})
+        self.publish(job_id, f"event: job_id\ndata: {job_id}\n\n")
+        self._start(job_id, run)
+        return job_id
+
+    def resume(self, job_id, run):
+        """
+        実行中でなく、チェックポイントが残っているジョブを同じjob_idで再度実行する。
+        イベントIDは前回の続きから採番される。runはチェックポイントから処理を再開するジェネレータを返す関数。
+        再開できない場合や、同時に届いた別の再開要求が先に受け付けられた場合はFalseを返す。
+        """
+        job = self.store.get(job_id)
+        if self.is_active(job) or not self.store.has_checkpoint(job_id) or not self.store.claim(job):
+            return False
+        self.publish(job_id, "event: message\ndata: チェックポイントからジョブを再開します。\n\n")
+        self._start(job_id, run)
+        return True
+
+    def _start(self, job_id, run):
+        with self._lock:
+            busy = self._running >= self._max_workers
+        if busy:
+            self.publish(job_id, "event: message\ndata: 実行中のジョブが終わるまで待機しています...\n\n")
+        self._executor.submit(self._run, job_id, run)
+
+    def _run(self, job_id, run):
+        with self._lock:
+            self._running += 1
+        self.store.set_status(job_id, 'running')
+        try:
+            with self.app.app_context():
+                for event in run():
+                    self.publish(job_id, event)
+        except Exception as e:
+            self.app.logger.error(f"Job {job_id} failed: {e}", exc_info=True)
+            self.publish(job_id, f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n")
+        finally:
+            # ジョブ完了後、キャンセル要求を破棄
+            self.cancellation.release(job_id)
+            with self._lock:
+                self._running -= 1
+            self.store.set_status(job_id, 'finished')
+            self._notify()
+
+    def publish(self, job_id, event):
+        self.store.append_event(job_id, event)
+        self._notify()
+
+    def _notify(self):
+        with self._new_event:
+            self._new_event.notify_all()
+
+    @staticmethod
+    def is_active(job):
+        """
+        ジョブが実行中（または実行待ち）かどうかを返す。
+        担当プロセスが再起動などで終了している場合は、状態が実行中のままでもFalseを返す。
+        再起動後に同じPIDが別のプロセスに割り当てられた場合も、起動時刻の違いで終了済みと判定する。
+        """
+        if job is None or job['status'] == 'finished':
+            return False
+        pid = job['pid']
+        if pid is None:
+            return True
+        if pid != os.getpid():
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                return False
+            except PermissionError:
+                pass
+        return job['pid_started'] is None or job['pid_started'] == process_started_at(pid)
+
+    def stream(self, job_id, last_event_id=0):
+        """
+        last_event_idより後のイベントを、ジョブが終了するまで順に配信するジェネレータ。
+        各イベントにはid行を付けるため、EventSourceの再接続時にLast-Event-IDとして送り返される。
+        担当プロセスが途中で終了していた場合は、interruptedイベントを送って配信を終える。
+        イベントがheartbeat_seconds秒以上途切れた場合は、プロキシに接続を切られないようコメント行を送る。
+        """
+        last_sent = time.monotonic()
+        while True:
+            # イベントを読む前に状態を確認し、終了後に追加されたイベントを取りこぼさないようにする
+            job = self.store.get(job_id)
+            events = self.store.events_after(job_id, last_event_id)
+            for seq, data in events:
+                last_event_id = seq
+                last_sent = time.monotonic()
+                yield f"id: {seq}\n{data}"
+            if job is None or job['status'] == 'finished':
+                return
+            if not self.is_active(job):
+                payload = {'job_id': job_id, 'resumable': self.store.has_checkpoint(job_id)}
+                yield f"event: interrupted\ndata: {json.dumps(payload)}\n\n"
+                return
+            if not events:
+                if self.heartbeat_seconds and time.monotonic() - last_sent >= self.heartbeat_seconds:
+                    last_sent = time.monotonic()
+                    yield ": heartbeat\n\n"
+                with self._new_event:
+                    self._new_event.wait(self.POLL_INTERVAL)
+
+
+def get_job_runner():
+    """現在のアプリケーションのJobRunnerを返す。"""
+    return current_app.extensions['job_runner']
@@ -0,0 +1,48 @@
+import json
+import time
+
+
+class ProgressThrottle:
+    """
+    進捗イベント（progress, url_progressなど）を時間窓ごとにまとめるクラス。
+    イベント種別ごとに最新の値だけを保持し、前回の送信からinterval秒以上経った場合のみ送信する。
+    送信する進捗には、処理速度(rate, 件/秒)と残り時間の見込み(eta_seconds)を付ける。
+
+    update()/flush()は送信するSSEイベント文字列のリスト（送信しない場合は空）を返すため、
+    ジェネレータからはyield fromでそのまま送信できる。
+    """
+
+    def __init__(self, interval, clock=time.monotonic):
+        self.interval = interval
+        self._clock = clock
+        self._started_at = clock()
+        self._baseline = {}
+        self._last_sent = {}
+        self._pending = {}
+
+    def update(self, event_type, progress):
+        """最新の進捗を記録し、送信間隔を過ぎていればイベントを返す。progressはcurrentとtotalを含む辞書。"""
+        self._baseline.setdefault(event_type, progress['current'])
+        self._pending[event_type] = progress
+        now = self._clock()
+        last_sent = self._last_sent.get(event_type)
+        if last_sent is not None and now - last_sent < self.interval:
+            return []
+        return [self._emit(event_type, now)]
+
+    def flush(self):
+        """まだ送信していない最新の進捗をすべて返す。処理の終了時に呼び出す。"""
+        now = self._clock()
+        return [self._emit(event_type, now) for event_type in list(self._pending)]
+
+    def _emit(self, event_type, now):
+        progress = dict(self._pending.pop(event_type))
+        elapsed = now - self._started_at
+        # 再開したジョブでは、開始時点で完了済みだった件数を速度の計算に含めない
+        done = progress['current'] - self._baseline[event_type]
+        rate = done / elapsed if elapsed > 0 else 0.0
+        remaining = progress['total'] - progress['current']
+        progress['rate'] = round(rate, 2)
+        progress['eta_seconds'] = round(remaining / rate, 1) if rate > 0 and remaining >= 0 else None
+        self._last_sent[event_type] = now
+        return f"event: {event_type}\ndata: {json.dumps(progress)}\n\n"
@@ -0,0 +1,67 @@
+import os
+import time
+import sqlite3
+
+
+class TokenBucketRateLimiter:
+    """
+    instance_path下のSQLiteファイルに状態を保持するトークンバケット。
+    同一ホスト上の全ジョブ・全gunicornワーカーが、接続先ホストごとに1つの予算を共有する。
+
+    reserve()はトークンを1つ予約し、送信してよい時刻までの待ち時間(秒)を返す。
+    予算に余裕があれば待ち時間は0になり、呼び出し側は一切待機しない。
+    """
+
+    DB_FILE_NAME = 'rate_limiter.sqlite3'
+
+    def __init__(self, instance_path, rate, burst):
+        self.db_path = os.path.join(instance_path, self.DB_FILE_NAME)
+        self.rate = float(rate)
+        self.burst = max(float(burst), 1.0)
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS buckets ('
+                    'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)'
+                )
+        finally:
+            conn.close()
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def _connect(self):
+        # プロセス間で同時に更新されるため、ロック待ちのタイムアウトを長めに取る
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def reserve(self, key):
+        """keyのバケットからトークンを1つ予約し、待つべき秒数を返す。"""
+        if not self.enabled:
+            return 0.0
+
+        conn = self._connect()
+        try:
+            conn.isolation_level = None
+            # BEGIN IMMEDIATEで書き込みロックを取り、読み取り→更新を他プロセスと直列化する
+            conn.execute('BEGIN IMMEDIATE')
+            now = time.time()
+            row = conn.execute('SELECT tokens, updated_at FROM buckets WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                tokens = self.burst
+            else:
+                tokens, updated_at = row
+                tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+
+            # トークンが不足していても予約は行い、負の残高を待ち時間に換算する
+            tokens -= 1.0
+            conn.execute(
+                'INSERT OR REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)',
+                (key, tokens, now)
+            )
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+
+        return max(0.0, -tokens / self.rate)
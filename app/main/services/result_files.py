@@ -0,0 +1,136 @@
+import os
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# ジョブの結果はParquetファイルとしてOUTPUT_DIRに保存し、xlsx・CSV・JSONはダウンロード時に作成する。
+# ファイル名はダウンロード時の名前（例: エリア_20260319_153045.xlsx）の拡張子を.parquetにしたもの。
+RESULT_EXTENSION = '.parquet'
+
+# 文字列以外で保存するカラム
+COLUMN_TYPES = {'関連リンク数': pa.int64()}
+
+# Excelのシート名はParquetのスキーマのメタデータに保存する
+_SHEET_NAME_KEY = b'sheet_name'
+
+
+def result_path(output_dir, file_name):
+    """ダウンロード時のファイル名に対応する、結果のParquetファイルのパスを返す。"""
+    return os.path.join(output_dir, os.path.splitext(file_name)[0] + RESULT_EXTENSION)
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and pd.isna(value))
+
+
+def _column_array(values, arrow_type):
+    if pa.types.is_integer(arrow_type):
+        return pa.array([None if _is_missing(v) else int(v) for v in values], type=arrow_type)
+    return pa.array([None if _is_missing(v) else str(v) for v in values], type=arrow_type)
+
+
+def _with_sheet_name(schema, sheet_name):
+    return schema.with_metadata({**(schema.metadata or {}), _SHEET_NAME_KEY: sheet_name.encode('utf-8')})
+
+
+class ColumnarWriter:
+    """
+    1つの表をParquetファイルに行を逐次書き込むクラス。
+    batch_rows行ごとに1つの行グループとして書き出し、書き込んだ行はメモリに保持しない。
+    """
+
+    def __init__(self, path, sheet_name, columns, batch_rows=1000):
+        self.path = path
+        self.columns = columns
+        self.batch_rows = batch_rows
+        self.rows = 0
+        self._buffer = []
+        self._schema = _with_sheet_name(
+            pa.schema([pa.field(column, COLUMN_TYPES.get(column, pa.string())) for column in columns]), sheet_name
+        )
+        self._writer = None
+
+    def append(self, record):
+        """recordからcolumnsの順に値を取り出して1行書き込む。存在しないカラムは空にする。"""
+        self._buffer.append([record.get(column) for column in self.columns])
+        self.rows += 1
+        if len(self._buffer) >= self.batch_rows:
+            self._write_buffer()
+
+    def _write_buffer(self):
+        if self._writer is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._writer = pq.ParquetWriter(self.path, self._schema)
+        arrays = [
+            _column_array([row[i] for row in self._buffer], field.type) for i, field in enumerate(self._schema)
+        ]
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self._schema))
+        self._buffer = []
+
+    def close(self):
+        """ファイルを保存する。0行の場合もカラムだけのファイルを作成する。"""
+        if self._buffer or self._writer is None:
+            self._write_buffer()
+        self._writer.close()
+
+    def discard(self):
+        """書き込みを破棄する（ファイルを残さない）。"""
+        if self._writer is not None:
+            self._writer.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def write_result(path, df, sheet_name):
+    """DataFrameを結果のParquetファイルとして保存する。"""
+    df = df.copy()
+    # 型の混在した列（Excelから読んだ数値と文字列など）はParquetに保存できないため、文字列にそろえる
+    for column in df.columns[df.dtypes == object]:
+        df[column] = df[column].map(lambda v: None if _is_missing(v) else str(v))
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    pq.write_table(table.replace_schema_metadata(_with_sheet_name(table.schema, sheet_name).metadata), path)
+
+
+def read_result(path):
+    """結果のParquetファイルを読み込み、(DataFrame, Excelのシート名)を返す。"""
+    table = pq.read_table(path)
+    sheet_name = (table.schema.metadata or {}).get(_SHEET_NAME_KEY, b'Sheet1').decode('utf-8')
+    return table.to_pandas(), sheet_name
+
+
+_RENDERERS = {
+    '.xlsx': lambda df, sheet_name, path: df.to_excel(path, index=False, sheet_name=sheet_name),
+    # Excelで開いても文字化けしないようBOM付きで出力する
+    '.csv': lambda df, sheet_name, path: df.to_csv(path, index=False, encoding='utf-8-sig'),
+    '.json': lambda df, sheet_name, path: df.to_json(path, orient='records', force_ascii=False),
+}
+
+
+def render_download(output_dir, file_name):
+    """
+    ダウンロードするファイルのパスを返す。
+    まだ作成されていなければ、同名の結果のParquetファイルから拡張子（.xlsx/.csv/.json）の形式で作成し、
+    次回以降のダウンロードのためにOUTPUT_DIRに保存する。作成できない場合はNoneを返す。
+    """
+    path = os.path.join(output_dir, file_name)
+    if os.path.exists(path):
+        return path
+    stem, extension = os.path.splitext(path)
+    render = _RENDERERS.get(extension.lower())
+    source = stem + RESULT_EXTENSION
+    if render is None or not os.path.exists(source):
+        return None
+
+    df, sheet_name = read_result(source)
+    # 同時に複数のワーカーが作成しても壊れたファイルを配信しないよう、一時ファイルに書いてから置き換える
+    tmp_path = f'{stem}.{uuid.uuid4().hex}.tmp{extension}'
+    try:
+        render(df, sheet_name, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
@@ -0,0 +1,125 @@
+import re
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit, urlunsplit
+
+from sqlalchemy import select, delete
+
+from ...db import get_db, salons_table
+
+# サロンURLに含まれるHPBのサロンID
+SALON_ID_PATTERN = re.compile(r'(slnH\d+)')
+
+# サロン情報のキー（Excelのカラム名）とsalonsテーブルのカラムの対応
+RECORD_COLUMNS = {
+    'サロン名': 'name',
+    '電話番号': 'phone',
+    '住所': 'address',
+    'スタッフ数': 'staff_count',
+    '関連リンク': 'related_links',
+    '関連リンク数': 'related_links_count',
+    'サロンURL': 'url',
+    'has_special_feature': 'has_special_feature',
+}
+
+
+def extract_salon_id(url):
+    """サロンURLからHPBのサロンID (slnH...) を取り出す。見つからなければNoneを返す。"""
+    match = SALON_ID_PATTERN.search(url or '')
+    return match.group(1) if match else None
+
+
+def salon_key(url):
+    """同じサロンのURLをまとめるためのキー（サロンID、取り出せなければURLそのもの）を返す。"""
+    return extract_salon_id(url) or url
+
+
+def canonical_salon_url(url):
+    """
+    サロンURLを、サロンIDだけを含む正規のURL（例: https://beauty.hotpepper.jp/slnH000123456/）にする。
+    クエリ文字列・フラグメントやサロン内のサブページのパスは取り除く。
+    エステ・リラクのURL（/kr/slnH.../）は除外ルールで判定できるよう/kr/を残す。
+    同じサロンの/kr/あり・なしのURLのどちらを使うかはpreferred_salon_urlで決める。
+    パスにサロンIDを含まないURLはそのまま返す。
+    """
+    parts = urlsplit(url)
+    salon_id = extract_salon_id(parts.path)
+    if salon_id is None:
+        return url
+    prefix = '/kr' if parts.path.startswith('/kr/') else ''
+    return urlunsplit((parts.scheme, parts.netloc, f'{prefix}/{salon_id}/', '', ''))
+
+
+def preferred_salon_url(url, other):
+    """
+    同じサロンの2つのURLのうち、出力に使う方を返す（どちらかがNoneなら他方を返す）。
+    エステ・リラクのURL（/kr/）を優先し、それ以外は文字列の小さい方を選ぶ。
+    一覧に現れた順によらず同じURLになるため、エステ・リラクの除外判定が実行ごとに変わらない。
+    """
+    if url is None:
+        return other
+    if other is None:
+        return url
+    return min(url, other, key=lambda u: (not urlsplit(u).path.startswith('/kr/'), u))
+
+
+def add_salon_url(urls, url):
+    """サロンのキー（salon_key）ごとのURLの辞書にurlを加える。同じサロンのURLがあればpreferred_salon_urlで選ぶ。"""
+    key = salon_key(url)
+    urls[key] = preferred_salon_url(urls.get(key), url)
+
+
+class SalonStore:
+    """
+    salonsテーブルへの読み書きを行うクラス。
+    ジェネレータ（リクエストのアプリコンテキスト）のスレッドからのみ使用する。
+    """
+
+    # IN句に渡すパラメータ数の上限 (SQLiteの制限を考慮)
+    CHUNK_SIZE = 500
+
+    def __init__(self, freshness_days):
+        self.freshness = timedelta(days=freshness_days)
+
+    def load_fresh(self, salon_ids):
+        """
+        指定したサロンIDのうち、最終取得から鮮度期間内のものをサロン情報の辞書で返す。
+        戻り値は {salon_id: record}。除外判定用の特徴量が保存されていないサロンは再取得させる。
+        """
+        if not salon_ids:
+            return {}
+        threshold = datetime.now() - self.freshness
+        rows = get_db().execute(
+            select(salons_table).where(
+                salons_table.c.salon_id.in_(list(salon_ids)),
+                salons_table.c.last_scraped_at >= threshold,
+                salons_table.c.has_special_feature.isnot(None),
+            )
+        ).mappings().all()
+        return {
+            row['salon_id']: {key: row[column] for key, column in RECORD_COLUMNS.items()}
+            for row in rows
+        }
+
+    def save(self, records):
+        """サロン情報をサロンIDごとに上書き保存する。IDを特定できないレコードは保存しない。"""
+        now = datetime.now()
+        rows = {}
+        for record in records:
+            salon_id = extract_salon_id(record.get('サロンURL'))
+            if salon_id is None:
+                continue
+            row = {column: record.get(key) for key, column in RECORD_COLUMNS.items()}
+            row.update({'salon_id': salon_id, 'last_scraped_at': now})
+            rows[salon_id] = row
+        if not rows:
+            return 0
+
+        db = get_db()
+        salon_ids = list(rows)
+        for start in range(0, len(salon_ids), self.CHUNK_SIZE):
+            chunk = salon_ids[start:start + self.CHUNK_SIZE]
+            # DBごとのUPSERT構文の違いを避けるため、削除してから挿入する
+            db.execute(delete(salons_table).where(salons_table.c.salon_id.in_(chunk)))
+            db.execute(salons_table.insert(), [rows[salon_id] for salon_id in chunk])
+        db.commit()
+        return len(rows)
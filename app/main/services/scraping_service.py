@@ -1,95 +1,278 @@
-import os
 import time
 import json
-import sqlite3
 import re
-from datetime import datetime
+import asyncio
 from urllib.parse import urlsplit, urlunsplit, urlencode, parse_qsl
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
-import pandas as pd
+import aiohttp
 import requests
-from bs4 import BeautifulSoup
 from flask import current_app
 from sqlalchemy import text
 
 from ...db import get_db
+from .async_fetcher import AsyncFetchExecutor
+from .rate_limiter import TokenBucketRateLimiter
+from .cancellation import get_cancellation_registry
+from .single_flight import get_single_flight
+from .http_cache import HttpCache
+from .salon_store import SalonStore, extract_salon_id, salon_key, canonical_salon_url, add_salon_url
+from .extraction_plan import get_extraction_plan
+from .exclusion_rules import ExclusionRules
+from .excel_writer import SalonListWriter
+from .progress import ProgressThrottle
+from .concurrency import LatencyAwareConcurrency
 
 class ScrapingService:
     ITEMS_PER_PAGE = 20  # 1ページあたりのサロン表示数
+    # ワークキューの投入優先順（電話番号ページを先に処理し、取りかかったサロンから完了させる）
+    TASK_PRIORITY = ('phone', 'list', 'detail')
+    # 同時取得数を即座に減らすHTTPステータス（スロットリング・過負荷）
+    THROTTLE_STATUSES = (429, 503)
+    # 複数エリアのジョブで、サロンが見つかったエリア名を出力するカラム
+    AREA_COLUMN = 'エリア'
+    # 複数フリーワードのジョブで、サロンが見つかったフリーワードを出力するカラム
+    KEYWORD_COLUMN = 'キーワード'
+    USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36'
 
     def __init__(self):
         # 設定値の読み込み
         self.config = current_app.config
-        self.selectors = self._load_selectors()
         self.session = requests.Session()
         
         # User-Agentを設定
         self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36'
+            'User-Agent': self.USER_AGENT
         })
         
         self.instance_path = current_app.instance_path
         self.logger = current_app.logger
+        # キャンセル要求（待機中でも即座に中断できるよう、sleepの代わりにwait()を使う）
+        self.cancellation = get_cancellation_registry()
+        # selectors.jsonから構築した抽出プラン（プロセス内で共有し、ファイル更新時のみ再構築）
+        # HTMLパーサーバックエンドは'lxml'または'html.parser'
+        self.plan = get_extraction_plan(
+            self.config['SELECTORS_FILE'], self.config.get('HTML_PARSER', 'lxml'), self.logger
+        )
+        # 'thread' (ThreadPoolExecutor + requests) または 'async' (asyncio + aiohttp)
+        self.fetch_engine = self.config.get('FETCH_ENGINE', 'thread')
+        self._async_executor = None
+        self.fetch_stats = {}
+        # 一覧・詳細・電話番号ページの同時取得数。応答時間とエラー率に応じてAIMD方式で自動調整する
+        self.concurrency = LatencyAwareConcurrency(
+            self.config['FETCH_INITIAL_CONCURRENCY'],
+            target_p95_seconds=self.config['FETCH_TARGET_P95_SECONDS'],
+            max_error_rate=self.config['FETCH_MAX_ERROR_RATE'],
+            window=self.config['FETCH_CONCURRENCY_WINDOW'],
+            minimum=self.config['FETCH_MIN_CONCURRENCY'],
+            maximum=self._executor_capacity(),
+        )
+        if self.concurrency.minimum < self.concurrency.maximum <= self.concurrency.limit:
+            self.logger.warning(
+                f"FETCH_INITIAL_CONCURRENCY ({self.config['FETCH_INITIAL_CONCURRENCY']}) is not below the upper bound "
+                f"({self.concurrency.maximum}); fetch concurrency can only decrease."
+            )
+        # 取得後のDataFrameに適用する除外ルール
+        self.exclusion_rules = ExclusionRules(
+            self.config['EXCLUSION_RULES'], self.config['EXCLUSION_RELATED_LINKS_THRESHOLD']
+        )
+        # サロン情報の永続化（差分取得で鮮度期間内のサロンを再取得しないために使う）
+        self.salon_store = SalonStore(self.config['SALON_FRESHNESS_DAYS'])
+        self.served_from_store = 0
+        # 全ワーカーで共有するHTTPレスポンスキャッシュ
+        self.http_cache = None
+        if self.config.get('HTTP_CACHE_ENABLED'):
+            self.http_cache = HttpCache(
+                self.instance_path,
+                {
+                    'list': self.config['HTTP_CACHE_TTL_LIST'],
+                    'detail': self.config['HTTP_CACHE_TTL_DETAIL'],
+                    'phone': self.config['HTTP_CACHE_TTL_PHONE'],
+                },
+                self.config['HTTP_CACHE_MAX_BYTES'],
+            )
+        # 同じURLへの同時リクエストをまとめる（プロセス内の全ジョブで共有）
+        self.single_flight = get_single_flight()
+        # 総ページ数を調べるときに解析した一覧の1ページ目のサロンURL（一覧ページURL→サロンURLの集合）。
+        # 一覧ページのタスクはここにあるページを取得し直さずに使う
+        self._harvested_pages = {}
+        # 全ジョブ・全ワーカーで共有する接続先ホストごとの送信レート制限
+        self.rate_limiter = TokenBucketRateLimiter(
+            self.instance_path,
+            self.config['RATE_LIMIT_PER_SECOND'],
+            self.config['RATE_LIMIT_BURST'],
+        )
         
     def _is_cancelled(self, job_id):
+        """ジョブがキャンセルされたかどうかを返す（プロセス内のEventを参照するだけで、I/Oは発生しない）。"""
+        return self.cancellation.is_cancelled(job_id)
+
+    def _parse_html(self, response):
         """
-        ジョブがキャンセルされたかどうかをチェックする。
-        シグナルファイルが存在し、かつタイムスタンプが古くない場合にTrueを返す。
+        レスポンスの本文(バイト列)を、HTTPヘッダーで判明している文字コードで解析する。
+        response.textを使わないため、requestsによる文字コードの自動判定は行われない。
         """
-        cancel_file = os.path.join(self.instance_path, f"{job_id}.cancel")
-        if not os.path.exists(cancel_file):
-            return False
+        return self.plan.parse(response.content, response.encoding)
 
-        try:
-            with open(cancel_file, 'r') as f:
-                timestamp_str = f.read().strip()
-            
-            if not timestamp_str:
-                self.logger.warning(f"Cancel file for job {job_id} is empty.")
-                return False # or True, depending on desired behavior for empty file
-
-            timestamp = float(timestamp_str)
-            age = time.time() - timestamp
-
-            if age > self.config['CANCEL_FILE_TIMEOUT_SECONDS']:
-                self.logger.warning(f"Stale cancel file found for job {job_id} ({age:.0f}s old). Ignoring.")
-                return False
-            
-            return True # ファイルが存在し、かつタイムスタンプが有効期間内
-        except (ValueError, IOError) as e:
-            self.logger.error(f"Error reading cancel file for job {job_id}: {e}")
-            return False # ファイルが読めない場合はキャンセルとしない
-
-    def _load_selectors(self):
-        """selectors.jsonを読み込む"""
-        with open('selectors.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
-
-    def _make_request(self, url, job_id):
+    def _make_request(self, url, job_id, page_type='list'):
+        """
+        URLを取得する。同じURLを他のワーカーやジョブが取得中の場合は、リクエストを送らずにその結果を使う。
+        結果を待つ間にジョブがキャンセルされた場合はNoneを返す。
+        先に取得していた側が中断・失敗した場合は、このジョブで取得し直す。
+        """
+        response, shared = self.single_flight.do(
+            url, lambda: self._fetch(url, job_id, page_type),
+            wait=lambda future: wait([future, self.cancellation.future(job_id)], return_when=FIRST_COMPLETED),
+        )
+        if shared and response is None and not self._is_cancelled(job_id):
+            response = self._fetch(url, job_id, page_type)
+        return response
+
+    def _fetch(self, url, job_id, page_type='list'):
         """
         信頼性を高めたHTTP GETリクエストを送信する。
-        リクエストの成功・失敗にかかわらず、毎回指定秒数待機する。
+        HTTPキャッシュがTTL内ならネットワークに出ず、TTL切れなら条件付きリクエストで再検証する。
+        送信前にホスト共有のトークンバケットから送信枠を取得し、予算に余裕があれば待機しない。
+        失敗した場合のみ、リトライ前にREQUEST_WAIT_SECONDS秒待機する。
+        待機中にジョブがキャンセルされた場合は、待機を打ち切ってNoneを返す。
         """
+        cached_response, cache_entry = self._lookup_cache(url, page_type)
+        if cached_response is not None:
+            return cached_response
+
         for attempt in range(self.config['RETRY_COUNT']):
             if self._is_cancelled(job_id):
                 self.logger.info(f"Request cancelled for {url} before attempt {attempt + 1}")
                 return None
 
+            started_at = None
             try:
-                response = self.session.get(url, timeout=10)
+                wait_seconds = self.rate_limiter.reserve(urlsplit(url).netloc)
+                if wait_seconds > 0 and self.cancellation.wait(job_id, wait_seconds):
+                    return None
+                started_at = time.monotonic()
+                response = self.session.get(url, timeout=10, headers=self._conditional_headers(cache_entry))
+                if response.status_code == 304 and cache_entry:
+                    self.concurrency.record(time.monotonic() - started_at)
+                    return self.http_cache.hit(url, cache_entry, revalidated=True)
                 response.raise_for_status()
-                # 成功した場合、待機してからレスポンスを返す
-                time.sleep(self.config['REQUEST_WAIT_SECONDS'])
+                self.concurrency.record(time.monotonic() - started_at)
+                if self.http_cache:
+                    self.http_cache.store(url, page_type, response, time.monotonic() - started_at)
                 return response
             except requests.exceptions.RequestException as e:
+                self._record_failure(e.response.status_code if e.response is not None else None, started_at)
                 self.logger.warning(f"Request failed for {url} (attempt {attempt + 1}/{self.config['RETRY_COUNT']}): {e}")
-                # 失敗した場合も、リトライする前に待機する
-                time.sleep(self.config['REQUEST_WAIT_SECONDS'])
+                # 失敗した場合は、リトライする前に待機する
+                if self.cancellation.wait(job_id, self.config['REQUEST_WAIT_SECONDS']):
+                    return None
         
         self.logger.error(f"Request failed for {url} after {self.config['RETRY_COUNT']} attempts.")
         return None
 
+    async def _make_request_async(self, url, job_id, page_type='list'):
+        """_make_requestのasyncエンジン版。同じURLの取得はthreadエンジンのジョブとも1回にまとめる。"""
+        response, shared = await self.single_flight.do_async(
+            url, lambda: self._fetch_async(url, job_id, page_type)
+        )
+        if shared and response is None and not self._is_cancelled(job_id):
+            response = await self._fetch_async(url, job_id, page_type)
+        return response
+
+    async def _fetch_async(self, url, job_id, page_type='list'):
+        """
+        _fetchのasyncエンジン版。待機はasyncio.sleepで行うため、待機中にスレッドを占有しない。
+        SQLiteを使うレート制限・HTTPキャッシュの処理は、ロック待ちで全コルーチンが止まらないよう
+        asyncio.to_threadでイベントループ外のスレッドで実行する。
+        """
+        cached_response, cache_entry = await asyncio.to_thread(self._lookup_cache, url, page_type)
+        if cached_response is not None:
+            return cached_response
+
+        for attempt in range(self.config['RETRY_COUNT']):
+            if self._is_cancelled(job_id):
+                self.logger.info(f"Request cancelled for {url} before attempt {attempt + 1}")
+                return None
+
+            started_at = None
+            try:
+                wait_seconds = await asyncio.to_thread(self.rate_limiter.reserve, urlsplit(url).netloc)
+                if wait_seconds > 0:
+                    await asyncio.sleep(wait_seconds)
+                started_at = time.monotonic()
+                response = await self._async_executor.get(url, headers=self._conditional_headers(cache_entry))
+                self.concurrency.record(time.monotonic() - started_at)
+                if response.status_code == 304 and cache_entry:
+                    return await asyncio.to_thread(self.http_cache.hit, url, cache_entry, revalidated=True)
+                if self.http_cache:
+                    await asyncio.to_thread(
+                        self.http_cache.store, url, page_type, response, time.monotonic() - started_at
+                    )
+                return response
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self._record_failure(e.status if isinstance(e, aiohttp.ClientResponseError) else None, started_at)
+                self.logger.warning(f"Request failed for {url} (attempt {attempt + 1}/{self.config['RETRY_COUNT']}): {e}")
+                await asyncio.sleep(self.config['REQUEST_WAIT_SECONDS'])
+
+        self.logger.error(f"Request failed for {url} after {self.config['RETRY_COUNT']} attempts.")
+        return None
+
+    def _record_failure(self, status_code, started_at):
+        """失敗したリクエストを同時取得数の調整に反映する。429/503は即座に同時取得数を半分にする。"""
+        if status_code in self.THROTTLE_STATUSES:
+            self.concurrency.record_throttled()
+        elif started_at is not None:
+            self.concurrency.record(time.monotonic() - started_at, error=True)
+
+    def _lookup_cache(self, url, page_type):
+        """
+        HTTPキャッシュを参照し、(TTL内のレスポンス, 再検証用のエントリ)を返す。
+        TTL内ならレスポンスを、TTL切れならNoneとエントリを返す。
+        """
+        if not self.http_cache:
+            return None, None
+        entry = self.http_cache.lookup(url)
+        if entry is None:
+            return None, None
+        if self.http_cache.is_fresh(entry, page_type):
+            return self.http_cache.hit(url, entry), entry
+        return None, entry
+
+    def _conditional_headers(self, cache_entry):
+        if not cache_entry:
+            return None
+        return self.http_cache.conditional_headers(cache_entry) or None
+
+    def _create_executor(self):
+        """
+        FETCH_ENGINEに応じたExecutorを作成する。
+        asyncエンジンでは1つのイベントループ上で最大ASYNC_MAX_IN_FLIGHT件のリクエストを同時に処理する。
+        """
+        if self.fetch_engine == 'async':
+            self._async_executor = AsyncFetchExecutor(
+                self.config['ASYNC_MAX_IN_FLIGHT'],
+                headers={'User-Agent': self.USER_AGENT},
+            )
+            return self._async_executor
+        return ThreadPoolExecutor(max_workers=self.config['MAX_WORKERS'])
+
+    def _task(self, kind):
+        """FETCH_ENGINEに応じて、Executorに投入するタスク関数を返す。"""
+        if self.fetch_engine == 'async':
+            return {
+                'search': self._get_total_pages_async,
+                'list': self._get_salon_urls_from_page_async,
+                'detail': self._scrape_salon_details_async,
+                'phone': self._scrape_phone_number_async,
+            }[kind]
+        return {
+            'search': self._get_total_pages,
+            'list': self._get_salon_urls_from_page,
+            'detail': self._scrape_salon_details,
+            'phone': self._scrape_phone_number,
+        }[kind]
+
     def _build_freeword_url(self, base_url, freeword):
         """エリアURLにfreewordクエリを付与する。freewordがNone/空ならbase_urlをそのまま返す（後方互換）。"""
         if not freeword:
@@ -99,110 +282,181 @@ class ScrapingService:
         query['freeword'] = freeword  # urlencodeが日本語を%XXエンコードする
         return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), parts.fragment))
 
-    def run_scraping(self, area_id, job_id, freeword=None):
+    def run_scraping(self, area_id, job_id, freeword=None, incremental=False, checkpoint=None, prefecture=None):
         """
         スクレイピング処理全体を統括し、進捗をyieldするジェネレータ。
+        area_idにはエリアIDを1つ、またはリストで複数指定できる。prefectureを指定すると、
+        その都道府県のすべてのエリアも対象にする。freewordも1つの文字列またはリストで複数指定でき、
+        エリアとフリーワードの組み合わせごとに一覧ページを取得する。
+        すべての一覧は1つのワークキュー（共通のワーカー予算とサロンURLの重複排除）で処理し、
+        各サロンを一度だけ取得して1つのリストにまとめる。複数エリアの場合は「エリア」カラム、
+        複数フリーワードの場合は「キーワード」カラムに、そのサロンが見つかった一覧を出力する。
+        incremental=Trueの場合、salonsテーブルに鮮度期間内のデータがあるサロンは
+        詳細・電話番号ページを取得せず、保存済みのデータを使用する。
+        checkpoint（JobCheckpoint）を渡すと実行中の状態を定期的に保存し、
+        保存済みのチェックポイントがあればその続きから再開する。
         """
         try:
-            area_info = self._get_area_info(area_id)
-            # フリーワードを正規化（前後空白除去、空文字はNone扱い）
-            freeword = (freeword or '').strip() or None
+            areas = self._get_areas(area_id, prefecture)
+            label = self._areas_label(areas, prefecture)
+            freewords = self._normalize_freewords(freeword)
+            # ファイル名に使うフリーワード（未指定ならNone）
+            freeword_label = '・'.join(freewords) or None
+            extra_columns = []
+            if len(areas) > 1:
+                extra_columns.append(self.AREA_COLUMN)
+            if len(freewords) > 1:
+                extra_columns.append(self.KEYWORD_COLUMN)
 
             if self._is_cancelled(job_id):
                 yield f"event: cancelled\ndata: 処理がユーザーによって中断されました。\n\n"
                 return
-            if freeword:
-                yield f"event: message\ndata: 「{area_info['name']}」を『{freeword}』で絞り込んでスクレイピングを開始します。\n\n"
-            else:
-                yield f"event: message\ndata: 「{area_info['name']}」のスクレイピングを開始します。\n\n"
-
-            # エリアURLにfreewordクエリを合成（freeword=Noneなら元のURLのまま＝後方互換）
-            start_url = self._build_freeword_url(area_info['url'], freeword)
 
-            total_pages, final_area_url = self._get_total_pages(start_url, job_id, freeword)
-            if self._is_cancelled(job_id) or total_pages is None:
-                yield f"event: cancelled\ndata: 処理がユーザーによって中断されました。\n\n"
+            saved = checkpoint.load() if checkpoint else None
+            if saved:
+                yield from self._resume_scraping(
+                    label, extra_columns, job_id, freeword_label, incremental, checkpoint, *saved
+                )
                 return
 
-            yield f"event: message\ndata: 総ページ数を特定しました: {total_pages}ページ。一覧からURLを収集中...\n\n"
+            target = f"「{label}」の{len(areas)}エリア" if len(areas) > 1 else f"「{label}」"
+            if freewords:
+                keywords = '』『'.join(freewords)
+                yield f"event: message\ndata: {target}を『{keywords}』で絞り込んでスクレイピングを開始します。\n\n"
+            else:
+                yield f"event: message\ndata: {target}のスクレイピングを開始します。\n\n"
 
-            salon_urls = yield from self._get_all_salon_urls(final_area_url, total_pages, job_id, freeword)
-            if self._is_cancelled(job_id):
+            # エリアとフリーワードの組み合わせごとに一覧を検索する（freeword=Noneならエリア全体＝後方互換）
+            searches = [(area, word) for area in areas for word in (freewords or [None])]
+            search_pages = yield from self._get_search_pages(searches, job_id)
+            if search_pages is None:
+                return
+            if self._is_cancelled(job_id) or not search_pages:
                 yield f"event: cancelled\ndata: 処理がユーザーによって中断されました。\n\n"
                 return
-            
-            yield f"event: message\ndata: {len(salon_urls)}件のサロンURLを収集しました。詳細情報の取得を開始します。\n\n"
-
-            salon_details = []
-            with ThreadPoolExecutor(max_workers=self.config['MAX_WORKERS']) as executor:
-                if not salon_urls:
-                    yield f"event: message\ndata: 対象エリアにサロンが見つかりませんでした。\n\n"
-                
-                future_to_url = {executor.submit(self._scrape_salon_details, url, job_id): url for url in salon_urls}
-                for i, future in enumerate(as_completed(future_to_url), 1):
+            found = {(area['url'], word) for area, word, _, _ in search_pages}
+            for area, word in searches:
+                if (area['url'], word) not in found:
+                    name = f"「{area['name']}」（『{word}』）" if word else f"「{area['name']}」"
+                    yield f"event: message\ndata: {name}の一覧ページを取得できなかったため、対象から除きます。\n\n"
+            total_pages = sum(pages for _, _, pages, _ in search_pages)
+
+            def search_tag(area, word):
+                tag = {}
+                if self.AREA_COLUMN in extra_columns:
+                    tag[self.AREA_COLUMN] = area['name']
+                if self.KEYWORD_COLUMN in extra_columns:
+                    tag[self.KEYWORD_COLUMN] = word
+                return tag
+
+            # 取得したサロン情報は到着順に重複除去・除外判定し、Excelファイルへ逐次書き込む
+            writer = SalonListWriter(
+                self.config['OUTPUT_DIR'], label, freeword_label, self.exclusion_rules, extra_columns=extra_columns
+            )
+            try:
+                if self.config.get('SCRAPE_MODE', 'pipelined') == 'pipelined':
+                    yield f"event: message\ndata: 総ページ数を特定しました: {total_pages}ページ。一覧の収集と詳細情報の取得を並行して進めます...\n\n"
+                    page_urls = []
+                    page_tags = {}
+                    for area, word, pages, final_area_url in search_pages:
+                        search_page_urls = self._build_page_urls(final_area_url, pages, word)
+                        page_urls.extend(search_page_urls)
+                        if extra_columns:
+                            page_tags.update(dict.fromkeys(search_page_urls, search_tag(area, word)))
+                    yield from self._run_work_queue(
+                        job_id, page_urls=page_urls, incremental=incremental, output=writer, checkpoint=checkpoint,
+                        page_tags=page_tags,
+                    )
+                else:
+                    yield f"event: message\ndata: 総ページ数を特定しました: {total_pages}ページ。一覧からURLを収集中...\n\n"
+
+                    salon_urls = []
+                    salon_tags = {}
+                    for area, word, pages, final_area_url in search_pages:
+                        search_salon_urls = yield from self._get_all_salon_urls(final_area_url, pages, job_id, word)
+                        if self._is_cancelled(job_id):
+                            break
+                        salon_urls.extend(search_salon_urls)
+                        if extra_columns:
+                            for url in search_salon_urls:
+                                self._add_tag(salon_tags, url, search_tag(area, word))
                     if self._is_cancelled(job_id):
-                        executor.shutdown(wait=False, cancel_futures=True)
+                        writer.discard()
                         yield f"event: cancelled\ndata: 処理がユーザーによって中断されました。\n\n"
-                        break
-                    
-                    try:
-                        result = future.result()
-                        if result:
-                            salon_details.append(result)
-                        yield f"event: progress\ndata: {json.dumps({'current': i, 'total': len(salon_urls)})}\n\n"
-                    except Exception as exc:
-                        url = future_to_url[future]
-                        self.logger.error(f'{url} generated an exception: {exc}')
-                        yield f"event: message\ndata: エラー発生: {url} の処理中に問題がありました。\n\n"
+                        return
 
-            if self._is_cancelled(job_id):
-                yield f"event: cancelled\ndata: 処理がユーザーによって中断されました。\n\n"
-                return
+                    unique_urls = {}
+                    for url in salon_urls:
+                        add_salon_url(unique_urls, url)
+                    salon_urls = list(unique_urls.values())
+                    yield f"event: message\ndata: {len(salon_urls)}件のサロンURLを収集しました。詳細情報の取得を開始します。\n\n"
+                    if not salon_urls:
+                        yield f"event: message\ndata: 対象エリアにサロンが見つかりませんでした。\n\n"
+                    yield from self._run_work_queue(
+                        job_id, salon_urls=salon_urls, incremental=incremental, output=writer, checkpoint=checkpoint,
+                        salon_tags=salon_tags,
+                    )
+            except BaseException:
+                writer.discard()
+                raise
+
+            yield from self._finish_scraping(job_id, writer, checkpoint)
 
-            yield f"event: message\ndata: {len(salon_details)}件の詳細情報を取得しました。データを処理してExcelファイルを生成します。\n\n"
-            
-            # DataFrameに変換
-            df = pd.DataFrame(salon_details)
-            
-            # 重複削除: 電話番号とサロンURLをキーとする
-            if not df.empty:
-                df_before_dedup = df.copy()
-                df = df.drop_duplicates(subset=['電話番号', 'サロンURL'], keep='first')
-                removed_count = len(df_before_dedup) - len(df)
-                if removed_count > 0:
-                    yield f"event: message\ndata: 重複店舗 {removed_count}件を削除しました。\n\n"
-            
-            # データ分割
-            df_target = df[df['is_excluded'] == False].copy() if not df.empty else pd.DataFrame()
-            df_excluded = df[df['is_excluded'] == True].copy() if not df.empty else pd.DataFrame()
-            
-            yield f"event: message\ndata: 営業対象: {len(df_target)}件、除外対象: {len(df_excluded)}件に分類しました。\n\n"
-            
-            # Excelファイル生成
-            file_name = self._create_target_excel_file(df_target, area_info['name'], freeword)
-            excluded_file_name = None
-            if not df_excluded.empty:
-                excluded_file_name = self._create_excluded_excel_file(df_excluded, area_info['name'], freeword)
-                yield f"event: message\ndata: 除外リストも生成しました。\n\n"
-            
-            # プレビューデータは営業対象リストから生成
-            preview_data = df_target.head(5).to_dict('records') if not df_target.empty else []
-            # is_excluded と exclusion_reason をプレビューデータから除去
-            for item in preview_data:
-                item.pop('is_excluded', None)
-                item.pop('exclusion_reason', None)
-            
-            result_payload = {
-                'file_name': file_name,
-                'excluded_file_name': excluded_file_name,
-                'preview_data': preview_data
-            }
-            yield f"event: result\ndata: {json.dumps(result_payload)}\n\n"
-        
         except Exception as e:
             self.logger.error(f"Scraping service error: {e}", exc_info=True)
             yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
 
+    def _resume_scraping(self, label, extra_columns, job_id, freeword, incremental, checkpoint, state, records):
+        """
+        チェックポイントから処理を再開するジェネレータ。
+        完了済みのサロン情報は保存済みのものを書き込み直し、待ち行列に残っていたページだけを取得する。
+        """
+        yield f"event: message\ndata: 「{label}」のスクレイピングを、取得済みの{len(records)}件の続きから再開します。\n\n"
+        writer = SalonListWriter(
+            self.config['OUTPUT_DIR'], label, freeword, self.exclusion_rules, extra_columns=extra_columns
+        )
+        try:
+            yield from self._run_work_queue(
+                job_id, incremental=incremental, output=writer, checkpoint=checkpoint, resume_state=state,
+                completed_records=records,
+            )
+        except BaseException:
+            writer.discard()
+            raise
+
+        yield from self._finish_scraping(job_id, writer, checkpoint)
+
+    def _finish_scraping(self, job_id, writer, checkpoint):
+        """Excelファイルを確定してresultイベントを送る。中断された場合はファイルを破棄する。"""
+        if self._is_cancelled(job_id):
+            writer.discard()
+            yield f"event: cancelled\ndata: 処理がユーザーによって中断されました。\n\n"
+            return
+
+        if self.served_from_store:
+            yield f"event: message\ndata: 差分取得: {self.served_from_store}件は保存済みのデータを使用しました。\n\n"
+        yield f"event: message\ndata: {len(writer)}件の詳細情報を取得しました。\n\n"
+
+        file_name, excluded_file_name = writer.close()
+        if writer.duplicates > 0:
+            yield f"event: message\ndata: 重複店舗 {writer.duplicates}件を削除しました。\n\n"
+        yield f"event: message\ndata: 営業対象: {writer.target_count}件、除外対象: {writer.excluded_count}件に分類しました。\n\n"
+        if excluded_file_name:
+            yield f"event: message\ndata: 除外リストも生成しました。\n\n"
+        
+        result_payload = {
+            'file_name': file_name,
+            'excluded_file_name': excluded_file_name,
+            # プレビューデータは営業対象リストの先頭から生成
+            'preview_data': writer.preview,
+            'fetch_stats': self._summarize_fetch_stats(),
+            'cache_stats': self.http_cache.stats() if self.http_cache else None,
+            'served_from_store': self.served_from_store,
+        }
+        yield f"event: result\ndata: {json.dumps(result_payload)}\n\n"
+        if checkpoint:
+            checkpoint.clear()
+
     def _get_area_info(self, area_id):
         db = get_db()
         query = text('SELECT name, url FROM areas WHERE id = :id')
@@ -211,8 +465,110 @@ class ScrapingService:
             raise ValueError(f"Area with ID {area_id} not found.")
         return {'name': area['name'], 'url': area['url']}
 
+    def _get_areas(self, area_ids, prefecture=None):
+        """
+        対象エリアのリストを返す。area_idsは1つのエリアIDまたはそのリスト。
+        prefectureを指定すると、その都道府県のエリアも（ID順に）加える。同じURLのエリアは1つにまとめる。
+        """
+        if area_ids is None:
+            area_ids = []
+        elif isinstance(area_ids, (str, int)):
+            area_ids = [area_ids]
+        areas = [self._get_area_info(area_id) for area_id in area_ids]
+        if prefecture:
+            query = text('SELECT name, url FROM areas WHERE prefecture = :prefecture ORDER BY id')
+            rows = get_db().execute(query, {'prefecture': prefecture}).mappings().all()
+            if not rows:
+                raise ValueError(f"No areas found for prefecture {prefecture}.")
+            areas.extend({'name': row['name'], 'url': row['url']} for row in rows)
+        if not areas:
+            raise ValueError("No area specified.")
+        unique = {}
+        for area in areas:
+            unique.setdefault(area['url'], area)
+        return list(unique.values())
+
+    def _areas_label(self, areas, prefecture=None):
+        """ファイル名やメッセージに使う、対象エリアの表示名を返す。"""
+        if len(areas) == 1:
+            return areas[0]['name']
+        if prefecture:
+            return prefecture
+        return f"{areas[0]['name']}ほか{len(areas) - 1}エリア"
+
+    def _normalize_freewords(self, freeword):
+        """
+        フリーワード（1つの文字列またはリスト）を、前後の空白を除いた重複のないリストにする。
+        空文字は除き、未指定なら空のリストを返す。
+        """
+        if freeword is None:
+            return []
+        if isinstance(freeword, str):
+            freeword = [freeword]
+        return list(dict.fromkeys(word.strip() for word in freeword if word and word.strip()))
+
+    def _get_search_pages(self, searches, job_id):
+        """
+        (エリア, フリーワード)の組み合わせごとに総ページ数を調べ、
+        (エリア, フリーワード, 総ページ数, 一覧の先頭URL)のリストを返すジェネレータ。
+        1ページ目を取得できなかった組み合わせは含めない。ワークキューと同じくFETCH_ENGINEのExecutorで、
+        同時取得数（self.concurrency）の範囲内で並行して調べる。
+        複数の場合は進捗をsearch_progressイベントで送る。中断された場合はcancelledイベントを送ってNoneを返す。
+        """
+        results = {}
+        with self._create_executor() as executor:
+            waiting = deque(enumerate(searches))
+            pending = {}
+
+            def fill():
+                while waiting and len(pending) < self.concurrency.limit:
+                    index, (area, word) = waiting.popleft()
+                    future = executor.submit(
+                        self._task('search'), self._build_freeword_url(area['url'], word), job_id, word
+                    )
+                    pending[future] = index
+
+            fill()
+            # キャンセル用のFutureも待機対象に含め、取得中のページを待たずに中断できるようにする
+            cancelled = self.cancellation.future(job_id)
+            throttle = self._progress_throttle()
+            while pending:
+                done, _ = wait([*pending, cancelled], return_when=FIRST_COMPLETED)
+                if self._is_cancelled(job_id):
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    yield f"event: cancelled\ndata: 処理がユーザーによって中断されました。\n\n"
+                    return None
+
+                for future in done:
+                    index = pending.pop(future)
+                    try:
+                        results[index] = future.result()
+                    except Exception as exc:
+                        area, word = searches[index]
+                        self.logger.error(f"{area['url']} (freeword={word}) generated an exception: {exc}")
+                    if len(searches) > 1:
+                        yield from throttle.update('search_progress', {
+                            'current': len(searches) - len(waiting) - len(pending), 'total': len(searches),
+                            'concurrency': self.concurrency.limit,
+                        })
+                fill()
+            yield from throttle.flush()
+        return [
+            (area, word, *results[index])
+            for index, (area, word) in enumerate(searches)
+            if results.get(index, (None, None))[0] is not None
+        ]
+
     def _get_total_pages(self, area_url, job_id, freeword=None):
+        """一覧の1ページ目を取得し、(総ページ数, 一覧の先頭URL)を返す。取得できなければ(None, None)を返す。"""
         response = self._make_request(area_url, job_id)
+        return self._parse_total_pages(response, freeword)
+
+    async def _get_total_pages_async(self, area_url, job_id, freeword=None):
+        response = await self._make_request_async(area_url, job_id)
+        return await asyncio.to_thread(self._parse_total_pages, response, freeword)
+
+    def _parse_total_pages(self, response, freeword=None):
         if not response:
             return None, None
 
@@ -221,12 +577,14 @@ class ScrapingService:
         # _build_freeword_urlは既存クエリ(searchGender等)をマージしつつfreewordを補う。
         # freeword=Noneなら何もしない（後方互換）。
         final_url = self._build_freeword_url(final_url, freeword)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        pagination_element = soup.select_one(self.selectors['area_page']['pagination'])
-        if not pagination_element:
+        doc = self._parse_html(response)
+        # 1ページ目のサロンURLもここで抽出しておき、一覧ページのタスクでは取得し直さない
+        first_page_url = self._build_page_urls(final_url, 1, freeword)[0]
+        self._harvested_pages[first_page_url] = self._salon_urls_from_doc(doc, response.url)
+        pagination_text = self.plan.pagination_text(doc)
+        if pagination_text is None:
             return 1, final_url
-        
-        pagination_text = pagination_element.text.strip()
+
         total_pages = 1
 
         # パターン1: "1/9ページ" 形式
@@ -244,8 +602,8 @@ class ScrapingService:
         
         return total_pages, final_url
 
-    def _get_all_salon_urls(self, area_url, total_pages, job_id, freeword=None):
-        all_urls = set()
+    def _build_page_urls(self, area_url, total_pages, freeword=None):
+        """1ページ目から総ページ数までの一覧ページURLを組み立てる"""
         page_urls = []
 
         # area_urlからクエリ(?freeword=...)をpathと分離する。
@@ -264,235 +622,414 @@ class ScrapingService:
             else:
                 page_path = f"{base_path}/PN{page}.html"
             page_urls.append(urlunsplit((parts.scheme, parts.netloc, page_path, query_string, '')))
+        return page_urls
+
+    def _get_all_salon_urls(self, area_url, total_pages, job_id, freeword=None):
+        """一覧ページをすべて取得してからサロンURLの一覧を返す（段階実行モード用）"""
+        all_urls = {}  # サロンIDごとのサロンURL
+        page_urls = self._build_page_urls(area_url, total_pages, freeword)
+        if not page_urls:
+            return []
 
-        with ThreadPoolExecutor(max_workers=self.config['MAX_WORKERS']) as executor:
-            if not page_urls:
-                return []
-            
-            future_to_url = {executor.submit(self._get_salon_urls_from_page, url, job_id): url for url in page_urls}
-            for i, future in enumerate(as_completed(future_to_url), 1):
+        with self._create_executor() as executor:
+            future_to_url = {executor.submit(self._task('list'), url, job_id): url for url in page_urls}
+            # キャンセル用のFutureも待機対象に含め、取得中のページを待たずに中断できるようにする
+            cancelled = self.cancellation.future(job_id)
+            remaining = set(future_to_url)
+            pages_done = 0
+            throttle = self._progress_throttle()
+            while remaining:
+                done, _ = wait([*remaining, cancelled], return_when=FIRST_COMPLETED)
                 if self._is_cancelled(job_id):
                     executor.shutdown(wait=False, cancel_futures=True)
                     yield f"event: cancelled\ndata: 処理がユーザーによって中断されました。\n\n"
                     break
 
-                yield f"event: url_progress\ndata: {json.dumps({'current': i, 'total': total_pages})}\n\n"
-                try:
-                    urls_from_page = future.result()
-                    all_urls.update(urls_from_page)
-                except Exception as exc:
-                    url = future_to_url[future]
-                    self.logger.error(f'{url} (list page) generated an exception: {exc}')
+                for future in done:
+                    remaining.discard(future)
+                    pages_done += 1
+                    yield from throttle.update('url_progress', {'current': pages_done, 'total': total_pages})
+                    try:
+                        urls_from_page = future.result()
+                        for url in urls_from_page:
+                            add_salon_url(all_urls, url)
+                    except Exception as exc:
+                        url = future_to_url[future]
+                        self.logger.error(f'{url} (list page) generated an exception: {exc}')
+            else:
+                yield from throttle.flush()
         
-        return list(all_urls)
+        return list(all_urls.values())
 
-    def _get_salon_urls_from_page(self, page_url, job_id):
-        """1つの一覧ページからサロンURLをすべて取得する"""
-        urls_on_page = set()
-        response = self._make_request(page_url, job_id)
-        if not response:
-            return urls_on_page
-        
-        soup = BeautifulSoup(response.text, 'html.parser')
-        links = soup.select(self.selectors['area_page']['salon_url_in_list'])
-        for link in links:
-            if 'href' in link.attrs:
-                full_url = requests.compat.urljoin(page_url, link['href'])
-                urls_on_page.add(full_url)
-        return urls_on_page
-
-    def _get_value_by_th_text(self, soup, th_text):
+    def _add_tag(self, tags, salon_url, tag):
+        """サロンにタグ（{カラム名: 値}）を追加する。タグはサロンID（取り出せなければURL）ごとにまとめる。"""
+        columns = tags.setdefault(salon_key(salon_url), {})
+        for column, value in tag.items():
+            values = columns.setdefault(column, [])
+            if value not in values:
+                values.append(value)
+
+    def _run_work_queue(self, job_id, page_urls=(), salon_urls=(), incremental=False, output=None,
+                        checkpoint=None, resume_state=None, page_tags=None, salon_tags=None, completed_records=()):
         """
-        指定されたテキストを持つ<th>の次の<td>要素の値を取得する。
-        テーブル内の<th>を検索し、その隣の<td>のテキストを返す。
+        一覧・詳細・電話番号ページの取得を1つのExecutor（共通のワーカー予算）で処理するジェネレータ。
+        - 一覧ページの解析が終わるたびに、未取得のサロンURLをサロンID単位で重複排除して詳細取得へ投入する。
+        - 詳細ページで電話番号ページへのリンクが見つかったら電話番号ページを別タスクとして投入し、
+          完了時にサロン情報へ結合する。詳細取得のワーカーは電話番号ページの応答を待たない。
+        Executorには同時実行数分だけ投入し、残りは種類ごとの待ち行列に保持する。
+        TASK_PRIORITYの順に投入するため、取りかかったサロンから順に完了する。
+        一覧の取得中は、progressイベントに一覧ページの進捗(pages_current/pages_total)も含める。
+        incremental=Trueの場合、鮮度期間内のサロンはsalonsテーブルのデータで完了扱いにする。
+        新たに取得したサロン情報は、SalonStore.CHUNK_SIZE件ごとと終了時にsalonsテーブルへ保存する。
+        完了したサロン情報はoutput（append()を持つオブジェクト、省略時はlist）へ順次渡し、outputを返す。
+        checkpointを渡すと、CHECKPOINT_INTERVAL_SECONDS秒ごとと中断時に、収集済みのURL・待ち行列
+        （実行中のタスクを含む）・前回以降に完了したサロン情報を保存する。
+        resume_stateには保存した状態を渡し、その待ち行列から処理を再開する。
+        completed_recordsには再開前に完了していたサロン情報を渡し、outputへ渡し直す。
+        page_tags（一覧ページURL→{カラム名: 値}）を渡すと、その一覧ページで見つかったサロンの情報に
+        カラムを追加する（複数エリアのジョブの「エリア」など）。複数の一覧ページで見つかったサロンは値を「、」で
+        つないで出力する。salon_tagsには段階実行モードで収集済みのサロンのタグ（_add_tagで作成）を渡す。
+        同じサロンが/kr/あり・なしのURLで見つかった場合、出力するサロンURLはpreferred_salon_urlで選ぶ。
+        後の一覧ページでタグやURLが変わることがあるため、完了したサロン情報は
+        すべての一覧ページの解析が終わるまで保留してからoutputへ渡す。
         """
-        # 'slnDataTbl'クラスを持つテーブルにスコープを限定
-        data_table = soup.select_one('table.slnDataTbl')
-        if not data_table:
-            return ''
-
-        # th_textを部分的に含むth要素を検索
-        th_element = data_table.find('th', string=lambda t: t and th_text in t.strip())
-        if th_element:
-            td_element = th_element.find_next_sibling('td')
-            if td_element:
-                # <p>タグなどが含まれるケースを考慮し、get_text()でテキストを抽出
-                return td_element.get_text(separator=' ', strip=True)
-        return ''
+        salon_details = [] if output is None else output
+        scraped_details = []
+        unsaved_details = []  # 前回のチェックポイント以降に完了したサロン情報
+        seen_salons = {}  # 投入済みのサロンのキー（salon_key）ごとの出力に使うURL（preferred_salon_url）
+        tags = {key: {column: list(values) for column, values in columns.items()}
+                for key, columns in (salon_tags or {}).items()}
+        tagged = bool(page_tags or salon_tags)
+        held = []  # 一覧ページの解析待ちで保留中のサロン情報
+        total_pages = len(page_urls)
+        pages_done = 0
+        salons_done = 0
+        queues = {kind: deque() for kind in self.TASK_PRIORITY}
+        if resume_state:
+            for url in resume_state['seen_urls']:
+                add_salon_url(seen_salons, url)
+            total_pages = resume_state['pages_total']
+            pages_done = resume_state['pages_done']
+            salons_done = resume_state['salons_done']
+            self.served_from_store = resume_state['served_from_store']
+            tags = resume_state.get('tags', {})
+            tagged = resume_state.get('tagged', False)
+            for kind in self.TASK_PRIORITY:
+                queues[kind].extend((url, record) for url, record in resume_state['queues'][kind])
+        checkpoint_interval = self.config['CHECKPOINT_INTERVAL_SECONDS']
+        last_checkpoint = None
+        in_flight = dict.fromkeys(self.TASK_PRIORITY, 0)
+        limits = {
+            'list': 0,
+            'detail': self.config.get('DETAIL_MAX_CONCURRENCY', 0),
+            'phone': self.config.get('PHONE_MAX_CONCURRENCY', 0),
+        }
+        logged_concurrency = self.concurrency.limit
+        self.fetch_stats = {kind: {'count': 0, 'seconds': 0.0} for kind in self.TASK_PRIORITY}
 
-    def _scrape_salon_details(self, salon_url, job_id):
-        response = self._make_request(salon_url, job_id)
-        if not response: return None
-        soup = BeautifulSoup(response.text, 'html.parser')
+        with self._create_executor() as executor:
+            pending = {}
 
-        def get_text(selector):
-            element = soup.select_one(selector)
-            return element.text.strip() if element else ''
+            def next_kind():
+                for kind in self.TASK_PRIORITY:
+                    if queues[kind] and not (limits[kind] and in_flight[kind] >= limits[kind]):
+                        return kind
+                return None
 
-        phone_page_link = soup.select_one(self.selectors['salon_detail']['phone_page_link'])
-        phone_number = ''
-        if phone_page_link and 'href' in phone_page_link.attrs:
-            phone_page_url = requests.compat.urljoin(salon_url, phone_page_link['href'])
-            phone_number = self._scrape_phone_number(phone_page_url, job_id)
+            def fill():
+                # 同時取得数は応答時間・エラー率に応じて変わるため、投入のたびに現在の値を参照する
+                while len(pending) < self.concurrency.limit:
+                    kind = next_kind()
+                    if kind is None:
+                        return
+                    url, record = queues[kind].popleft()
+                    in_flight[kind] += 1
+                    future = executor.submit(self._task(kind), url, job_id)
+                    pending[future] = (kind, url, record, time.monotonic())
 
-        related_links_elements = soup.select(self.selectors['salon_detail']['related_links'])
-        related_links = [link['href'] for link in related_links_elements if 'href' in link.attrs]
+            def enqueue_salons(urls, tag=None):
+                """未取得のURLを詳細取得に投入し、保存済みデータで完了したサロン数を返す"""
+                if tag:
+                    for url in urls:
+                        self._add_tag(tags, url, tag)
+                # 同じサロンIDのURLは表記が異なっても一度だけ投入する（詳細ページを取得する前に重複を除く）
+                new_urls = []
+                for url in urls:
+                    if salon_key(url) not in seen_salons:
+                        new_urls.append(url)
+                    add_salon_url(seen_salons, url)
+                stored = {}
+                if incremental:
+                    stored = self.salon_store.load_fresh({extract_salon_id(url) for url in new_urls} - {None})
+                served = 0
+                for url in new_urls:
+                    record = stored.get(extract_salon_id(url))
+                    if record is not None:
+                        complete(record)
+                        served += 1
+                    else:
+                        queues['detail'].append((url, None))
+                self.served_from_store += served
+                return served
 
-        staff_count_text = self._get_value_by_th_text(soup, self.selectors['salon_detail']['staff_count_label'])
-        salon_name = get_text(self.selectors['salon_detail']['name'])
-        address = self._get_value_by_th_text(soup, self.selectors['salon_detail']['address_label'])
-        clean_salon_url = salon_url.split('?')[0]
+            def complete(record):
+                if checkpoint is not None:
+                    unsaved_details.append(record)
+                emit(record)
 
-        # 除外条件判定
-        exclusion_reasons = []
-        
-        # EPRP店舗判定: 特集セクションが存在しない場合
-        special_feature_element = soup.select_one(self.selectors['salon_detail']['special_feature_section'])
-        is_eprp = special_feature_element is None
-        if is_eprp:
-            exclusion_reasons.append("EPRP")
-        
-        # エステ/リラク店舗判定: URLに/kr/が含まれる場合
-        # 例: https://beauty.hotpepper.jp/kr/slnH000169389/
-        is_este_relax = '/kr/' in clean_salon_url or '/kr/' in salon_url
-        if is_este_relax:
-            exclusion_reasons.append("エステ/リラク")
-        
-        # 電話番号なし判定
-        is_no_phone = not phone_number or phone_number.strip() == ''
-        if is_no_phone:
-            exclusion_reasons.append("電話番号なし")
-        
-        # スタッフ数判定: 「スタイリスト1人」かつ「アシスタントなし」の店舗を除外
-        is_single_stylist_no_assistant = False
-        if staff_count_text:
-            # デバッグ用: スタッフ数テキストをログに出力
-            self.logger.debug(f"スタッフ数テキスト: '{staff_count_text}' (サロン: {salon_name})")
-            
-            # スタイリスト1人(名)の様々なパターンをチェック
-            # 実際のデータ: 「スタイリスト1人」
-            stylist_patterns = [
-                r'スタイリスト\s*[：:]\s*1\s*[人名]',   # スタイリスト：1人、スタイリスト：1名
-                r'スタイリスト\s+1\s*[人名]',           # スタイリスト 1人、スタイリスト 1名
-                r'スタイリスト1[人名]',                  # スタイリスト1人、スタイリスト1名 (スペースなし)
-                r'スタイリスト\s*1\s*[人名]'            # スタイリスト1人、スタイリスト 1 人 (柔軟なスペース対応)
-            ]
-            
-            stylist_match = False
-            matched_pattern = None
-            for pattern in stylist_patterns:
-                if re.search(pattern, staff_count_text):
-                    stylist_match = True
-                    matched_pattern = pattern
+            def emit(record):
+                if pages_done < total_pages:
+                    held.append(record)
+                else:
+                    output_record(record)
+
+            def output_record(record):
+                salon_url = record.get('サロンURL')
+                preferred_url = seen_salons.get(salon_key(salon_url))
+                if preferred_url and preferred_url != salon_url:
+                    record = {**record, 'サロンURL': preferred_url}
+                if tagged:
+                    columns = tags.get(salon_key(salon_url), {})
+                    record = {**record, **{column: '、'.join(sorted(values)) for column, values in columns.items()}}
+                salon_details.append(record)
+
+            def release_held():
+                for record in held:
+                    output_record(record)
+                held.clear()
+
+            def save_checkpoint(force=False):
+                nonlocal last_checkpoint
+                now = time.monotonic()
+                if checkpoint is None or (
+                    not force and last_checkpoint is not None and now - last_checkpoint < checkpoint_interval
+                ):
+                    return
+                # 実行中のタスクは未完了として扱い、再開時に待ち行列の先頭から取得し直す
+                state_queues = {kind: [] for kind in self.TASK_PRIORITY}
+                for kind, url, record, _ in pending.values():
+                    state_queues[kind].append([url, record])
+                for kind, queue in queues.items():
+                    state_queues[kind].extend([url, record] for url, record in queue)
+                # salonsテーブルへの保存もチェックポイントに揃え、再開時に保存漏れが出ないようにする
+                self.salon_store.save(scraped_details)
+                scraped_details.clear()
+                checkpoint.save({
+                    'seen_urls': sorted(seen_salons.values()),
+                    'pages_total': total_pages,
+                    'pages_done': pages_done,
+                    'salons_done': salons_done,
+                    'served_from_store': self.served_from_store,
+                    'queues': state_queues,
+                    'tags': tags,
+                    'tagged': tagged,
+                }, unsaved_details)
+                unsaved_details.clear()
+                last_checkpoint = now
+
+            throttle = self._progress_throttle()
+
+            def progress_events():
+                progress = {'current': salons_done, 'total': len(seen_salons), 'concurrency': self.concurrency.limit}
+                if pages_done < total_pages:
+                    # 一覧の収集中はtotalが確定していないため、一覧側の進捗も添える
+                    progress.update({'pages_current': pages_done, 'pages_total': total_pages})
+                return throttle.update('progress', progress)
+
+            for record in completed_records:
+                emit(record)
+            for page_url in page_urls:
+                # 一覧ページの待ち行列では、サロン情報の代わりにタグを保持する
+                queues['list'].append((page_url, (page_tags or {}).get(page_url)))
+            salons_done += enqueue_salons(salon_urls)
+            if salons_done:
+                yield from progress_events()
+            fill()
+            save_checkpoint(force=True)
+
+            # キャンセル用のFutureも待機対象に含め、取得中のタスクの完了を待たずに中断できるようにする
+            cancelled = self.cancellation.future(job_id)
+            while pending:
+                done, _ = wait([*pending, cancelled], return_when=FIRST_COMPLETED)
+                if self._is_cancelled(job_id):
+                    save_checkpoint(force=True)
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    yield from throttle.flush()
+                    yield f"event: cancelled\ndata: 処理がユーザーによって中断されました。\n\n"
                     break
-            
-            # アシスタントが含まれているかチェック
-            has_assistant = 'アシスタント' in staff_count_text
-            
-            # デバッグ用ログ
-            if stylist_match:
-                self.logger.debug(f"スタイリスト1人マッチ: パターン={matched_pattern}, アシスタント有無={has_assistant} (サロン: {salon_name})")
-            
-            # スタイリスト1人かつアシスタントなしの場合のみ除外
-            if stylist_match and not has_assistant:
-                is_single_stylist_no_assistant = True
-                exclusion_reasons.append("スタッフ数")
-                self.logger.debug(f"スタッフ数で除外: {salon_name}")
-        
-        # 関連リンク数判定: 4以上の場合
-        is_many_links = len(related_links) >= 4
-        if is_many_links:
-            exclusion_reasons.append("関連リンク数")
-        
-        # 総合判定
-        is_excluded = len(exclusion_reasons) > 0
-        exclusion_reason = ', '.join(exclusion_reasons) if is_excluded else ''
 
+                for future in done:
+                    kind, url, record, started_at = pending.pop(future)
+                    in_flight[kind] -= 1
+                    self.fetch_stats[kind]['count'] += 1
+                    self.fetch_stats[kind]['seconds'] += time.monotonic() - started_at
+
+                    if kind == 'list':
+                        pages_done += 1
+                        served = 0
+                        try:
+                            served = enqueue_salons(sorted(future.result()), record)
+                        except Exception as exc:
+                            self.logger.error(f'{url} (list page) generated an exception: {exc}')
+                        if pages_done >= total_pages:
+                            release_held()
+                        yield from throttle.update('url_progress', {
+                            'current': pages_done, 'total': total_pages, 'concurrency': self.concurrency.limit,
+                        })
+                        if served:
+                            salons_done += served
+                            yield from progress_events()
+                        continue
+
+                    try:
+                        result = future.result()
+                    except Exception as exc:
+                        result = None
+                        self.logger.error(f'{url} generated an exception: {exc}')
+                        yield f"event: message\ndata: エラー発生: {url} の処理中に問題がありました。\n\n"
+
+                    if kind == 'detail':
+                        record = result
+                        phone_page_url = record.pop('phone_page_url', None) if record else None
+                        if phone_page_url:
+                            queues['phone'].append((phone_page_url, record))
+                            continue
+                    else:
+                        record['電話番号'] = result or ''
+
+                    salons_done += 1
+                    if record:
+                        complete(record)
+                        # 電話番号ページの取得に失敗したサロンは保存せず、次回の差分取得で取得し直す
+                        if kind == 'detail' or result is not None:
+                            scraped_details.append(record)
+                        if len(scraped_details) >= self.salon_store.CHUNK_SIZE:
+                            self.salon_store.save(scraped_details)
+                            scraped_details.clear()
+                    yield from progress_events()
+
+                if self.concurrency.limit != logged_concurrency:
+                    self.logger.info(
+                        f"Fetch concurrency {logged_concurrency} -> {self.concurrency.limit} "
+                        f"(p95 {self.concurrency.last_p95_seconds}s, error rate {self.concurrency.last_error_rate})"
+                    )
+                    logged_concurrency = self.concurrency.limit
+                fill()
+                save_checkpoint()
+            else:
+                yield from throttle.flush()
+
+        # 途中で中断された場合も、取得済みのサロン情報は保存しておく
+        self.salon_store.save(scraped_details)
+        release_held()
+
+        for kind, stats in self.fetch_stats.items():
+            if stats['count']:
+                self.logger.info(f"{kind} pages: {stats['count']} fetched, avg {stats['seconds'] / stats['count']:.2f}s")
+        self.logger.info(f"Fetch concurrency at end: {self.concurrency.limit}")
+        return salon_details
+
+    def _progress_throttle(self):
+        """進捗イベントをPROGRESS_INTERVAL_SECONDS秒ごとにまとめるProgressThrottleを作成する。"""
+        return ProgressThrottle(self.config['PROGRESS_INTERVAL_SECONDS'])
+
+    def _summarize_fetch_stats(self):
+        """ページ種別ごとの取得件数と平均所要時間を返す（resultイベント用）"""
+        return {
+            kind: {
+                'count': stats['count'],
+                'avg_seconds': round(stats['seconds'] / stats['count'], 3) if stats['count'] else 0.0,
+            }
+            for kind, stats in self.fetch_stats.items()
+        }
+
+    def _executor_capacity(self):
+        """Executorに同時に投入するタスク数の上限"""
+        if self.fetch_engine == 'async':
+            return self.config['ASYNC_MAX_IN_FLIGHT']
+        return self.config['MAX_WORKERS']
+
+    def _get_salon_urls_from_page(self, page_url, job_id):
+        """1つの一覧ページからサロンURLをすべて取得する（総ページ数を調べたときに解析済みのページは取得しない）"""
+        harvested = self._harvested_pages.pop(page_url, None)
+        if harvested is not None:
+            return harvested
+        response = self._make_request(page_url, job_id)
+        return self._parse_salon_urls(response, page_url)
+
+    async def _get_salon_urls_from_page_async(self, page_url, job_id):
+        harvested = self._harvested_pages.pop(page_url, None)
+        if harvested is not None:
+            return harvested
+        response = await self._make_request_async(page_url, job_id)
+        # HTMLの解析はCPUを使うため、イベントループ外のスレッドで行う
+        return await asyncio.to_thread(self._parse_salon_urls, response, page_url)
+
+    def _parse_salon_urls(self, response, page_url):
+        """
+        一覧ページのレスポンスからサロンURLを抽出する。
+        URLはサロンIDだけを含む正規のURLにそろえ、クエリ文字列などが異なる同じサロンのリンクを1つにまとめる。
+        """
+        if not response:
+            return set()
+        return self._salon_urls_from_doc(self._parse_html(response), page_url)
+
+    def _salon_urls_from_doc(self, doc, page_url):
+        """解析済みの一覧ページからサロンURLを抽出する"""
+        return {
+            canonical_salon_url(requests.compat.urljoin(page_url, href)) for href in self.plan.salon_hrefs(doc)
+        }
+
+    def _scrape_salon_details(self, salon_url, job_id):
+        """
+        詳細ページを取得してサロン情報を返す。電話番号ページは取得せず、
+        そのURLを'phone_page_url'として返す（ワークキューが別タスクとして取得する）。
+        """
+        response = self._make_request(salon_url, job_id, 'detail')
+        return self._parse_detail_response(response, salon_url)
+
+    async def _scrape_salon_details_async(self, salon_url, job_id):
+        response = await self._make_request_async(salon_url, job_id, 'detail')
+        return await asyncio.to_thread(self._parse_detail_response, response, salon_url)
+
+    def _parse_detail_response(self, response, salon_url):
+        if not response: return None
+        return self._parse_salon_details(self._parse_html(response), salon_url)
+
+    def _parse_salon_details(self, doc, salon_url):
+        """
+        詳細ページの解析済み文書からサロン情報を組み立てる。
+        除外判定は行わず、判定に使う特徴量（特集セクションの有無など）をそのまま返す。
+        判定は全サロンの取得後にExclusionRulesでまとめて行う。
+        """
+        fields = self.plan.salon_fields(doc)
+        related_links = fields['related_links']
         return {
-            'サロン名': salon_name,
-            '電話番号': phone_number,
-            '住所': address,
-            'スタッフ数': staff_count_text,
+            'サロン名': fields['name'],
+            '電話番号': '',
+            '住所': fields['address'],
+            'スタッフ数': fields['staff_count'],
             '関連リンク': "\n".join(related_links),
             '関連リンク数': len(related_links),
-            'サロンURL': clean_salon_url,
-            'is_excluded': is_excluded,
-            'exclusion_reason': exclusion_reason,
+            'サロンURL': salon_url.split('?')[0],
+            'has_special_feature': fields['has_special_feature'],
+            'phone_page_url': (
+                requests.compat.urljoin(salon_url, fields['phone_page_href'])
+                if fields['phone_page_href'] is not None else None
+            ),
         }
 
     def _scrape_phone_number(self, phone_page_url, job_id):
         """電話番号が掲載されている別ページから電話番号を取得"""
-        response = self._make_request(phone_page_url, job_id)
-        if not response: return ''
-        soup = BeautifulSoup(response.text, 'html.parser')
-        phone_element = soup.select_one(self.selectors['phone_page']['phone_number'])
-        return phone_element.text.strip() if phone_element else ''
-
-    def _create_target_excel_file(self, df_target, area_name, freeword=None):
-        """営業対象リストのExcelファイルを作成"""
-        # タイムスタンプをファイル名に追加
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        safe_area_name = re.sub(r'[\\/*?:"<>|]', "", area_name)
-        safe_freeword = re.sub(r'[\\/*?:"<>|\x00-\x1f]', "", freeword).strip() if freeword else ''
-        if safe_freeword:
-            file_name = f"{safe_area_name}_{safe_freeword}_{timestamp}.xlsx"
-        else:
-            file_name = f"{safe_area_name}_{timestamp}.xlsx"
-        
-        output_path = os.path.join(self.config['OUTPUT_DIR'], file_name)
-        
-        # ディレクトリが存在しない場合は作成
-        os.makedirs(self.config['OUTPUT_DIR'], exist_ok=True)
-        
-        if df_target.empty:
-            # 空のDataFrameでもカラム構造を維持
-            columns_order = ['サロン名', '電話番号', '住所', 'スタッフ数', '関連リンク', '関連リンク数', 'サロンURL']
-            df_target = pd.DataFrame(columns=columns_order)
-        else:
-            # 既存のカラム構成と順序を完全に維持（is_excluded、exclusion_reasonは除外）
-            columns_order = ['サロン名', '電話番号', '住所', 'スタッフ数', '関連リンク', '関連リンク数', 'サロンURL']
-            # 存在しないカラムは空で追加
-            for col in columns_order:
-                if col not in df_target.columns:
-                    df_target[col] = None
-            df_target = df_target[columns_order]
-
-        df_target.to_excel(output_path, index=False, sheet_name='サロンリスト')
-        return file_name
-    
-    def _create_excluded_excel_file(self, df_excluded, area_name, freeword=None):
-        """除外リストのExcelファイルを作成"""
-        # タイムスタンプをファイル名に追加
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        safe_area_name = re.sub(r'[\\/*?:"<>|]', "", area_name)
-        safe_freeword = re.sub(r'[\\/*?:"<>|\x00-\x1f]', "", freeword).strip() if freeword else ''
-        if safe_freeword:
-            file_name = f"除外リスト_{safe_area_name}_{safe_freeword}_{timestamp}.xlsx"
-        else:
-            file_name = f"除外リスト_{safe_area_name}_{timestamp}.xlsx"
-        
-        output_path = os.path.join(self.config['OUTPUT_DIR'], file_name)
-        
-        # ディレクトリが存在しない場合は作成
-        os.makedirs(self.config['OUTPUT_DIR'], exist_ok=True)
-        
-        if not df_excluded.empty:
-            # exclusion_reasonを先頭に配置したカラム構成
-            columns_order = ['exclusion_reason', 'サロン名', '電話番号', '住所', 'スタッフ数', '関連リンク', '関連リンク数', 'サロンURL']
-            
-            # カラム名を日本語に変更
-            df_excluded = df_excluded.rename(columns={'exclusion_reason': '除外理由'})
-            columns_order[0] = '除外理由'  # カラム順序も更新
-            
-            # 存在しないカラムは空で追加
-            for col in columns_order:
-                if col not in df_excluded.columns:
-                    df_excluded[col] = None
-            df_excluded = df_excluded[columns_order]
-        else:
-            # 空のDataFrameでもカラム構造を維持
-            columns_order = ['除外理由', 'サロン名', '電話番号', '住所', 'スタッフ数', '関連リンク', '関連リンク数', 'サロンURL']
-            df_excluded = pd.DataFrame(columns=columns_order)
-
-        df_excluded.to_excel(output_path, index=False, sheet_name='除外リスト')
-        return file_name
\ No newline at end of file
+        response = self._make_request(phone_page_url, job_id, 'phone')
+        return self._parse_phone_number(response)
+
+    async def _scrape_phone_number_async(self, phone_page_url, job_id):
+        response = await self._make_request_async(phone_page_url, job_id, 'phone')
+        return await asyncio.to_thread(self._parse_phone_number, response)
+
+    def _parse_phone_number(self, response):
+        """電話番号を返す。ページの取得に失敗した場合は、掲載なし('')と区別するためNoneを返す。"""
+        if not response: return None
+        return self.plan.phone_number(self._parse_html(response))
+
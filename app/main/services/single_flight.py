@@ -0,0 +1,82 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+from flask import current_app
+
+
+class SingleFlight:
+    """
+    同じキーの処理が実行中なら新たに実行せず、実行中の処理の結果を共有するクラス（プロセス内で共有する）。
+    複数のジョブ・ワーカーが同じURLを同時に取得しようとした場合に、リクエストを1回にまとめるために使う。
+    結果は処理の完了時に待機中の呼び出し元へ渡すだけで、完了後は保持しない。
+    スレッドからはdo()、asyncエンジンのコルーチンからはdo_async()で呼び出し、互いの結果も共有する。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def _join(self, key):
+        """(結果を受け取るFuture, 呼び出し側が処理を実行するかどうか)を返す。"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = self._calls[key] = Future()
+            return future, True
+
+    def _finish(self, key, future, result=None, error=None):
+        with self._lock:
+            del self._calls[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key, fn, wait=None):
+        """
+        keyの処理が実行中でなければfn()を実行し、実行中ならその結果を待つ。(結果, 共有した結果かどうか)を返す。
+        waitを渡すと、他の処理の完了をwait(future)で待つ（キャンセルで待機を打ち切る場合など）。
+        waitが例外を送出せずに戻った時点で未完了なら、結果をNoneとして返す。
+        """
+        future, leader = self._join(key)
+        if not leader:
+            if wait is not None:
+                wait(future)
+                if not future.done():
+                    return None, True
+            return future.result(), True
+        try:
+            result = fn()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result, False
+
+    async def do_async(self, key, coroutine_fn):
+        """
+        do()のasync版。coroutine_fn()は実行するコルーチンを返す関数。
+        処理を実行中のコルーチンがキャンセルされた場合、待機中の呼び出し元（他のジョブを含む）には
+        キャンセルを伝えず結果をNoneとして返し、それぞれに取得し直させる。
+        """
+        future, leader = self._join(key)
+        if not leader:
+            # 待機側がキャンセルされても、共有するFutureはキャンセルしない
+            return await asyncio.shield(asyncio.wrap_future(future)), True
+        try:
+            result = await coroutine_fn()
+        except asyncio.CancelledError:
+            self._finish(key, future)
+            raise
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result, False
+
+
+def get_single_flight():
+    """現在のアプリケーションのSingleFlightを返す。"""
+    return current_app.extensions['single_flight']
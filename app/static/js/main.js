@@ -15,6 +15,8 @@ document.addEventListener('DOMContentLoaded', () => {
     const searchInput = document.getElementById('area-search-input');
     const selectedAreaIdInput = document.getElementById('selected-area-id');
     const freewordInput = document.getElementById('freeword-input');
+    const incrementalCheckbox = document.getElementById('incremental-checkbox');
+    const prefectureCheckbox = document.getElementById('prefecture-checkbox');
     const optionsList = document.getElementById('area-options-list');
     const options = optionsList.querySelectorAll('.area-option');
     let selectedOption = null;
@@ -224,14 +226,65 @@ document.addEventListener('DOMContentLoaded', () => {
         cancelButton.style.display = 'block';
         cancelButton.disabled = false;
 
-        const areaId = selectedAreaIdInput.value;
+        const params = new URLSearchParams();
+        if (prefectureCheckbox.checked) {
+            // 選択したエリアの都道府県のすべてのエリアを1つのジョブで取得する
+            const selectedOption = optionsList.querySelector(`.area-option[data-value="${selectedAreaIdInput.value}"]`);
+            params.append('prefecture', selectedOption.dataset.prefecture);
+        } else {
+            params.append('area_id', selectedAreaIdInput.value);
+        }
         const freeword = freewordInput.value.trim();
-
-        let scrapeUrl = `/scrape?area_id=${encodeURIComponent(areaId)}`;
         if (freeword) {
-            scrapeUrl += `&freeword=${encodeURIComponent(freeword)}`;
+            params.append('freeword', freeword);
+        }
+        if (incrementalCheckbox.checked) {
+            params.append('incremental', '1');
         }
-        eventSource = new EventSource(scrapeUrl);
+
+        startJob('/scrape/jobs', params)
+            .then((jobId) => {
+                currentJobId = jobId;
+                subscribeScrapeEvents(jobId);
+            })
+            .catch((err) => {
+                statusCard.style.display = 'none';
+                showResultCard(false, 'エラーが発生しました', err.message, null, null, null);
+                resetUI();
+            });
+    });
+
+    // ジョブを登録してjob_idを返す。ジョブはサーバー側で実行され、接続が切れても中断されない
+    function startJob(url, params) {
+        return fetch(url, { method: 'POST', body: params })
+            .then((resp) => resp.json().then((data) => {
+                if (!resp.ok) {
+                    throw new Error(data.error || 'ジョブの開始に失敗しました。');
+                }
+                return data.job_id;
+            }));
+    }
+
+    // 進捗イベントに含まれる現在の同時取得数を「、同時取得数N」の形式で返す
+    function formatConcurrency(progress) {
+        return progress.concurrency ? `、同時取得数${progress.concurrency}` : '';
+    }
+
+    // 進捗イベントに含まれる残り時間の見込みを「、残り約N分」の形式で返す
+    function formatEta(progress) {
+        if (progress.eta_seconds == null || progress.current >= progress.total) return '';
+        if (progress.eta_seconds < 60) return `、残り約${Math.ceil(progress.eta_seconds)}秒`;
+        return `、残り約${Math.ceil(progress.eta_seconds / 60)}分`;
+    }
+
+    function subscribeScrapeEvents(jobId, lastEventId = 0) {
+        // 接続が切れた場合、EventSourceはLast-Event-IDを付けて自動で再接続し、続きのイベントから受信する
+        eventSource = new EventSource(`/jobs/${jobId}/events?last_event_id=${lastEventId}`);
+        ['message', 'search_progress', 'url_progress', 'progress'].forEach((type) => {
+            eventSource.addEventListener(type, (e) => {
+                lastEventId = e.lastEventId || lastEventId;
+            });
+        });
 
         eventSource.addEventListener('job_id', (e) => {
             currentJobId = e.data;
@@ -247,21 +300,45 @@ document.addEventListener('DOMContentLoaded', () => {
             statusDetails.textContent = e.data;
         });
 
+        // 並行実行モードでは一覧と詳細の進捗が交互に届くため、詳細の取得が始まったら詳細側の表示を優先する
+        let detailStarted = false;
+
+        // 複数のエリア・フリーワードを指定した場合、総ページ数を調べた検索の数
+        eventSource.addEventListener('search_progress', (e) => {
+            const progress = JSON.parse(e.data);
+            statusTitle.textContent = '総ページ数を確認中';
+            statusDetails.textContent = `検索ごとの総ページ数を確認しています... (${progress.current}/${progress.total}件${formatConcurrency(progress)})`;
+            if (progress.total > 0) {
+                progressBar.style.width = `${(progress.current / progress.total) * 100}%`;
+            }
+        });
+
         eventSource.addEventListener('url_progress', (e) => {
+            if (detailStarted) return;
             const progress = JSON.parse(e.data);
             statusTitle.textContent = 'URL収集中';
-            statusDetails.textContent = `サロン一覧ページをスキャンしています... (${progress.current}/${progress.total}ページ)`;
+            statusDetails.textContent = `サロン一覧ページをスキャンしています... (${progress.current}/${progress.total}ページ${formatConcurrency(progress)})`;
             if (progress.total > 0) {
                 progressBar.style.width = `${(progress.current / progress.total) * 100}%`;
             }
         });
 
         eventSource.addEventListener('progress', (e) => {
+            detailStarted = true;
             const progress = JSON.parse(e.data);
             statusTitle.textContent = '詳細情報取得中';
-            statusDetails.textContent = `サロン詳細情報を取得しています... (${progress.current}/${progress.total}件)`;
-            if (progress.total > 0) {
-                progressBar.style.width = `${(progress.current / progress.total) * 100}%`;
+            let estimatedTotal = progress.total;
+            if (progress.pages_total) {
+                // 一覧の収集中: 総件数は未確定のため、収集済みページ数から見込み件数を推定する
+                statusDetails.textContent = `サロン詳細情報を取得しています... (${progress.current}/${progress.total}件以上、一覧 ${progress.pages_current}/${progress.pages_total}ページ${formatConcurrency(progress)})`;
+                if (progress.pages_current > 0) {
+                    estimatedTotal = progress.total * progress.pages_total / progress.pages_current;
+                }
+            } else {
+                statusDetails.textContent = `サロン詳細情報を取得しています... (${progress.current}/${progress.total}件${formatEta(progress)}${formatConcurrency(progress)})`;
+            }
+            if (estimatedTotal > 0) {
+                progressBar.style.width = `${Math.min(progress.current / estimatedTotal, 1) * 100}%`;
             }
         });
 
@@ -271,7 +348,7 @@ document.addEventListener('DOMContentLoaded', () => {
             const message = result.excluded_file_name 
                 ? `ファイル名: ${result.file_name}<br>除外リストも生成されました。`
                 : `ファイル名: ${result.file_name}`;
-            showResultCard(true, `処理が正常に完了しました。`, message, result.file_name, result.excluded_file_name, result.preview_data);
+            showResultCard(true, `処理が正常に完了しました。`, message, result.file_name, result.excluded_file_name, result.preview_data, jobId);
             resetUI();
         });
 
@@ -281,7 +358,27 @@ document.addEventListener('DOMContentLoaded', () => {
             resetUI();
         });
 
+        // ジョブを実行していたワーカーが再起動などで停止した場合は、チェックポイントから再開する
+        eventSource.addEventListener('interrupted', (e) => {
+            eventSource.close();
+            const interrupted = JSON.parse(e.data);
+            if (!interrupted.resumable) {
+                statusCard.style.display = 'none';
+                showResultCard(false, 'エラーが発生しました', 'サーバーの処理が途中で停止しました。', null, null, null);
+                resetUI();
+                return;
+            }
+            statusDetails.textContent = 'サーバーの処理が途中で停止したため、チェックポイントから再開しています...';
+            fetch(`/jobs/${jobId}/resume`, { method: 'POST' })
+                .then(() => subscribeScrapeEvents(jobId, lastEventId));
+        });
+
         eventSource.onerror = (e) => {
+            // 接続が切れただけの場合は自動で再接続されるため、エラー表示はしない
+            if (!e.data && eventSource.readyState === EventSource.CONNECTING) {
+                statusDetails.textContent = 'サーバーとの接続が切れました。再接続しています...';
+                return;
+            }
             // キャンセル処理中に発生した接続エラーは、専用ハンドラに任せるため無視する
             if (currentJobId && cancelButton.disabled) {
                 console.log("SSE connection error during cancellation, likely expected. The 'cancelled' event handler will manage the UI.");
@@ -304,7 +401,7 @@ document.addEventListener('DOMContentLoaded', () => {
             showResultCard(false, 'エラーが発生しました', errorMessage, null, null, null);
             resetUI();
         };
-    });
+    }
 
     cancelButton.addEventListener('click', () => {
         if (!currentJobId) return;
@@ -324,7 +421,7 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     });
 
-    function showResultCard(isSuccess, title, message, fileName, excludedFileName, previewData) {
+    function showResultCard(isSuccess, title, message, fileName, excludedFileName, previewData, scrapeJobId) {
         let previewHtml = '';
         if (isSuccess && previewData && previewData.length > 0) {
             const headers = Object.keys(previewData[0]);
@@ -381,6 +478,8 @@ document.addEventListener('DOMContentLoaded', () => {
             const igButton = document.createElement('button');
             igButton.className = 'instagram-search-button';
             igButton.setAttribute('data-target-file', fileName);
+            // スクレイピングジョブの結果を直接使い、サーバー側でExcelファイルを読み直さない
+            if (scrapeJobId) igButton.setAttribute('data-scrape-job-id', scrapeJobId);
             igButton.textContent = 'Instagram検索を実行';
             // ダウンロードリンクの後、プレビューの前に挿入
             const previewContainer = resultCard.querySelector('.preview-container');
@@ -407,10 +506,10 @@ document.addEventListener('DOMContentLoaded', () => {
     resultCard.addEventListener('click', (e) => {
         const button = e.target.closest('.instagram-search-button');
         if (!button) return;
-        startInstagramSearch(button.dataset.targetFile);
+        startInstagramSearch(button.dataset.targetFile, button.dataset.scrapeJobId);
     });
 
-    function startInstagramSearch(targetFile) {
+    function startInstagramSearch(targetFile, scrapeJobId) {
         // ボタンを無効化
         const igButton = resultCard.querySelector('.instagram-search-button');
         if (igButton) {
@@ -427,8 +526,27 @@ document.addEventListener('DOMContentLoaded', () => {
         cancelButton.style.display = 'block';
         cancelButton.disabled = false;
 
-        let igJobId = null;
-        const igEventSource = new EventSource(`/instagram-search?target_file=${encodeURIComponent(targetFile)}`);
+        const params = new URLSearchParams({ target_file: targetFile });
+        if (scrapeJobId) params.set('scrape_job_id', scrapeJobId);
+        startJob('/instagram-search/jobs', params)
+            .then((jobId) => {
+                currentJobId = jobId;
+                subscribeInstagramEvents(jobId, igButton);
+            })
+            .catch((err) => {
+                statusCard.style.display = 'none';
+                cancelButton.style.display = 'none';
+                if (igButton) {
+                    igButton.disabled = false;
+                    igButton.textContent = 'Instagram検索を実行';
+                }
+                showInstagramError(igButton, err.message);
+            });
+    }
+
+    function subscribeInstagramEvents(jobId, igButton) {
+        let igJobId = jobId;
+        const igEventSource = new EventSource(`/jobs/${jobId}/events`);
 
         igEventSource.addEventListener('job_id', (e) => {
             igJobId = e.data;
@@ -443,6 +561,9 @@ document.addEventListener('DOMContentLoaded', () => {
             const progress = JSON.parse(e.data);
             statusTitle.textContent = 'Instagram検索中';
             statusDetails.textContent = `Instagram検索を実行しています... (${progress.current}/${progress.total}件)`;
+            if (progress.saved_queries) {
+                statusDetails.textContent += ` 同名サロンの検索${progress.saved_queries}件を省略`;
+            }
             if (progress.total > 0) {
                 progressBar.style.width = `${(progress.current / progress.total) * 100}%`;
             }
@@ -489,18 +610,15 @@ document.addEventListener('DOMContentLoaded', () => {
                 igButton.disabled = false;
                 igButton.textContent = 'Instagram検索を実行';
             }
-            // エラーメッセージをボタンの下に表示
-            const existingError = resultCard.querySelector('.instagram-error');
-            if (existingError) existingError.remove();
-            const errorDiv = document.createElement('p');
-            errorDiv.className = 'instagram-error';
-            errorDiv.style.color = 'var(--text-secondary-color)';
-            errorDiv.style.fontSize = '0.9rem';
-            errorDiv.textContent = errorMessage;
-            if (igButton) igButton.after(errorDiv);
+            showInstagramError(igButton, errorMessage);
         });
 
-        igEventSource.onerror = () => {
+        igEventSource.onerror = (e) => {
+            // 接続が切れただけの場合は自動で再接続され、続きのイベントから受信する
+            if (!e.data && igEventSource.readyState === EventSource.CONNECTING) {
+                statusDetails.textContent = 'サーバーとの接続が切れました。再接続しています...';
+                return;
+            }
             // SSE接続エラー（サーバーダウン等）
             if (igJobId && cancelButton.disabled) {
                 igEventSource.close();
@@ -517,6 +635,18 @@ document.addEventListener('DOMContentLoaded', () => {
         };
     }
 
+    function showInstagramError(igButton, errorMessage) {
+        // エラーメッセージをボタンの下に表示
+        const existingError = resultCard.querySelector('.instagram-error');
+        if (existingError) existingError.remove();
+        const errorDiv = document.createElement('p');
+        errorDiv.className = 'instagram-error';
+        errorDiv.style.color = 'var(--text-secondary-color)';
+        errorDiv.style.fontSize = '0.9rem';
+        errorDiv.textContent = errorMessage;
+        if (igButton) igButton.after(errorDiv);
+    }
+
     function appendInstagramResult(result) {
         const igButton = resultCard.querySelector('.instagram-search-button');
         if (igButton) {
@@ -526,6 +656,9 @@ document.addEventListener('DOMContentLoaded', () => {
             const msg = document.createElement('p');
             msg.className = 'instagram-result-message';
             msg.textContent = `Instagram検索完了: ${result.found_count}/${result.total_salons}件でURLが見つかりました`;
+            if (result.cache_hits) {
+                msg.textContent += `（${result.cache_hits}件は保存済みの検索結果を使用）`;
+            }
 
             const link = document.createElement('a');
             link.href = `/download/${encodeURIComponent(result.file_name)}`;
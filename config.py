@@ -17,6 +17,19 @@ def _get_env_as_int(key: str, default_value: int) -> int:
     except (ValueError, TypeError):
         return default_value
 
+def _get_env_as_float(key: str, default_value: float) -> float:
+    """
+    環境変数を浮動小数点数として安全に取得する。
+    値が存在しない、または無効な場合はデフォルト値を返す。
+    """
+    value = os.getenv(key)
+    if value is None:
+        return default_value
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return default_value
+
 # プロジェクトのルートディレクトリ
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 
@@ -24,16 +37,70 @@ BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 # 環境変数が設定されていない場合は、開発用のデフォルト値を設定
 SECRET_KEY = os.getenv('SECRET_KEY', 'your-default-secret-key')
 
-# 並列処理の最大ワーカー数
+# 並列処理の最大ワーカー数（同時取得数の上限）
 MAX_WORKERS = _get_env_as_int('MAX_WORKERS', 5)
-# リクエスト間の待機時間 (秒)
+# 同時取得数の自動調整（AIMD）。FETCH_INITIAL_CONCURRENCYから始め、FETCH_CONCURRENCY_WINDOW件のリクエストごとに
+# 応答時間のp95とエラー率が目標内なら1増やし（MAX_WORKERS、asyncエンジンではASYNC_MAX_IN_FLIGHTまで）、
+# 超えていれば半分にする（FETCH_MIN_CONCURRENCYまで）。429/503を受けた場合は即座に半分にする（1秒から倍々の
+# バックオフの間に受けた分では減らさない）。増やす余地を残すため、初期値は上限より小さくする
+FETCH_INITIAL_CONCURRENCY = _get_env_as_int('FETCH_INITIAL_CONCURRENCY', 2)
+FETCH_MIN_CONCURRENCY = _get_env_as_int('FETCH_MIN_CONCURRENCY', 1)
+FETCH_CONCURRENCY_WINDOW = _get_env_as_int('FETCH_CONCURRENCY_WINDOW', 20)
+FETCH_TARGET_P95_SECONDS = _get_env_as_float('FETCH_TARGET_P95_SECONDS', 3.0)
+FETCH_MAX_ERROR_RATE = _get_env_as_float('FETCH_MAX_ERROR_RATE', 0.1)
+# リクエスト失敗後、リトライするまでの待機時間 (秒)
 REQUEST_WAIT_SECONDS = _get_env_as_int('REQUEST_WAIT_SECONDS', 1)
+# 接続先ホストへの送信レート (リクエスト/秒)。同一ホスト上の全ジョブ・全ワーカーで共有する。0で無効
+RATE_LIMIT_PER_SECOND = _get_env_as_float('RATE_LIMIT_PER_SECOND', 5.0)
+# トークンバケットのバースト上限 (連続して待機なしで送信できるリクエスト数)
+RATE_LIMIT_BURST = _get_env_as_int('RATE_LIMIT_BURST', 5)
 # リトライ回数
 RETRY_COUNT = _get_env_as_int('RETRY_COUNT', 3)
+# HTTP取得エンジン ('thread': ThreadPoolExecutor + requests, 'async': asyncio + aiohttp)
+FETCH_ENGINE = os.getenv('FETCH_ENGINE', 'thread')
+# HTMLパーサーバックエンド ('lxml': lxml + cssselect, 'html.parser': BeautifulSoup + 標準ライブラリ)
+HTML_PARSER = os.getenv('HTML_PARSER', 'lxml')
+# asyncエンジンで同時に送信中にできるリクエスト数の上限 (ジョブ全体)
+ASYNC_MAX_IN_FLIGHT = _get_env_as_int('ASYNC_MAX_IN_FLIGHT', 100)
+# HTTPレスポンスキャッシュ (instance_path下のSQLite、全ワーカー共有)。0で無効
+HTTP_CACHE_ENABLED = _get_env_as_int('HTTP_CACHE_ENABLED', 1)
+# ページ種別ごとのキャッシュ有効期間 (秒)。期限切れ後はETag/Last-Modifiedで再検証する
+HTTP_CACHE_TTL_LIST = _get_env_as_int('HTTP_CACHE_TTL_LIST', 3600) # 1時間
+HTTP_CACHE_TTL_DETAIL = _get_env_as_int('HTTP_CACHE_TTL_DETAIL', 86400) # 24時間
+HTTP_CACHE_TTL_PHONE = _get_env_as_int('HTTP_CACHE_TTL_PHONE', 2592000) # 30日
+# キャッシュの最大サイズ (圧縮後のバイト数)。超えた場合は最終アクセスが古い順に削除する
+HTTP_CACHE_MAX_BYTES = _get_env_as_int('HTTP_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+# 差分取得で再取得しないサロン情報の鮮度期間 (日)。salonsテーブルの最終取得日時と比較する
+SALON_FRESHNESS_DAYS = _get_env_as_int('SALON_FRESHNESS_DAYS', 14)
+# 詳細ページ・電話番号ページそれぞれの同時取得数の上限 (0の場合はワーカー数のみで制限)
+DETAIL_MAX_CONCURRENCY = _get_env_as_int('DETAIL_MAX_CONCURRENCY', 0)
+PHONE_MAX_CONCURRENCY = _get_env_as_int('PHONE_MAX_CONCURRENCY', 0)
+# 実行モード ('pipelined': 一覧と詳細の取得を並行実行, 'phased': 一覧をすべて取得してから詳細を取得)
+SCRAPE_MODE = os.getenv('SCRAPE_MODE', 'pipelined')
+
+# 適用する除外ルール (カンマ区切り)。eprp, este_relax, no_phone, single_stylist, related_links から選択
+EXCLUSION_RULES = [
+    name.strip()
+    for name in os.getenv('EXCLUSION_RULES', 'eprp,este_relax,no_phone,single_stylist,related_links').split(',')
+    if name.strip()
+]
+# 関連リンク数がこの値以上のサロンを除外する
+EXCLUSION_RELATED_LINKS_THRESHOLD = _get_env_as_int('EXCLUSION_RELATED_LINKS_THRESHOLD', 4)
+
+# 同時に実行するジョブ（スクレイピング・Instagram検索）の最大数 (ワーカープロセスごと)。超えた分は待機する
+JOB_MAX_WORKERS = _get_env_as_int('JOB_MAX_WORKERS', 4)
+# 終了したジョブの進捗イベントを保持する期間 (秒)
+JOB_RETENTION_SECONDS = _get_env_as_int('JOB_RETENTION_SECONDS', 86400) # 24時間
+# 進捗イベント(progress/url_progress)を送信する最短間隔 (秒)。この間の更新は最新の値にまとめる
+PROGRESS_INTERVAL_SECONDS = _get_env_as_float('PROGRESS_INTERVAL_SECONDS', 0.25)
+# イベントがない間もプロキシに接続を切られないよう、SSEのコメント行を送る間隔 (秒)
+SSE_HEARTBEAT_SECONDS = _get_env_as_int('SSE_HEARTBEAT_SECONDS', 15)
+# スクレイピングジョブの途中経過（収集済みURL・待ち行列・取得済みサロン情報）を保存する間隔 (秒)
+CHECKPOINT_INTERVAL_SECONDS = _get_env_as_int('CHECKPOINT_INTERVAL_SECONDS', 30)
 
-# キャンセルシグナルファイルの有効期間 (秒)
+# キャンセル要求の有効期間 (秒)。これより古い要求は無視する
 CANCEL_FILE_TIMEOUT_SECONDS = _get_env_as_int('CANCEL_FILE_TIMEOUT_SECONDS', 3600) # 1時間
-# 古いキャンセルシグナルファイルをクリーンアップする際の保持期間 (秒)
+# 起動時に古いキャンセル要求をクリーンアップする際の保持期間 (秒)
 STALE_CANCEL_FILE_LIFETIME_SECONDS = _get_env_as_int('STALE_CANCEL_FILE_LIFETIME_SECONDS', 86400) # 24時間
 
 # データベースURI (RenderのDATABASE_URLを優先し、なければローカルのSQLiteを使用)
@@ -46,9 +113,21 @@ if not DATABASE_URI:
 
 # 初期データCSVパス
 AREA_CSV_PATH = os.getenv('AREA_CSV_PATH', 'data/area.csv')
+# スクレイピング対象のCSSセレクタ定義ファイル (更新時刻が変わると次のジョブから読み込み直す)
+SELECTORS_FILE = os.getenv('SELECTORS_FILE', os.path.join(BASE_DIR, 'selectors.json'))
 # 出力ディレクトリ
 OUTPUT_DIR = os.getenv('OUTPUT_DIR', 'output')
 
 # Serper API設定 (Instagram検索機能)
 SERPER_API_KEY = os.getenv('SERPER_API_KEY', '')
-INSTAGRAM_MAX_URLS = _get_env_as_int('INSTAGRAM_MAX_URLS', 3)
\ No newline at end of file
+INSTAGRAM_MAX_URLS = _get_env_as_int('INSTAGRAM_MAX_URLS', 3)
+# Serper APIへの同時リクエスト数の上限 (1から始め、成功が続くとこの値まで増やす)
+INSTAGRAM_MAX_CONCURRENCY = _get_env_as_int('INSTAGRAM_MAX_CONCURRENCY', 4)
+# 429を受けたときに新たなリクエストを止める秒数 (続くたびに倍にし、16秒まで)
+INSTAGRAM_THROTTLE_BACKOFF_SECONDS = _get_env_as_float('INSTAGRAM_THROTTLE_BACKOFF_SECONDS', 1.0)
+# 1回のSerper APIリクエストにまとめるサロン数 (1の場合はサロンごとにリクエストする)
+INSTAGRAM_BATCH_SIZE = _get_env_as_int('INSTAGRAM_BATCH_SIZE', 10)
+# Instagram検索結果をinstagram_searchesテーブルから再利用する有効期間 (日)
+INSTAGRAM_CACHE_TTL_DAYS = _get_env_as_int('INSTAGRAM_CACHE_TTL_DAYS', 30)
+# Instagram URLが見つからなかった検索結果の有効期間 (日)
+INSTAGRAM_CACHE_NEGATIVE_TTL_DAYS = _get_env_as_int('INSTAGRAM_CACHE_NEGATIVE_TTL_DAYS', 3)
\ No newline at end of file
@@ -9,21 +9,34 @@ from app import create_app
 
 
 @pytest.fixture
-def app(tmp_path):
+def html_parser():
+    """使用するHTMLパーサーバックエンド。テストモジュール側でパラメータ化して上書きできる。"""
+    return 'lxml'
+
+
+@pytest.fixture
+def app(tmp_path, html_parser):
     """テスト用Flaskアプリケーションを作成する。"""
     output_dir = str(tmp_path / 'output')
     os.makedirs(output_dir, exist_ok=True)
 
-    # SQLiteのインメモリDBを使用
-    app = create_app(test_config={
+    # SQLiteのインメモリDBを使用し、ジョブやレート制限のSQLiteファイルはtmp_path下に作成する
+    app = create_app(instance_path=str(tmp_path / 'instance'), test_config={
         'TESTING': True,
         'DATABASE_URI': 'sqlite://',
         'SERPER_API_KEY': 'test-api-key',
         'INSTAGRAM_MAX_URLS': 3,
+        # Serper APIのモックはサロンごとのリクエストを前提にする（バッチはtest_instagram_serviceで個別に検証）
+        'INSTAGRAM_BATCH_SIZE': 1,
         'RETRY_COUNT': 3,
         'REQUEST_WAIT_SECONDS': 0,
+        'RATE_LIMIT_PER_SECOND': 0,
+        'HTTP_CACHE_ENABLED': 0,
+        'HTML_PARSER': html_parser,
         'CANCEL_FILE_TIMEOUT_SECONDS': 3600,
         'OUTPUT_DIR': output_dir,
+        # 進捗イベントをまとめず、更新ごとに送信する
+        'PROGRESS_INTERVAL_SECONDS': 0,
     })
 
     yield app
@@ -0,0 +1,61 @@
+import time
+import threading
+
+from app.main.services.cancellation import CancellationRegistry
+
+
+class TestCancellationRegistry:
+    def test_request_in_same_process_is_immediate(self, tmp_path):
+        """同じプロセスで監視中のジョブには、要求した時点でEventとFutureに通知される。"""
+        registry = CancellationRegistry(str(tmp_path), 3600)
+        assert registry.is_cancelled('job1') is False
+        future = registry.future('job1')
+
+        registry.request('job1')
+
+        assert registry.is_cancelled('job1') is True
+        assert future.done()
+
+    def test_request_from_other_process(self, tmp_path):
+        """別のワーカー（別インスタンス）で受け付けた要求も、SQLite経由で通知される。"""
+        registry = CancellationRegistry(str(tmp_path), 3600)
+        other = CancellationRegistry(str(tmp_path), 3600)
+        future = registry.future('job1')
+
+        other.request('job1')
+
+        assert future.result(timeout=5) is True
+        assert registry.is_cancelled('job1') is True
+
+    def test_request_before_watch(self, tmp_path):
+        """監視を始める前に要求されていた場合も、初回の確認でキャンセル済みになる。"""
+        CancellationRegistry(str(tmp_path), 3600).request('job1')
+        assert CancellationRegistry(str(tmp_path), 3600).is_cancelled('job1') is True
+
+    def test_stale_request_ignored(self, tmp_path):
+        """有効期間を過ぎた要求は無視する。"""
+        registry = CancellationRegistry(str(tmp_path), 0)
+        CancellationRegistry(str(tmp_path), 0).request('job1')
+        time.sleep(0.01)
+        assert registry.is_cancelled('job1') is False
+
+    def test_wait_interrupted_by_request(self, tmp_path):
+        """wait()は待機中にキャンセルされると、待機時間を待たずにTrueを返す。"""
+        registry = CancellationRegistry(str(tmp_path), 3600)
+        registry.is_cancelled('job1')
+        threading.Timer(0.05, registry.request, args=('job1',)).start()
+
+        started = time.monotonic()
+        assert registry.wait('job1', 10) is True
+        assert time.monotonic() - started < 5
+        assert registry.wait('job2', 0.01) is False
+
+    def test_release_clears_request(self, tmp_path):
+        """release()後は同じjob_idでもキャンセル済みとして扱わない。"""
+        registry = CancellationRegistry(str(tmp_path), 3600)
+        registry.request('job1')
+        assert registry.is_cancelled('job1') is True
+
+        registry.release('job1')
+
+        assert registry.is_cancelled('job1') is False
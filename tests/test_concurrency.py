@@ -0,0 +1,123 @@
+import threading
+
+from app.main.services.concurrency import AdaptiveConcurrency, LatencyAwareConcurrency
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestAdaptiveConcurrency:
+    def test_limit_bounds_acquire(self):
+        """上限数の実行枠を取得すると、releaseされるまで次の取得は待たされる。"""
+        limiter = AdaptiveConcurrency(2)
+        assert limiter.acquire(timeout=0) is True
+        assert limiter.acquire(timeout=0) is True
+        assert limiter.acquire(timeout=0) is False
+
+        limiter.release()
+
+        assert limiter.acquire(timeout=0) is True
+
+    def test_additive_increase(self):
+        """上限と同じ件数の成功が続くごとに上限を1増やし、maximumを超えない。"""
+        limiter = AdaptiveConcurrency(1, maximum=3)
+        limiter.record_success()
+        assert limiter.limit == 2
+        limiter.record_success()
+        assert limiter.limit == 2
+        limiter.record_success()
+        assert limiter.limit == 3
+        for _ in range(10):
+            limiter.record_success()
+        assert limiter.limit == 3
+
+    def test_throttle_halves_limit_and_backs_off(self):
+        """スロットリングで上限を半分にし、連続するたびにバックオフを倍にする。成功すると元に戻る。"""
+        clock = FakeClock()
+        limiter = AdaptiveConcurrency(8, minimum=1, backoff_seconds=1, max_backoff_seconds=4, clock=clock)
+
+        assert limiter.record_throttled() == 1
+        assert limiter.limit == 4
+        assert limiter.record_throttled() == 2
+        assert limiter.record_throttled() == 4
+        assert limiter.record_throttled() == 4
+        assert limiter.limit == 1
+
+        limiter.record_success()
+        assert limiter.record_throttled() == 1
+
+    def test_acquire_waits_for_backoff(self):
+        """バックオフ中は空き枠があっても取得できない。"""
+        clock = FakeClock()
+        limiter = AdaptiveConcurrency(4, backoff_seconds=5, clock=clock)
+        limiter.record_throttled()
+
+        assert limiter.acquire(timeout=0) is False
+        clock.now = 5.0
+        assert limiter.acquire(timeout=0) is True
+
+    def test_release_wakes_waiter(self):
+        """待機中の取得は、他のスレッドのreleaseで再開する。"""
+        limiter = AdaptiveConcurrency(1)
+        limiter.acquire()
+        threading.Timer(0.05, limiter.release).start()
+
+        assert limiter.acquire(timeout=5) is True
+
+
+class TestLatencyAwareConcurrency:
+    def _controller(self, initial=4):
+        return LatencyAwareConcurrency(initial, target_p95_seconds=1.0, max_error_rate=0.1, window=10, maximum=6)
+
+    def test_increases_while_healthy(self):
+        """window件ごとに、p95とエラー率が目標内なら上限を1増やす（maximumまで）。"""
+        controller = self._controller()
+        for _ in range(9):
+            controller.record(0.2)
+        assert controller.limit == 4
+        controller.record(0.2)
+        assert controller.limit == 5
+        for _ in range(30):
+            controller.record(0.2)
+        assert controller.limit == 6
+
+    def test_slow_p95_halves_limit(self):
+        """応答時間のp95が目標を超えると上限を半分にする。"""
+        controller = self._controller()
+        for _ in range(9):
+            controller.record(0.2)
+        controller.record(5.0)
+        assert controller.limit == 2
+        assert controller.last_p95_seconds == 5.0
+
+    def test_error_rate_halves_limit(self):
+        """エラー率が上限を超えると上限を半分にする。"""
+        controller = self._controller()
+        for i in range(10):
+            controller.record(0.2, error=i < 2)
+        assert controller.limit == 2
+        assert controller.last_error_rate == 0.2
+
+    def test_throttle_halves_immediately(self):
+        """スロットリングはwindowを待たずに上限を半分にする。"""
+        controller = self._controller()
+        controller.record_throttled()
+        assert controller.limit == 2
+
+    def test_throttle_burst_halves_once(self):
+        """バックオフ中に続けて受けたスロットリングでは上限を変えず、バックオフ後に受けた分でまた半分にする。"""
+        clock = FakeClock()
+        controller = LatencyAwareConcurrency(
+            8, target_p95_seconds=1.0, max_error_rate=0.1, backoff_seconds=1, clock=clock
+        )
+        assert [controller.record_throttled() for _ in range(5)] == [1, 1, 1, 1, 1]
+        assert controller.limit == 4
+
+        clock.now = 1.5
+        assert controller.record_throttled() == 2
+        assert controller.limit == 2
@@ -0,0 +1,104 @@
+import os
+import re
+
+import pandas as pd
+
+from app.main.services.excel_writer import SalonListWriter, build_file_name, TARGET_COLUMNS, EXCLUDED_COLUMNS
+from app.main.services.exclusion_rules import ExclusionRules
+from app.main.services.result_files import render_download
+
+
+def _record(n, phone='03-0000-0000', **overrides):
+    record = {
+        'サロン名': f'サロン{n}',
+        '電話番号': phone,
+        '住所': '東京都渋谷区1-1',
+        'スタッフ数': 'スタイリスト3人',
+        '関連リンク': '',
+        '関連リンク数': 0,
+        'サロンURL': f'https://beauty.hotpepper.jp/slnH00000000{n}/',
+        'has_special_feature': True,
+    }
+    record.update(overrides)
+    return record
+
+
+class TestSalonListWriter:
+    def test_writes_target_and_excluded_in_one_pass(self, tmp_path):
+        """到着順に重複を除き、営業対象リストと除外リストへ振り分けて書き込む。"""
+        writer = SalonListWriter(str(tmp_path), 'エリア', None, ExclusionRules(), batch_size=2)
+        writer.append(_record(1))
+        writer.append(_record(2, phone=''))
+        writer.append(_record(1))  # 重複
+        writer.append(_record(3, has_special_feature=False))
+        writer.append(_record(4))
+        file_name, excluded_file_name = writer.close()
+
+        assert (len(writer), writer.duplicates, writer.target_count, writer.excluded_count) == (5, 1, 2, 2)
+        target = pd.read_excel(render_download(str(tmp_path), file_name), sheet_name='サロンリスト')
+        assert list(target.columns) == TARGET_COLUMNS
+        assert list(target['サロン名']) == ['サロン1', 'サロン4']
+        excluded = pd.read_excel(render_download(str(tmp_path), excluded_file_name), sheet_name='除外リスト')
+        assert list(excluded.columns) == EXCLUDED_COLUMNS
+        assert list(excluded['除外理由']) == ['電話番号なし', 'EPRP']
+        assert excluded_file_name == f'除外リスト_{file_name}'
+        assert [row['サロン名'] for row in writer.preview] == ['サロン1', 'サロン4']
+
+    def test_no_excluded_file_without_excluded_salons(self, tmp_path):
+        """除外対象がなければ除外リストは作成しない。空でも営業対象リストはヘッダー付きで作成する。"""
+        writer = SalonListWriter(str(tmp_path), 'エリア', '髪質改善', ExclusionRules())
+        file_name, excluded_file_name = writer.close()
+        assert excluded_file_name is None
+        assert file_name.startswith('エリア_髪質改善_')
+        assert os.listdir(tmp_path) == [file_name.replace('.xlsx', '.parquet')]
+        assert list(pd.read_excel(render_download(str(tmp_path), file_name)).columns) == TARGET_COLUMNS
+
+    def test_extra_columns_come_first(self, tmp_path):
+        """extra_columnsのカラムは両方のリストでTARGET_COLUMNSの前に出力する。"""
+        writer = SalonListWriter(str(tmp_path), 'エリア', None, ExclusionRules(), extra_columns=['エリア'])
+        writer.append(_record(1, エリア='渋谷'))
+        writer.append(_record(2, phone='', エリア='新宿'))
+        file_name, excluded_file_name = writer.close()
+
+        target = pd.read_excel(render_download(str(tmp_path), file_name))
+        assert list(target.columns) == ['エリア'] + TARGET_COLUMNS
+        assert list(target['エリア']) == ['渋谷']
+        excluded = pd.read_excel(render_download(str(tmp_path), excluded_file_name))
+        assert list(excluded.columns[:2]) == ['除外理由', 'エリア']
+
+    def test_discard_leaves_no_files(self, tmp_path):
+        """中断時は書きかけのファイルを残さない。"""
+        writer = SalonListWriter(str(tmp_path), 'エリア', None, ExclusionRules(), batch_size=1)
+        writer.append(_record(1))
+        writer.append(_record(2, phone=''))
+        writer.discard()
+        assert os.listdir(tmp_path) == []
+
+
+class TestBuildFileName:
+    def test_target_filename_with_freeword(self):
+        """freeword指定時、ファイル名に {area}_{freeword}_ が含まれる。"""
+        name = build_file_name('青山・表参道・原宿', '髪質改善')
+        assert name.startswith('青山・表参道・原宿_髪質改善_')
+        assert name.endswith('.xlsx')
+
+    def test_excluded_filename_with_freeword(self, tmp_path):
+        """除外リストも 除外リスト_{area}_{freeword}_ の形になる。"""
+        writer = SalonListWriter(str(tmp_path), 'エリア', '髪質改善', ExclusionRules())
+        assert writer.excluded_file_name.startswith('除外リスト_エリア_髪質改善_')
+        assert writer.excluded_file_name == f'除外リスト_{writer.file_name}'
+        writer.discard()
+
+    def test_filename_sanitizes_freeword(self):
+        """freeword中のファイル名禁止文字が除去される。"""
+        name = build_file_name('エリア', '髪/質:改善')
+        assert '/' not in name and ':' not in name
+        assert name.startswith('エリア_髪質改善_')
+
+    def test_symbol_only_freeword_falls_back(self):
+        """サニタイズ後に空になるfreewordはfreewordなしのファイル名にフォールバックする。"""
+        assert re.match(r'^エリア_\d{8}_\d{6}\.xlsx$', build_file_name('エリア', '///'))
+
+    def test_no_freeword_filename_unchanged(self):
+        """freeword未指定時は従来通り {area}_{timestamp}.xlsx（後方互換）。"""
+        assert re.match(r'^エリア_\d{8}_\d{6}\.xlsx$', build_file_name('エリア', None))
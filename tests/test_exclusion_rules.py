@@ -0,0 +1,66 @@
+import pandas as pd
+import pytest
+
+from app.main.services.exclusion_rules import ExclusionRules
+
+
+def _df(**overrides):
+    row = {
+        'サロン名': 'A',
+        '電話番号': '03-0000-0000',
+        'スタッフ数': 'スタイリスト3人',
+        '関連リンク数': 0,
+        'サロンURL': 'https://beauty.hotpepper.jp/slnH000000001/',
+        'has_special_feature': True,
+    }
+    row.update(overrides)
+    return pd.DataFrame([row])
+
+
+class TestExclusionRules:
+    def test_target_salon_not_excluded(self):
+        df = ExclusionRules().apply(_df())
+        assert not df.loc[0, 'is_excluded']
+        assert df.loc[0, 'exclusion_reason'] == ''
+
+    @pytest.mark.parametrize('overrides, reason', [
+        ({'has_special_feature': False}, 'EPRP'),
+        ({'サロンURL': 'https://beauty.hotpepper.jp/kr/slnH000000001/'}, 'エステ/リラク'),
+        ({'電話番号': ' '}, '電話番号なし'),
+        ({'スタッフ数': 'スタイリスト1人'}, 'スタッフ数'),
+        ({'スタッフ数': 'スタイリスト：1名'}, 'スタッフ数'),
+        ({'スタッフ数': 'スタイリスト 1 人'}, 'スタッフ数'),
+        ({'関連リンク数': 4}, '関連リンク数'),
+    ])
+    def test_each_rule(self, overrides, reason):
+        df = ExclusionRules().apply(_df(**overrides))
+        assert df.loc[0, 'is_excluded']
+        assert df.loc[0, 'exclusion_reason'] == reason
+
+    @pytest.mark.parametrize('staff', ['スタイリスト1人 アシスタント1人', 'スタイリスト10人', 'スタイリスト11人', ''])
+    def test_staff_not_excluded(self, staff):
+        assert not ExclusionRules().apply(_df(スタッフ数=staff)).loc[0, 'is_excluded']
+
+    def test_reasons_in_fixed_order(self):
+        """除外理由は従来と同じ順序でカンマ区切りに並ぶ。"""
+        df = ExclusionRules().apply(_df(関連リンク数=5, 電話番号='', has_special_feature=False))
+        assert df.loc[0, 'exclusion_reason'] == 'EPRP, 電話番号なし, 関連リンク数'
+
+    def test_configurable_rules(self):
+        """無効にしたルールでは除外せず、しきい値も変更できる。"""
+        rules = ExclusionRules(['no_phone', 'related_links'], related_links_threshold=10)
+        df = rules.apply(_df(関連リンク数=5, has_special_feature=False))
+        assert not df.loc[0, 'is_excluded']
+
+    def test_unknown_rule(self):
+        with pytest.raises(ValueError):
+            ExclusionRules(['unknown'])
+
+    def test_missing_feature_columns(self):
+        """特徴量の列がない・値が欠損している場合も判定できる。"""
+        df = pd.DataFrame([
+            {'サロンURL': 'https://beauty.hotpepper.jp/slnH000000001/', '電話番号': '03'},
+            {'サロンURL': None, '電話番号': None},
+        ])
+        df = ExclusionRules().apply(df)
+        assert df['exclusion_reason'].tolist() == ['', '電話番号なし']
@@ -0,0 +1,88 @@
+import os
+import json
+
+import pytest
+
+from app.main.services.extraction_plan import ExtractionPlan, get_extraction_plan
+from app.main.services.html_parser import get_parser
+
+SELECTORS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'selectors.json')
+
+
+@pytest.fixture
+def selectors_file(tmp_path):
+    """selectors.jsonのコピーを作成し、そのパスを返す。"""
+    with open(SELECTORS_PATH, encoding='utf-8') as f:
+        selectors = json.load(f)
+    path = tmp_path / 'selectors.json'
+    path.write_text(json.dumps(selectors), encoding='utf-8')
+    return path
+
+
+def _touch(path, selectors):
+    """内容を書き換え、更新時刻を確実に進める。"""
+    stat = os.stat(path)
+    path.write_text(json.dumps(selectors), encoding='utf-8')
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+class TestGetExtractionPlan:
+    def test_plan_shared_until_file_changes(self, selectors_file):
+        """ファイルが変わらない限り同じプランを返し、更新時刻が変わると読み込み直す。"""
+        plan = get_extraction_plan(str(selectors_file), 'lxml')
+        assert get_extraction_plan(str(selectors_file), 'lxml') is plan
+
+        selectors = dict(plan.selectors, phone_page={'phone_number': 'span.tel'})
+        _touch(selectors_file, selectors)
+        reloaded = get_extraction_plan(str(selectors_file), 'lxml')
+        assert reloaded is not plan
+        assert reloaded.selectors['phone_page']['phone_number'] == 'span.tel'
+
+    def test_plan_per_backend(self, selectors_file):
+        """パーサーバックエンドごとに別のプランを構築する。"""
+        lxml_plan = get_extraction_plan(str(selectors_file), 'lxml')
+        bs_plan = get_extraction_plan(str(selectors_file), 'html.parser')
+        assert lxml_plan is not bs_plan
+        assert bs_plan.parser.name == 'html.parser'
+
+    def test_broken_file_keeps_previous_plan(self, selectors_file):
+        """書き換えたファイルが不正な場合は、前回のプランを使い続ける。"""
+        plan = get_extraction_plan(str(selectors_file), 'lxml')
+        _touch(selectors_file, {'area_page': {}})
+        assert get_extraction_plan(str(selectors_file), 'lxml') is plan
+
+    def test_missing_file_keeps_previous_plan(self, selectors_file):
+        """保存処理中などでファイルが一時的に存在しない場合も、前回のプランを使い続ける。"""
+        plan = get_extraction_plan(str(selectors_file), 'lxml')
+        os.remove(selectors_file)
+        assert get_extraction_plan(str(selectors_file), 'lxml') is plan
+
+
+@pytest.mark.parametrize('backend', ['lxml', 'html.parser'])
+class TestSalonFields:
+    def _plan(self, backend):
+        with open(SELECTORS_PATH, encoding='utf-8') as f:
+            return ExtractionPlan(json.load(f), get_parser(backend))
+
+    def test_th_values_from_single_table_scan(self, backend):
+        """住所・スタッフ数を1回のテーブル走査で取り出す（最初に一致したthを優先）。"""
+        plan = self._plan(backend)
+        doc = plan.parse(
+            '<table class="slnDataTbl">'
+            '<tr><th>住所</th><td>東京都 <span>渋谷区</span></td></tr>'
+            '<tr><th><span>スタッフ数</span></th><td>スタイリスト2人</td></tr>'
+            '<tr><th>住所（別館）</th><td>大阪府</td></tr>'
+            '</table>'.encode('utf-8'), 'utf-8'
+        )
+        fields = plan.salon_fields(doc)
+        assert fields['address'] == '東京都 渋谷区'
+        assert fields['staff_count'] == 'スタイリスト2人'
+
+    def test_missing_elements(self, backend):
+        """要素がないページでは空の値を返す。"""
+        plan = self._plan(backend)
+        fields = plan.salon_fields(plan.parse(b'<html><body><p>x</p></body></html>', 'utf-8'))
+        assert fields == {
+            'name': '', 'address': '', 'staff_count': '', 'related_links': [],
+            'phone_page_href': None, 'has_special_feature': False,
+        }
@@ -0,0 +1,87 @@
+import itertools
+import zlib
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from app.main.services.http_cache import HttpCache
+
+TTLS = {'list': 60, 'detail': 600, 'phone': 3600}
+
+
+def _response(url, body=b'<html>ok</html>', headers=None):
+    response = MagicMock()
+    response.url = url
+    response.content = body
+    response.encoding = 'utf-8'
+    response.headers = headers or {}
+    return response
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return HttpCache(str(tmp_path), TTLS, max_bytes=10 * 1024 * 1024)
+
+
+class TestHttpCache:
+    def test_store_and_hit(self, cache):
+        """保存したレスポンスを同じ本文・最終URLで返し、ヒットとして数える。"""
+        cache.store('https://example.com/a', 'detail', _response('https://example.com/a/'), elapsed=0.5)
+        entry = cache.lookup('https://example.com/a')
+
+        assert cache.is_fresh(entry, 'detail')
+        response = cache.hit('https://example.com/a', entry)
+        assert response.text == '<html>ok</html>'
+        assert response.url == 'https://example.com/a/'
+        assert cache.stats() == {'hits': 1, 'revalidated': 0, 'misses': 1, 'saved_seconds': 0.5}
+
+    def test_body_is_compressed(self, cache):
+        """本文は圧縮して保存される。"""
+        body = b'<html>' + b'x' * 10000 + b'</html>'
+        cache.store('https://example.com/a', 'list', _response('https://example.com/a', body), elapsed=0.1)
+        entry = cache.lookup('https://example.com/a')
+        assert len(entry['body']) < len(body)
+        assert zlib.decompress(entry['body']) == body
+
+    def test_ttl_per_page_type(self, cache):
+        """ページ種別ごとのTTLで鮮度を判定する。"""
+        cache.store('https://example.com/a', 'list', _response('https://example.com/a'), elapsed=0.1)
+        entry = cache.lookup('https://example.com/a')
+        with patch.object(cache, '_clock', return_value=entry['stored_at'] + 120):
+            assert not cache.is_fresh(entry, 'list')
+            assert cache.is_fresh(entry, 'phone')
+
+    def test_conditional_headers(self, cache):
+        """ETag/Last-Modifiedがあれば再検証用ヘッダーを返す。"""
+        headers = {'ETag': '"v1"', 'Last-Modified': 'Wed, 01 Jan 2025 00:00:00 GMT'}
+        cache.store('https://example.com/a', 'list', _response('https://example.com/a', headers=headers), elapsed=0.1)
+        entry = cache.lookup('https://example.com/a')
+        assert cache.conditional_headers(entry) == {
+            'If-None-Match': '"v1"',
+            'If-Modified-Since': 'Wed, 01 Jan 2025 00:00:00 GMT',
+        }
+
+    def test_revalidation_refreshes_entry(self, cache):
+        """304による再検証でstored_atが更新され、revalidatedとして数える。"""
+        cache.store('https://example.com/a', 'list', _response('https://example.com/a'), elapsed=0.1)
+        entry = cache.lookup('https://example.com/a')
+        with patch.object(cache, '_clock', return_value=entry['stored_at'] + 120):
+            cache.hit('https://example.com/a', entry, revalidated=True)
+        assert cache.lookup('https://example.com/a')['stored_at'] == entry['stored_at'] + 120
+        assert cache.stats()['revalidated'] == 1
+
+    def test_lru_eviction(self, tmp_path):
+        """容量を超えると最終アクセスが古いエントリから削除される。"""
+        body = bytes(range(256)) * 40  # 圧縮が効きにくい本文
+        size = len(zlib.compress(body))
+        # 呼び出しごとに1秒進む時計（他のスレッドのtime.timeには影響しない）
+        cache = HttpCache(str(tmp_path), TTLS, max_bytes=size * 2, clock=itertools.count(1.0).__next__)
+        cache.store('https://example.com/old', 'list', _response('https://example.com/old', body), elapsed=0.1)
+        cache.store('https://example.com/mid', 'list', _response('https://example.com/mid', body), elapsed=0.1)
+        cache.hit('https://example.com/old', cache.lookup('https://example.com/old'))
+        cache.store('https://example.com/new', 'list', _response('https://example.com/new', body), elapsed=0.1)
+
+        assert cache.evict() == 1
+        assert cache.lookup('https://example.com/mid') is None
+        assert cache.lookup('https://example.com/old') is not None
+        assert cache.lookup('https://example.com/new') is not None
@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from app.db import get_db, instagram_searches_table
+from app.main.services.instagram_cache import InstagramSearchCache, normalize_search_key
+
+
+def _age(search_key, days):
+    """保存済みの検索結果の検索日時をdays日前にする。"""
+    db = get_db()
+    db.execute(
+        update(instagram_searches_table)
+        .where(instagram_searches_table.c.search_key == search_key)
+        .values(searched_at=datetime.now() - timedelta(days=days))
+    )
+    db.commit()
+
+
+class TestNormalizeSearchKey:
+    def test_nfkc_and_whitespace(self):
+        """全角・半角や空白の違いだけのサロン名は同じキーになる。"""
+        assert normalize_search_key('ＨＡＩＲ　salon  Ａ ', 'jp', 'ja') == normalize_search_key('HAIR salon A', 'jp', 'ja')
+
+    def test_includes_locale(self):
+        """検索の国・言語が異なれば別のキーになる。"""
+        assert normalize_search_key('サロンA', 'jp', 'ja') != normalize_search_key('サロンA', 'us', 'en')
+
+
+class TestInstagramSearchCache:
+    def test_round_trip(self, app_context):
+        """保存した検索結果を読み出せる。保存していないキーは含まれない。"""
+        cache = InstagramSearchCache(ttl_days=30, negative_ttl_days=3)
+        assert cache.save({'a': ['https://www.instagram.com/a/'], 'b': []}) == 2
+
+        assert cache.load({'a', 'b', 'c'}) == {'a': ['https://www.instagram.com/a/'], 'b': []}
+
+    def test_negative_result_expires_sooner(self, app_context):
+        """見つからなかった結果は、見つかった結果より短い有効期間で期限切れになる。"""
+        cache = InstagramSearchCache(ttl_days=30, negative_ttl_days=3)
+        cache.save({'a': ['https://www.instagram.com/a/'], 'b': []})
+        _age('a', 5)
+        _age('b', 5)
+
+        assert cache.load({'a', 'b'}) == {'a': ['https://www.instagram.com/a/']}
+
+        _age('a', 31)
+        assert cache.load({'a'}) == {}
+
+    def test_save_overwrites(self, app_context):
+        """同じキーで保存すると結果と検索日時を上書きする。"""
+        cache = InstagramSearchCache(ttl_days=30, negative_ttl_days=3)
+        cache.save({'b': []})
+        _age('b', 5)
+        cache.save({'b': ['https://www.instagram.com/b/']})
+
+        assert cache.load({'b'}) == {'b': ['https://www.instagram.com/b/']}
@@ -1,12 +1,15 @@
 import json
 import os
-import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from unittest.mock import patch, MagicMock
 
 import pandas as pd
 import pytest
 
+from app.main.services.concurrency import AdaptiveConcurrency
 from app.main.services.instagram_service import InstagramSearchService, SerperAPIError
+from app.main.services.result_files import render_download, result_path, write_result
 
 
 def _make_serper_response(organic_results, status_code=200):
@@ -42,6 +45,73 @@ def _collect_sse_events(generator):
     return events
 
 
+def _bare_service(app_context, concurrency=None, **config):
+    """__init__を呼ばずにInstagramSearchServiceを組み立てるヘルパー。configで設定値を上書きできる。"""
+    with patch.object(InstagramSearchService, '__init__', lambda self: None):
+        service = InstagramSearchService()
+    service.config = {**app_context.config, **config}
+    service.session = MagicMock()
+    service.instance_path = app_context.instance_path
+    service.cancellation = app_context.extensions['cancellation']
+    service.logger = app_context.logger
+    service.max_urls = 3
+    service.concurrency = concurrency or AdaptiveConcurrency(1, maximum=4, backoff_seconds=0)
+    service._fatal_error = None
+    return service
+
+
+class _StubSerperHandler(BaseHTTPRequestHandler):
+    """
+    Serper APIを模したハンドラ。クエリの配列を受け取ると、同じ順の結果の配列を返す。
+    サロン名に「エラー」を含むクエリは、バッチ内では結果（organic）を返さない。
+    """
+    requests = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        _StubSerperHandler.requests.append(body)
+        if isinstance(body, list):
+            data = [self._result(query, in_batch=True) for query in body]
+        else:
+            data = self._result(body, in_batch=False)
+        encoded = json.dumps(data).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    @staticmethod
+    def _result(query, in_batch):
+        name = query['q'].split()[0]
+        if in_batch and 'エラー' in name:
+            return {'message': 'Query failed'}
+        return {'organic': [{'title': 'IG', 'link': f'https://www.instagram.com/{name}/', 'snippet': '...'}]}
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_serper():
+    """Serper APIを模したローカルHTTPサーバーを起動し、受け取ったリクエストのリストを返す。"""
+    _StubSerperHandler.requests = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StubSerperHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    with patch.object(InstagramSearchService, 'SERPER_SEARCH_URL', f'http://127.0.0.1:{server.server_address[1]}/search'):
+        yield _StubSerperHandler.requests
+    server.shutdown()
+    server.server_close()
+
+
+def _write_salon_excel(app, names):
+    """サロン名だけのExcelファイルを作成し、ファイル名を返す。"""
+    file_name = '五所川原_20260319_170000.xlsx'
+    pd.DataFrame({'サロン名': names}).to_excel(os.path.join(app.config['OUTPUT_DIR'], file_name), index=False)
+    return file_name
+
+
 # --- _search_instagram ---
 
 class TestSearchInstagram:
@@ -54,16 +124,10 @@ class TestSearchInstagram:
         ]
         mock_resp = _make_serper_response(organic)
 
-        with patch.object(InstagramSearchService, '__init__', lambda self: None):
-            service = InstagramSearchService()
-            service.config = app_context.config
-            service.session = MagicMock()
-            service.session.post.return_value = mock_resp
-            service.instance_path = app_context.instance_path
-            service.logger = app_context.logger
-            service.max_urls = 3
+        service = _bare_service(app_context)
+        service.session.post.return_value = mock_resp
 
-            urls = service._search_instagram('サロンA', 'test-job-id')
+        urls = service._search_instagram('サロンA', 'test-job-id')
 
         assert urls == [
             'https://www.instagram.com/salon_a/',
@@ -78,16 +142,10 @@ class TestSearchInstagram:
         ]
         mock_resp = _make_serper_response(organic)
 
-        with patch.object(InstagramSearchService, '__init__', lambda self: None):
-            service = InstagramSearchService()
-            service.config = app_context.config
-            service.session = MagicMock()
-            service.session.post.return_value = mock_resp
-            service.instance_path = app_context.instance_path
-            service.logger = app_context.logger
-            service.max_urls = 3
+        service = _bare_service(app_context)
+        service.session.post.return_value = mock_resp
 
-            urls = service._search_instagram('サロンA', 'test-job-id')
+        urls = service._search_instagram('サロンA', 'test-job-id')
 
         assert urls == []
 
@@ -99,16 +157,10 @@ class TestSearchInstagram:
         ]
         mock_resp = _make_serper_response(organic)
 
-        with patch.object(InstagramSearchService, '__init__', lambda self: None):
-            service = InstagramSearchService()
-            service.config = app_context.config
-            service.session = MagicMock()
-            service.session.post.return_value = mock_resp
-            service.instance_path = app_context.instance_path
-            service.logger = app_context.logger
-            service.max_urls = 3
+        service = _bare_service(app_context)
+        service.session.post.return_value = mock_resp
 
-            urls = service._search_instagram('サロンA', 'test-job-id')
+        urls = service._search_instagram('サロンA', 'test-job-id')
 
         assert len(urls) == 3
 
@@ -117,38 +169,26 @@ class TestSearchInstagram:
         mock_resp = MagicMock()
         mock_resp.status_code = 401
 
-        with patch.object(InstagramSearchService, '__init__', lambda self: None):
-            service = InstagramSearchService()
-            service.config = app_context.config
-            service.session = MagicMock()
-            service.session.post.return_value = mock_resp
-            service.instance_path = app_context.instance_path
-            service.logger = app_context.logger
-            service.max_urls = 3
+        service = _bare_service(app_context)
+        service.session.post.return_value = mock_resp
 
-            with pytest.raises(SerperAPIError, match='APIキーが無効'):
-                service._search_instagram('サロンA', 'test-job-id')
+        with pytest.raises(SerperAPIError, match='APIキーが無効'):
+            service._search_instagram('サロンA', 'test-job-id')
 
     def test_credit_exhausted_raises(self, app_context):
         """402エラー時にSerperAPIErrorを発生させる。"""
         mock_resp = MagicMock()
         mock_resp.status_code = 402
 
-        with patch.object(InstagramSearchService, '__init__', lambda self: None):
-            service = InstagramSearchService()
-            service.config = app_context.config
-            service.session = MagicMock()
-            service.session.post.return_value = mock_resp
-            service.instance_path = app_context.instance_path
-            service.logger = app_context.logger
-            service.max_urls = 3
+        service = _bare_service(app_context)
+        service.session.post.return_value = mock_resp
 
-            with pytest.raises(SerperAPIError, match='クレジットが不足'):
-                service._search_instagram('サロンA', 'test-job-id')
+        with pytest.raises(SerperAPIError, match='クレジットが不足'):
+            service._search_instagram('サロンA', 'test-job-id')
 
     @patch('app.main.services.instagram_service.time.sleep')
     def test_rate_limit_retry(self, mock_sleep, app_context):
-        """429エラー時に指数バックオフでリトライし、成功する。"""
+        """429エラー時は同時実行数を減らし、バックオフ後にリトライして成功する。"""
         rate_limited_resp = MagicMock()
         rate_limited_resp.status_code = 429
 
@@ -156,40 +196,28 @@ class TestSearchInstagram:
             {'title': 'IG', 'link': 'https://www.instagram.com/salon/', 'snippet': '...'},
         ])
 
-        with patch.object(InstagramSearchService, '__init__', lambda self: None):
-            service = InstagramSearchService()
-            service.config = app_context.config
-            service.session = MagicMock()
-            service.session.post.side_effect = [rate_limited_resp, rate_limited_resp, success_resp]
-            service.instance_path = app_context.instance_path
-            service.logger = app_context.logger
-            service.max_urls = 3
+        service = _bare_service(app_context, concurrency=AdaptiveConcurrency(4, backoff_seconds=0.01))
+        service.session.post.side_effect = [rate_limited_resp, rate_limited_resp, success_resp]
 
-            urls = service._search_instagram('サロンA', 'test-job-id')
+        urls = service._search_instagram('サロンA', 'test-job-id')
 
         assert urls == ['https://www.instagram.com/salon/']
-        # 429リトライで2回sleep、指数バックオフ: 1s, 2s
-        assert mock_sleep.call_count == 2
-        mock_sleep.assert_any_call(1)
-        mock_sleep.assert_any_call(2)
+        # 429ごとに上限を半分にし (4 → 2 → 1)、成功すると1つ増やす
+        assert service.concurrency.limit == 2
+        # バックオフはスレッドを止めるsleepではなく、実行枠の待機で行う
+        mock_sleep.assert_not_called()
 
     @patch('app.main.services.instagram_service.time.sleep')
     def test_network_error_retry_then_empty(self, mock_sleep, app_context):
-        """ネットワークエラーがRETRY_COUNT回続くと空リストを返す。"""
+        """ネットワークエラーがRETRY_COUNT回続くとNoneを返す（見つからなかった場合と区別する）。"""
         from requests.exceptions import ConnectionError
 
-        with patch.object(InstagramSearchService, '__init__', lambda self: None):
-            service = InstagramSearchService()
-            service.config = {**app_context.config, 'RETRY_COUNT': 2}
-            service.session = MagicMock()
-            service.session.post.side_effect = ConnectionError('connection refused')
-            service.instance_path = app_context.instance_path
-            service.logger = app_context.logger
-            service.max_urls = 3
+        service = _bare_service(app_context, RETRY_COUNT=2)
+        service.session.post.side_effect = ConnectionError('connection refused')
 
-            urls = service._search_instagram('サロンA', 'test-job-id')
+        urls = service._search_instagram('サロンA', 'test-job-id')
 
-        assert urls == []
+        assert urls is None
         assert service.session.post.call_count == 2
 
     @patch('app.main.services.instagram_service.time.sleep')
@@ -204,17 +232,11 @@ class TestSearchInstagram:
             {'title': 'IG', 'link': 'https://www.instagram.com/salon/', 'snippet': '...'},
         ])
 
-        with patch.object(InstagramSearchService, '__init__', lambda self: None):
-            service = InstagramSearchService()
-            service.config = {**app_context.config, 'RETRY_COUNT': 1}
-            service.session = MagicMock()
-            # 429 → 429 → success: ネットワークリトライ0回なのでRETRY_COUNT=1でも成功する
-            service.session.post.side_effect = [rate_limited_resp, rate_limited_resp, success_resp]
-            service.instance_path = app_context.instance_path
-            service.logger = app_context.logger
-            service.max_urls = 3
+        service = _bare_service(app_context, RETRY_COUNT=1)
+        # 429 → 429 → success: ネットワークリトライ0回なのでRETRY_COUNT=1でも成功する
+        service.session.post.side_effect = [rate_limited_resp, rate_limited_resp, success_resp]
 
-            urls = service._search_instagram('サロンA', 'test-job-id')
+        urls = service._search_instagram('サロンA', 'test-job-id')
 
         assert urls == ['https://www.instagram.com/salon/']
 
@@ -251,14 +273,63 @@ class TestRunInstagramSearch:
         assert result_event['file_name'].endswith('.xlsx')
 
         # 生成されたExcelの検証
-        output_path = os.path.join(app_context.config['OUTPUT_DIR'], result_event['file_name'])
+        output_path = render_download(app_context.config['OUTPUT_DIR'], result_event['file_name'])
         assert os.path.exists(output_path)
-        result_df = pd.read_excel(output_path)
+        result_df = pd.read_excel(output_path, sheet_name='Instagram検索結果')
         assert 'Instagram候補URL1' in result_df.columns
         assert 'Instagram候補URL2' in result_df.columns
         assert 'Instagram候補URL3' in result_df.columns
         assert result_df['Instagram候補URL1'].iloc[0] == 'https://www.instagram.com/salon_a/'
 
+    def test_reads_scrape_job_result_without_excel(self, app_context):
+        """スクレイピングジョブのIDを指定すると、そのジョブの結果ファイルを使いExcelファイルを読まない。"""
+        file_name = '五所川原_20260319_153045.xlsx'
+        write_result(result_path(app_context.config['OUTPUT_DIR'], file_name),
+                     pd.DataFrame({'サロン名': ['サロンA', 'サロンB'], '電話番号': ['012-345-6789', None]}),
+                     'サロンリスト')
+        store = app_context.extensions['job_runner'].store
+        store.create('scrapejob', 'scrape', {})
+        store.append_event('scrapejob', f"event: result\ndata: {json.dumps({'file_name': file_name})}\n\n")
+        service = InstagramSearchService()
+        service.session = MagicMock()
+        service.session.post.return_value = _make_serper_response([
+            {'title': 'IG', 'link': 'https://www.instagram.com/salon/', 'snippet': '...'},
+        ])
+
+        with patch('app.main.services.instagram_service.pd.read_excel') as mock_read_excel:
+            events = _collect_sse_events(service.run_instagram_search(None, 'test-job', 'scrapejob'))
+        mock_read_excel.assert_not_called()
+
+        result_event = next(e[1] for e in events if e[0] == 'result')
+        assert result_event['total_salons'] == 2
+        assert result_event['file_name'].startswith('Instagram_五所川原_')
+        result_df = pd.read_excel(render_download(app_context.config['OUTPUT_DIR'], result_event['file_name']))
+        assert list(result_df.columns[:2]) == ['サロン名', 'Instagram候補URL1']
+        assert list(result_df['電話番号'].fillna('')) == ['012-345-6789', '']
+
+    def test_falls_back_to_excel_without_job_result(self, app_context, sample_excel):
+        """ジョブの結果が残っていなければ、指定されたExcelファイルを読み込む。"""
+        service = InstagramSearchService()
+        service.session = MagicMock()
+        service.session.post.return_value = _make_serper_response([])
+
+        events = _collect_sse_events(service.run_instagram_search(sample_excel, 'test-job', 'purgedjob'))
+
+        assert next(e[1] for e in events if e[0] == 'result')['total_salons'] == 3
+
+    def test_reads_result_file_before_excel(self, app_context):
+        """結果のParquetファイルがあれば、Excelファイルがなくても読み込む。"""
+        file_name = '五所川原_20260319_180000.xlsx'
+        write_result(result_path(app_context.config['OUTPUT_DIR'], file_name),
+                     pd.DataFrame({'サロン名': ['サロンA', 'サロンB']}), 'サロンリスト')
+        service = InstagramSearchService()
+        service.session = MagicMock()
+        service.session.post.return_value = _make_serper_response([])
+
+        events = _collect_sse_events(service.run_instagram_search(file_name, 'test-job'))
+
+        assert next(e[1] for e in events if e[0] == 'result')['total_salons'] == 2
+
     def test_file_not_found(self, app_context):
         """存在しないファイルを指定した場合にエラーイベントを返す。"""
         service = InstagramSearchService()
@@ -284,17 +355,12 @@ class TestRunInstagramSearch:
 
     @patch('app.main.services.instagram_service.time.sleep')
     def test_duplicate_salon_names(self, mock_sleep, app_context, duplicate_salon_excel):
-        """同名サロンがある場合でも各行に個別の結果を保持する。"""
-        call_count = 0
-
-        def mock_post(*args, **kwargs):
-            nonlocal call_count
-            call_count += 1
-            # 各呼び出しで異なるURLを返す
-            organic = [
-                {'title': 'IG', 'link': f'https://www.instagram.com/salon_call{call_count}/', 'snippet': '...'},
-            ]
-            return _make_serper_response(organic)
+        """同名サロンは1回だけ検索し、結果を該当するすべての行に使う。"""
+        def mock_post(url, json, timeout):
+            name = json['q'].split()[0]
+            return _make_serper_response([
+                {'title': 'IG', 'link': f'https://www.instagram.com/{name}/', 'snippet': '...'},
+            ])
 
         service = InstagramSearchService()
         service.session = MagicMock()
@@ -303,26 +369,113 @@ class TestRunInstagramSearch:
         events = _collect_sse_events(service.run_instagram_search(duplicate_salon_excel, 'test-job'))
         result_event = next(e[1] for e in events if e[0] == 'result')
 
-        output_path = os.path.join(app_context.config['OUTPUT_DIR'], result_event['file_name'])
-        result_df = pd.read_excel(output_path)
+        assert service.session.post.call_count == 2
+        assert result_event['found_count'] == 3
+        assert result_event['saved_queries'] == 1
+        progress_events = [e[1] for e in events if e[0] == 'progress']
+        assert progress_events[-1]['current'] == 3
+        assert progress_events[-1]['saved_queries'] == 1
 
-        # 同名の「チェーン店A」が2行あり、それぞれ異なるURLを持つことを確認
+        output_path = render_download(app_context.config['OUTPUT_DIR'], result_event['file_name'])
+        result_df = pd.read_excel(output_path)
         chain_rows = result_df[result_df['サロン名'] == 'チェーン店A']
         assert len(chain_rows) == 2
-        url1 = chain_rows.iloc[0]['Instagram候補URL1']
-        url2 = chain_rows.iloc[1]['Instagram候補URL1']
-        assert url1 != url2  # 異なるURLであること
-        assert 'instagram.com' in url1
-        assert 'instagram.com' in url2
+        assert list(chain_rows['Instagram候補URL1']) == ['https://www.instagram.com/チェーン店A/'] * 2
+
+    def test_normalized_names_share_search(self, app_context):
+        """全角・半角や空白の違いだけのサロン名も同じ検索として扱う。"""
+        file_name = _write_salon_excel(app_context, ['ＨＡＩＲ　Ａ', 'HAIR A', 'HAIR  A '])
+
+        service = InstagramSearchService()
+        service.session = MagicMock()
+        service.session.post.return_value = _make_serper_response([])
+
+        events = _collect_sse_events(service.run_instagram_search(file_name, 'test-job'))
+
+        assert service.session.post.call_count == 1
+        assert next(e[1] for e in events if e[0] == 'result')['saved_queries'] == 2
+
+    def test_concurrent_results_keep_row_order(self, app_context, sample_excel):
+        """並行検索で完了順が入れ替わっても、結果は元の行に対応付けられる。"""
+        last_done = threading.Event()
+
+        def mock_post(url, json, timeout):
+            name = json['q'].split()[0]
+            if name == 'サロンA':
+                # サロンAはサロンCの検索が終わるまで完了しない
+                assert last_done.wait(5)
+            elif name == 'サロンC':
+                last_done.set()
+            return _make_serper_response([
+                {'title': 'IG', 'link': f'https://www.instagram.com/{name}/', 'snippet': '...'},
+            ])
+
+        service = InstagramSearchService()
+        service.concurrency = AdaptiveConcurrency(3)
+        service.session = MagicMock()
+        service.session.post.side_effect = mock_post
+
+        events = _collect_sse_events(service.run_instagram_search(sample_excel, 'test-job'))
+        result_event = next(e[1] for e in events if e[0] == 'result')
+
+        output_path = render_download(app_context.config['OUTPUT_DIR'], result_event['file_name'])
+        result_df = pd.read_excel(output_path)
+        for name, url in zip(result_df['サロン名'], result_df['Instagram候補URL1']):
+            assert url == f'https://www.instagram.com/{name}/'
+
+    def test_cached_results_skip_api(self, app_context, sample_excel):
+        """2回目の検索では保存済みの結果を使い、Serper APIを呼ばない。見つからなかった結果も再利用する。"""
+        def mock_post(url, json, timeout):
+            name = json['q'].split()[0]
+            organic = [] if name == 'サロンC' else [
+                {'title': 'IG', 'link': f'https://www.instagram.com/{name}/', 'snippet': '...'},
+            ]
+            return _make_serper_response(organic)
+
+        first = InstagramSearchService()
+        first.session = MagicMock()
+        first.session.post.side_effect = mock_post
+        first_result = next(e[1] for e in _collect_sse_events(first.run_instagram_search(sample_excel, 'job-1'))
+                            if e[0] == 'result')
+        assert first_result['cache_hits'] == 0
+        assert first.session.post.call_count == 3
+
+        second = InstagramSearchService()
+        second.session = MagicMock()
+        events = _collect_sse_events(second.run_instagram_search(sample_excel, 'job-2'))
+        second_result = next(e[1] for e in events if e[0] == 'result')
+
+        second.session.post.assert_not_called()
+        assert second_result['cache_hits'] == 3
+        assert second_result['found_count'] == 2
+        output_path = render_download(app_context.config['OUTPUT_DIR'], second_result['file_name'])
+        result_df = pd.read_excel(output_path)
+        assert result_df['Instagram候補URL1'].iloc[0] == 'https://www.instagram.com/サロンA/'
+
+    @patch('app.main.services.instagram_service.time.sleep')
+    def test_failed_search_not_cached(self, mock_sleep, app_context, sample_excel):
+        """エラーで検索できなかったサロンは保存せず、次回に検索し直す。"""
+        from requests.exceptions import ConnectionError
+
+        service = InstagramSearchService()
+        service.session = MagicMock()
+        service.session.post.side_effect = ConnectionError('connection refused')
+        events = _collect_sse_events(service.run_instagram_search(sample_excel, 'job-1'))
+        assert next(e[1] for e in events if e[0] == 'result')['found_count'] == 0
+
+        retry = InstagramSearchService()
+        retry.session = MagicMock()
+        retry.session.post.return_value = _make_serper_response([])
+        events = _collect_sse_events(retry.run_instagram_search(sample_excel, 'job-2'))
+
+        assert next(e[1] for e in events if e[0] == 'result')['cache_hits'] == 0
+        assert retry.session.post.call_count == 3
 
     @patch('app.main.services.instagram_service.time.sleep')
     def test_cancellation(self, mock_sleep, app_context, sample_excel):
-        """キャンセルシグナルで検索が中断される。"""
-        # キャンセルファイルを作成
+        """キャンセル要求で検索が中断される。"""
         job_id = 'cancel-test-job'
-        cancel_file = os.path.join(app_context.instance_path, f'{job_id}.cancel')
-        with open(cancel_file, 'w') as f:
-            f.write(str(time.time()))
+        app_context.extensions['cancellation'].request(job_id)
 
         service = InstagramSearchService()
         events = _collect_sse_events(service.run_instagram_search(sample_excel, job_id))
@@ -331,10 +484,6 @@ class TestRunInstagramSearch:
         assert 'cancelled' in event_types
         assert 'result' not in event_types
 
-        # クリーンアップ
-        if os.path.exists(cancel_file):
-            os.remove(cancel_file)
-
     @patch('app.main.services.instagram_service.time.sleep')
     def test_serper_api_error_stops_search(self, mock_sleep, app_context, sample_excel):
         """SerperAPIError (401/402) 発生時に即座にエラーを返して停止する。"""
@@ -366,7 +515,8 @@ class TestRunInstagramSearch:
 
         progress_events = [e for e in events if e[0] == 'progress']
         assert len(progress_events) == 3  # 3サロン
-        assert progress_events[-1][1] == {'current': 3, 'total': 3}
+        last = progress_events[-1][1]
+        assert (last['current'], last['total'], last['eta_seconds']) == (3, 3, 0.0)
 
     @patch('app.main.services.instagram_service.time.sleep')
     def test_column_order(self, mock_sleep, app_context, sample_excel):
@@ -383,7 +533,7 @@ class TestRunInstagramSearch:
         events = _collect_sse_events(service.run_instagram_search(sample_excel, 'test-job'))
         result_event = next(e[1] for e in events if e[0] == 'result')
 
-        output_path = os.path.join(app_context.config['OUTPUT_DIR'], result_event['file_name'])
+        output_path = render_download(app_context.config['OUTPUT_DIR'], result_event['file_name'])
         result_df = pd.read_excel(output_path)
 
         cols = list(result_df.columns)
@@ -397,7 +547,53 @@ class TestRunInstagramSearch:
         assert 'サロンURL' in cols
 
 
-# --- _create_instagram_excel ---
+class TestBatchSearch:
+    def test_batches_queries(self, app_context, stub_serper):
+        """INSTAGRAM_BATCH_SIZE件ずつ1回のリクエストにまとめ、結果を各行に対応付ける。"""
+        app_context.config['INSTAGRAM_BATCH_SIZE'] = 2
+        names = ['サロン1', 'サロン2', 'サロン3', 'サロン4', 'サロン5']
+        file_name = _write_salon_excel(app_context, names)
+
+        service = InstagramSearchService()
+        events = _collect_sse_events(service.run_instagram_search(file_name, 'test-job'))
+        result_event = next(e[1] for e in events if e[0] == 'result')
+
+        assert sorted(len(body) if isinstance(body, list) else 1 for body in stub_serper) == [1, 2, 2]
+        assert result_event['found_count'] == 5
+        result_df = pd.read_excel(render_download(app_context.config['OUTPUT_DIR'], result_event['file_name']))
+        for name, url in zip(result_df['サロン名'], result_df['Instagram候補URL1']):
+            assert url == f'https://www.instagram.com/{name}/'
+
+    def test_partial_failure_falls_back_to_single_query(self, app_context, stub_serper):
+        """バッチ内で結果が得られなかったサロンだけ、1件ずつ検索し直す。"""
+        app_context.config['INSTAGRAM_BATCH_SIZE'] = 3
+        file_name = _write_salon_excel(app_context, ['サロン1', 'エラーサロン', 'サロン3'])
+
+        service = InstagramSearchService()
+        events = _collect_sse_events(service.run_instagram_search(file_name, 'test-job'))
+        result_event = next(e[1] for e in events if e[0] == 'result')
+
+        assert len(stub_serper) == 2
+        assert isinstance(stub_serper[0], list) and len(stub_serper[0]) == 3
+        assert stub_serper[1]['q'] == 'エラーサロン Instagram'
+        assert result_event['found_count'] == 3
+
+    def test_unexpected_response_falls_back(self, app_context):
+        """バッチのレスポンスが配列でなければ、すべて1件ずつ検索し直す。"""
+        service = _bare_service(app_context)
+        service.session.post.side_effect = [
+            _make_serper_response([]),
+            _make_serper_response([{'title': 'IG', 'link': 'https://www.instagram.com/a/', 'snippet': '...'}]),
+            _make_serper_response([]),
+        ]
+
+        results = service._search_instagram_batch(['A', 'B'], 'test-job-id')
+
+        assert results == [['https://www.instagram.com/a/'], []]
+        assert service.session.post.call_count == 3
+
+
+# --- _save_instagram_result ---
 
 class TestCreateInstagramExcel:
     def test_area_name_extraction(self, app_context):
@@ -405,7 +601,7 @@ class TestCreateInstagramExcel:
         service = InstagramSearchService()
         df = pd.DataFrame({'サロン名': ['A']})
 
-        file_name = service._create_instagram_excel(df, '五所川原_20260319_153045.xlsx')
+        file_name = service._save_instagram_result(df, '五所川原_20260319_153045.xlsx')
         assert file_name.startswith('Instagram_五所川原_')
 
     def test_unknown_filename_format(self, app_context):
@@ -413,40 +609,22 @@ class TestCreateInstagramExcel:
         service = InstagramSearchService()
         df = pd.DataFrame({'サロン名': ['A']})
 
-        file_name = service._create_instagram_excel(df, 'random_file.xlsx')
+        file_name = service._save_instagram_result(df, 'random_file.xlsx')
         assert 'Instagram_unknown_' in file_name
 
 
 # --- _is_cancelled ---
 
 class TestIsCancelled:
-    def test_no_cancel_file(self, app_context):
-        """キャンセルファイルがなければFalse。"""
+    def test_not_requested(self, app_context):
+        """キャンセル要求がなければFalse。"""
         service = InstagramSearchService()
         assert service._is_cancelled('nonexistent-job') is False
 
-    def test_valid_cancel_file(self, app_context):
-        """有効なキャンセルファイルがあればTrue。"""
+    def test_requested(self, app_context):
+        """キャンセル要求があればTrue。"""
         job_id = 'cancel-check-test'
-        cancel_file = os.path.join(app_context.instance_path, f'{job_id}.cancel')
-        with open(cancel_file, 'w') as f:
-            f.write(str(time.time()))
+        app_context.extensions['cancellation'].request(job_id)
 
         service = InstagramSearchService()
         assert service._is_cancelled(job_id) is True
-
-        os.remove(cancel_file)
-
-    def test_stale_cancel_file(self, app_context):
-        """タイムスタンプが古いキャンセルファイルはFalse。"""
-        job_id = 'stale-cancel-test'
-        cancel_file = os.path.join(app_context.instance_path, f'{job_id}.cancel')
-        # タイムアウト期間を超えた古いタイムスタンプ
-        stale_time = time.time() - app_context.config['CANCEL_FILE_TIMEOUT_SECONDS'] - 100
-        with open(cancel_file, 'w') as f:
-            f.write(str(stale_time))
-
-        service = InstagramSearchService()
-        assert service._is_cancelled(job_id) is False
-
-        os.remove(cancel_file)
@@ -0,0 +1,254 @@
+import os
+import sys
+import time
+import uuid
+import threading
+import subprocess
+from unittest.mock import patch
+
+import pytest
+
+from app.main.services.job_runner import JobStore, JobRunner
+
+
+def _wait_finished(app, job_id, timeout=5):
+    runner = app.extensions['job_runner']
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if runner.store.get(job_id)['status'] == 'finished':
+            return
+        time.sleep(0.01)
+    raise AssertionError('job did not finish')
+
+
+class TestJobStore:
+    def test_events_numbered_in_order(self, tmp_path):
+        """イベントIDはジョブごとに1から連番で振られる。"""
+        store = JobStore(str(tmp_path))
+        store.create('job1', 'scrape', {'area_id': '1'})
+        assert store.append_event('job1', 'a') == 1
+        assert store.append_event('job1', 'b') == 2
+        assert store.events_after('job1', 1) == [(2, 'b')]
+        assert store.get('job1')['params'] == {'area_id': '1'}
+
+    def test_purge_removes_old_finished_jobs(self, tmp_path):
+        """保持期間を過ぎた終了済みジョブのみ削除される。"""
+        store = JobStore(str(tmp_path))
+        store.create('done', 'scrape', {})
+        store.create('running', 'scrape', {})
+        store.append_event('done', 'a')
+        store.set_status('done', 'finished')
+        store.purge(time.time() + 1)
+        assert store.get('done') is None
+        assert store.events_after('done', 0) == []
+        assert store.get('running') is not None
+
+    def test_checkpoint_appends_records_and_replaces_state(self, tmp_path):
+        """チェックポイントの状態は上書きされ、完了したサロン情報は追記される。"""
+        store = JobStore(str(tmp_path))
+        store.create('job1', 'scrape', {})
+        store.save_checkpoint('job1', {'pages_done': 1}, [{'サロン名': 'A'}])
+        store.save_checkpoint('job1', {'pages_done': 2}, [{'サロン名': 'B'}])
+        assert store.load_checkpoint('job1') == ({'pages_done': 2}, [{'サロン名': 'A'}, {'サロン名': 'B'}])
+        store.delete_checkpoint('job1')
+        assert store.load_checkpoint('job1') is None
+
+    def test_result_event(self, tmp_path):
+        """ジョブのresultイベントのデータを返す。resultイベントがなければNoneを返す。"""
+        store = JobStore(str(tmp_path))
+        store.create('job1', 'scrape', {})
+        store.append_event('job1', 'event: message\ndata: 開始\n\n')
+        assert store.result('job1') is None
+        store.append_event('job1', 'event: result\ndata: {"file_name": "エリア_20260319_153045.xlsx"}\n\n')
+        assert store.result('job1') == {'file_name': 'エリア_20260319_153045.xlsx'}
+
+    def test_claim_succeeds_only_once(self, tmp_path):
+        """同じ状態から同時にclaimしても、成功するのは1つだけ。"""
+        store = JobStore(str(tmp_path))
+        store.create('job1', 'scrape', {})
+        store.set_status('job1', 'finished')
+        job = store.get('job1')
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(store.claim(job))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(results) == [False] * 4 + [True]
+        assert store.get('job1')['status'] == 'queued'
+
+
+class TestIsActive:
+    def test_own_process_is_active(self, tmp_path):
+        """現在のプロセスが担当するジョブは実行中と判定する。"""
+        store = JobStore(str(tmp_path))
+        store.create('job1', 'scrape', {})
+        store.set_status('job1', 'running')
+        assert JobRunner.is_active(store.get('job1')) is True
+
+    def test_reused_pid_is_not_active(self, tmp_path):
+        """再起動後に同じPIDが再利用されても、起動時刻が異なれば終了済みと判定する。"""
+        store = JobStore(str(tmp_path))
+        store.create('job1', 'scrape', {})
+        store.set_status('job1', 'running')
+        job = store.get('job1')
+        job['pid_started'] = (job['pid_started'] or 0) - 1
+        assert job['pid'] == os.getpid()
+        assert JobRunner.is_active(job) is False
+
+    def test_dead_process_is_not_active(self, tmp_path):
+        """担当プロセスが終了したジョブは実行中と判定しない。"""
+        store = JobStore(str(tmp_path))
+        store.create('job1', 'scrape', {})
+        job = dict(store.get('job1'), status='running', pid=_dead_pid())
+        assert JobRunner.is_active(job) is False
+
+
+def _dead_pid():
+    """終了済みプロセスのPIDを返す。"""
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def _interrupted_job(app, job_id):
+    """担当プロセスが途中で終了し、チェックポイントが残っているジョブを作成する。"""
+    store = app.extensions['job_runner'].store
+    store.create(job_id, 'scrape', {'area_id': '1', 'freeword': None, 'incremental': False})
+    store.set_status(job_id, 'running')
+    conn = store._connect()
+    with conn:
+        conn.execute('UPDATE jobs SET pid = ? WHERE job_id = ?', (_dead_pid(), job_id))
+    conn.close()
+    store.save_checkpoint(job_id, {'pages_done': 1}, [])
+    return store
+
+
+class TestJobEndpoints:
+    def test_post_scrape_job_returns_job_id(self, app, client):
+        """POST /scrape/jobs はjob_idを202で返し、ジョブはバックグラウンドで実行される。"""
+        with patch('app.main.routes.ScrapingService') as MockService:
+            MockService.return_value.run_scraping.return_value = iter([
+                'event: message\ndata: done\n\n',
+            ])
+            resp = client.post('/scrape/jobs', data={'area_id': '1'})
+            assert resp.status_code == 202
+            job_id = resp.get_json()['job_id']
+            _wait_finished(app, job_id)
+
+        data = client.get(f'/jobs/{job_id}/events').get_data(as_text=True)
+        assert f'id: 1\nevent: job_id\ndata: {job_id}' in data
+        assert 'id: 2\nevent: message\ndata: done' in data
+
+    def test_post_scrape_job_without_area_id(self, client):
+        """area_id未指定では400を返す。"""
+        resp = client.post('/scrape/jobs', data={})
+        assert resp.status_code == 400
+        assert 'エリアが選択されていません' in resp.get_json()['error']
+
+    def test_post_instagram_job_rejects_path_traversal(self, client):
+        """Instagram検索ジョブでもパストラバーサルを拒否する。"""
+        resp = client.post('/instagram-search/jobs', data={'target_file': '../etc/passwd'})
+        assert resp.status_code == 400
+        assert '無効なファイル名' in resp.get_json()['error']
+
+    def test_resume_from_last_event_id(self, app, client):
+        """Last-Event-IDより後のイベントのみ再送する。"""
+        with patch('app.main.routes.ScrapingService') as MockService:
+            MockService.return_value.run_scraping.return_value = iter([
+                'event: message\ndata: first\n\n',
+                'event: message\ndata: second\n\n',
+            ])
+            job_id = client.post('/scrape/jobs', data={'area_id': '1'}).get_json()['job_id']
+            _wait_finished(app, job_id)
+
+        data = client.get(f'/jobs/{job_id}/events', headers={'Last-Event-ID': '2'}).get_data(as_text=True)
+        assert 'first' not in data
+        assert 'id: 3\nevent: message\ndata: second' in data
+
+    def test_finished_job_fully_consumed_returns_204(self, app, client):
+        """すべて受信済みの終了したジョブには204を返す。"""
+        with patch('app.main.routes.ScrapingService') as MockService:
+            MockService.return_value.run_scraping.return_value = iter([])
+            job_id = client.post('/scrape/jobs', data={'area_id': '1'}).get_json()['job_id']
+            _wait_finished(app, job_id)
+
+        resp = client.get(f'/jobs/{job_id}/events?last_event_id=1')
+        assert resp.status_code == 204
+
+    def test_unknown_job(self, client):
+        """存在しないジョブにはエラーイベントを返す。"""
+        data = client.get('/jobs/0123456789abcdef/events').get_data(as_text=True)
+        assert 'event: error' in data
+        assert 'ジョブが見つかりません' in data
+
+    def test_job_failure_published_as_error_event(self, app, client):
+        """ジョブ内の例外はエラーイベントとして配信される。"""
+        def failing():
+            yield 'event: message\ndata: start\n\n'
+            raise RuntimeError('boom')
+
+        with patch('app.main.routes.ScrapingService') as MockService:
+            MockService.return_value.run_scraping.return_value = failing()
+            job_id = client.post('/scrape/jobs', data={'area_id': '1'}).get_json()['job_id']
+            _wait_finished(app, job_id)
+
+        data = client.get(f'/jobs/{job_id}/events').get_data(as_text=True)
+        assert 'event: error' in data
+        assert 'boom' in data
+
+    def test_interrupted_job_reported_as_resumable(self, app, client):
+        """担当プロセスが終了したジョブは、interruptedイベントで再開可能と通知される。"""
+        job_id = uuid.uuid4().hex
+        _interrupted_job(app, job_id)
+        data = client.get(f'/jobs/{job_id}/events').get_data(as_text=True)
+        assert 'event: interrupted' in data
+        assert '"resumable": true' in data
+
+    def test_resume_interrupted_job(self, app, client):
+        """POST /jobs/<job_id>/resume はチェックポイントを渡して同じジョブを再実行する。"""
+        job_id = uuid.uuid4().hex
+        _interrupted_job(app, job_id)
+        release = threading.Event()
+
+        def resumed():
+            release.wait(timeout=5)
+            yield 'event: message\ndata: resumed\n\n'
+
+        with patch('app.main.routes.ScrapingService') as MockService:
+            MockService.return_value.run_scraping.return_value = resumed()
+            resp = client.post(f'/jobs/{job_id}/resume')
+            assert resp.status_code == 202
+            # 実行中のジョブへの2つ目の再開要求は拒否される
+            assert client.post(f'/jobs/{job_id}/resume').status_code == 409
+            release.set()
+            _wait_finished(app, job_id)
+
+        assert MockService.return_value.run_scraping.call_count == 1
+        checkpoint = MockService.return_value.run_scraping.call_args.kwargs['checkpoint']
+        assert checkpoint.job_id == job_id
+        data = client.get(f'/jobs/{job_id}/events').get_data(as_text=True)
+        assert 'event: message\ndata: resumed' in data
+
+    def test_resume_requires_checkpoint(self, app, client):
+        """チェックポイントのないジョブは再開できない。"""
+        with patch('app.main.routes.ScrapingService') as MockService:
+            MockService.return_value.run_scraping.return_value = iter([])
+            job_id = client.post('/scrape/jobs', data={'area_id': '1'}).get_json()['job_id']
+            _wait_finished(app, job_id)
+
+        assert client.post(f'/jobs/{job_id}/resume').status_code == 409
+        assert client.post('/jobs/0123456789abcdef/resume').status_code == 404
+
+    def test_heartbeat_while_idle(self, app):
+        """イベントが途切れている間は、ハートビートのコメント行を送る。"""
+        runner = app.extensions['job_runner']
+        job_id = uuid.uuid4().hex
+        runner.store.create(job_id, 'scrape', {})
+        runner.store.set_status(job_id, 'running')
+        with patch.object(runner, 'heartbeat_seconds', 0.01):
+            stream = runner.stream(job_id)
+            assert next(stream) == ': heartbeat\n\n'
+        runner.store.set_status(job_id, 'finished')
+        assert list(stream) == []
+
@@ -0,0 +1,53 @@
+import json
+
+from app.main.services.progress import ProgressThrottle
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _data(event):
+    return json.loads(event.split('data: ', 1)[1])
+
+
+class TestProgressThrottle:
+    def test_updates_within_interval_are_coalesced(self):
+        """送信間隔内の更新はまとめられ、次の送信またはflushで最新の値だけが送られる。"""
+        clock = _Clock()
+        throttle = ProgressThrottle(0.25, clock=clock)
+
+        assert len(throttle.update('progress', {'current': 1, 'total': 10})) == 1
+        clock.now = 0.1
+        assert throttle.update('progress', {'current': 2, 'total': 10}) == []
+        assert throttle.update('progress', {'current': 3, 'total': 10}) == []
+        clock.now = 0.3
+        events = throttle.update('progress', {'current': 4, 'total': 10})
+        assert [_data(e)['current'] for e in events] == [4]
+        assert throttle.flush() == []
+
+        clock.now = 0.35
+        assert throttle.update('progress', {'current': 5, 'total': 10}) == []
+        assert [_data(e)['current'] for e in throttle.flush()] == [5]
+
+    def test_event_types_throttled_independently(self):
+        """progressとurl_progressは別々に間隔を管理する。"""
+        throttle = ProgressThrottle(60, clock=_Clock())
+        assert throttle.update('url_progress', {'current': 1, 'total': 2})
+        assert throttle.update('progress', {'current': 1, 'total': 5})
+
+    def test_rate_and_eta(self):
+        """送信時に処理速度と残り時間の見込みを付ける。再開時に完了済みだった件数は速度に含めない。"""
+        clock = _Clock()
+        throttle = ProgressThrottle(0, clock=clock)
+        first = _data(throttle.update('progress', {'current': 10, 'total': 50})[0])
+        assert first['rate'] == 0.0 and first['eta_seconds'] is None
+
+        clock.now = 2.0
+        data = _data(throttle.update('progress', {'current': 30, 'total': 50})[0])
+        assert data['rate'] == 10.0
+        assert data['eta_seconds'] == 2.0
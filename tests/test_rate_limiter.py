@@ -0,0 +1,51 @@
+from unittest.mock import patch
+
+import pytest
+
+from app.main.services.rate_limiter import TokenBucketRateLimiter
+
+
+@pytest.fixture
+def frozen_time():
+    """time.timeを固定値にしてバケットの補充を止める。"""
+    with patch('app.main.services.rate_limiter.time.time', return_value=1000.0) as mock_time:
+        yield mock_time
+
+
+class TestTokenBucketRateLimiter:
+    def test_burst_without_wait(self, tmp_path, frozen_time):
+        """バースト上限まではトークンを待機なしで取得できる。"""
+        limiter = TokenBucketRateLimiter(str(tmp_path), rate=2, burst=3)
+        assert [limiter.reserve('host') for _ in range(3)] == [0.0, 0.0, 0.0]
+
+    def test_wait_when_budget_exhausted(self, tmp_path, frozen_time):
+        """予算を使い切ると、レートに応じた待ち時間が順に積み上がる。"""
+        limiter = TokenBucketRateLimiter(str(tmp_path), rate=2, burst=1)
+        assert limiter.reserve('host') == 0.0
+        assert limiter.reserve('host') == pytest.approx(0.5)
+        assert limiter.reserve('host') == pytest.approx(1.0)
+
+    def test_refill_over_time(self, tmp_path, frozen_time):
+        """経過時間に応じてトークンが補充される。"""
+        limiter = TokenBucketRateLimiter(str(tmp_path), rate=2, burst=1)
+        limiter.reserve('host')
+        frozen_time.return_value = 1000.5
+        assert limiter.reserve('host') == 0.0
+
+    def test_budget_shared_between_instances(self, tmp_path, frozen_time):
+        """同じinstance_pathを使う別インスタンス（別ジョブ・別ワーカー）と予算を共有する。"""
+        first = TokenBucketRateLimiter(str(tmp_path), rate=1, burst=1)
+        second = TokenBucketRateLimiter(str(tmp_path), rate=1, burst=1)
+        assert first.reserve('host') == 0.0
+        assert second.reserve('host') == pytest.approx(1.0)
+
+    def test_buckets_are_per_host(self, tmp_path, frozen_time):
+        """接続先ホストごとに独立したバケットを持つ。"""
+        limiter = TokenBucketRateLimiter(str(tmp_path), rate=1, burst=1)
+        assert limiter.reserve('a.example') == 0.0
+        assert limiter.reserve('b.example') == 0.0
+
+    def test_disabled_when_rate_zero(self, tmp_path):
+        """レートが0なら常に待機なし。"""
+        limiter = TokenBucketRateLimiter(str(tmp_path), rate=0, burst=1)
+        assert all(limiter.reserve('host') == 0.0 for _ in range(10))
@@ -0,0 +1,72 @@
+import json
+import os
+from unittest.mock import patch
+
+import pandas as pd
+
+from app.main.services.result_files import (
+    ColumnarWriter, read_result, render_download, result_path, write_result,
+)
+
+
+def _write_list(output_dir, file_name='エリア_20260319_153045.xlsx'):
+    writer = ColumnarWriter(result_path(output_dir, file_name), 'サロンリスト', ['サロン名', '関連リンク数'], batch_rows=2)
+    writer.append({'サロン名': 'A', '関連リンク数': 2})
+    writer.append({'サロン名': 'B', '関連リンク数': float('nan')})
+    writer.append({'サロン名': None, '関連リンク数': 3})
+    writer.close()
+    return file_name
+
+
+class TestColumnarWriter:
+    def test_round_trip(self, tmp_path):
+        """行グループに分けて書き込んだ行を、カラムの型とシート名を保ったまま読み出せる。"""
+        file_name = _write_list(str(tmp_path))
+
+        df, sheet_name = read_result(result_path(str(tmp_path), file_name))
+
+        assert sheet_name == 'サロンリスト'
+        assert list(df.columns) == ['サロン名', '関連リンク数']
+        assert list(df['サロン名']) == ['A', 'B', None]
+        assert df['関連リンク数'].iloc[0] == 2
+        assert df['関連リンク数'].isna().sum() == 1
+
+    def test_empty_list_has_columns(self, tmp_path):
+        """0行でもカラムだけのファイルを作成する。"""
+        path = str(tmp_path / 'empty.parquet')
+        writer = ColumnarWriter(path, 'サロンリスト', ['サロン名'])
+        writer.close()
+        assert list(read_result(path)[0].columns) == ['サロン名']
+
+    def test_write_result_mixed_types(self, tmp_path):
+        """数値と文字列が混在した列は文字列にそろえて保存する。"""
+        path = str(tmp_path / 'mixed.parquet')
+        write_result(path, pd.DataFrame({'電話番号': [123, '03-0000-0000', None]}), 'シート')
+        df, sheet_name = read_result(path)
+        assert (list(df['電話番号']), sheet_name) == (['123', '03-0000-0000', None], 'シート')
+
+
+class TestRenderDownload:
+    def test_renders_each_format_once(self, tmp_path):
+        """xlsx・CSV・JSONを初回に作成して保存し、2回目以降は保存したファイルを返す。"""
+        output_dir = str(tmp_path)
+        stem = os.path.splitext(_write_list(output_dir))[0]
+
+        xlsx = render_download(output_dir, f'{stem}.xlsx')
+        assert list(pd.read_excel(xlsx, sheet_name='サロンリスト')['サロン名'].fillna('')) == ['A', 'B', '']
+        with open(render_download(output_dir, f'{stem}.csv'), encoding='utf-8-sig') as f:
+            assert f.readline().strip() == 'サロン名,関連リンク数'
+        with open(render_download(output_dir, f'{stem}.json'), encoding='utf-8') as f:
+            assert json.load(f)[0] == {'サロン名': 'A', '関連リンク数': 2}
+
+        with patch('app.main.services.result_files.read_result') as mock_read:
+            assert render_download(output_dir, f'{stem}.xlsx') == xlsx
+        mock_read.assert_not_called()
+        assert not [name for name in os.listdir(output_dir) if '.tmp' in name]
+
+    def test_missing_or_unsupported(self, tmp_path):
+        """結果のファイルがない場合や、対応していない形式はNoneを返す。"""
+        output_dir = str(tmp_path)
+        stem = os.path.splitext(_write_list(output_dir))[0]
+        assert render_download(output_dir, 'none_20260319_153045.xlsx') is None
+        assert render_download(output_dir, f'{stem}.html') is None
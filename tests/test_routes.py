@@ -2,8 +2,11 @@ import json
 import os
 from unittest.mock import patch, MagicMock
 
+import pandas as pd
 import pytest
 
+from app.main.services.result_files import result_path, write_result
+
 
 class TestInstagramSearchAvailable:
     def test_available_when_key_set(self, client):
@@ -58,6 +61,26 @@ class TestInstagramSearchEndpoint:
 
         assert 'event: job_id' in data
 
+    def test_scrape_job_id_passed_to_service(self, client):
+        """scrape_job_idだけを指定しても受け付け、サービスに渡される。"""
+        with patch('app.main.routes.InstagramSearchService') as MockService:
+            instance = MockService.return_value
+            instance.run_instagram_search.return_value = iter(['event: message\ndata: テスト完了\n\n'])
+
+            resp = client.get('/instagram-search?scrape_job_id=abc123')
+            resp.get_data(as_text=True)
+
+        args = instance.run_instagram_search.call_args.args
+        assert args[0] is None
+        assert args[2] == 'abc123'
+
+    def test_invalid_scrape_job_id(self, client):
+        """英数字以外を含むscrape_job_idは拒否される。"""
+        resp = client.get('/instagram-search?scrape_job_id=../x')
+        data = resp.get_data(as_text=True)
+        assert 'event: error' in data
+        assert '無効なジョブID' in data
+
     def test_cancel_endpoint_reusable(self, client):
         """既存のキャンセルエンドポイントがInstagram検索のjob_idでも動作する。"""
         resp = client.post(
@@ -79,6 +102,23 @@ class TestInstagramSearchEndpoint:
         assert resp.status_code == 400
 
 
+class TestDownload:
+    def test_renders_requested_format(self, app, client):
+        """結果のParquetファイルから、要求された形式のファイルを作成して返す。"""
+        output_dir = app.config['OUTPUT_DIR']
+        write_result(result_path(output_dir, 'エリア_20260319_153045.xlsx'), pd.DataFrame({'サロン名': ['A']}), 'サロンリスト')
+
+        resp = client.get('/download/エリア_20260319_153045.csv')
+
+        assert resp.status_code == 200
+        assert resp.get_data().decode('utf-8-sig').splitlines() == ['サロン名', 'A']
+        assert os.path.exists(os.path.join(output_dir, 'エリア_20260319_153045.csv'))
+
+    def test_missing_file(self, client):
+        """結果のファイルがなければ404を返す。"""
+        assert client.get('/download/none_20260319_153045.xlsx').status_code == 404
+
+
 class TestScrapeEndpointFreeword:
     def test_freeword_passed_to_service(self, client):
         """freewordパラメータがrun_scrapingの第3引数として渡される。"""
@@ -109,6 +149,41 @@ class TestScrapeEndpointFreeword:
             args = instance.run_scraping.call_args.args
             assert args[0] == '1'
             assert args[2] is None
+            assert instance.run_scraping.call_args.kwargs['incremental'] is False
+
+    def test_incremental_flag_passed_to_service(self, client):
+        """incremental=1でrun_scrapingに差分取得が指定される。"""
+        with patch('app.main.routes.ScrapingService') as MockService:
+            instance = MockService.return_value
+            instance.run_scraping.return_value = iter([
+                'event: message\ndata: done\n\n',
+            ])
+            resp = client.get('/scrape?area_id=1&incremental=1')
+            resp.get_data(as_text=True)
+
+            assert instance.run_scraping.call_args.kwargs['incremental'] is True
+
+    def test_multiple_areas_and_prefecture_passed_to_service(self, client):
+        """area_idを複数指定するとリストで、prefectureはキーワード引数で渡される。"""
+        with patch('app.main.routes.ScrapingService') as MockService:
+            instance = MockService.return_value
+            instance.run_scraping.return_value = iter([])
+            client.get('/scrape?area_id=1&area_id=2').get_data(as_text=True)
+            assert instance.run_scraping.call_args.args[0] == ['1', '2']
+            assert instance.run_scraping.call_args.kwargs['prefecture'] is None
+
+            instance.run_scraping.return_value = iter([])
+            client.get('/scrape?prefecture=東京都').get_data(as_text=True)
+            assert instance.run_scraping.call_args.args[0] == []
+            assert instance.run_scraping.call_args.kwargs['prefecture'] == '東京都'
+
+    def test_multiple_freewords_passed_as_list(self, client):
+        """区切り文字で複数指定したフリーワードはリストで渡される。"""
+        with patch('app.main.routes.ScrapingService') as MockService:
+            instance = MockService.return_value
+            instance.run_scraping.return_value = iter([])
+            client.get('/scrape?area_id=1&freeword=メンズ、縮毛矯正,&freeword=ヘッドスパ').get_data(as_text=True)
+            assert instance.run_scraping.call_args.args[2] == ['メンズ', '縮毛矯正', 'ヘッドスパ']
 
     def test_missing_area_id_error(self, client):
         """area_id未指定でエラーSSEを返す（freeword有無に関わらず）。"""
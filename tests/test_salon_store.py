@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from app.db import get_db, salons_table
+from app.main.services.salon_store import SalonStore, extract_salon_id, canonical_salon_url, preferred_salon_url
+
+
+def _record(n, phone='03-0000-0000'):
+    return {
+        'サロン名': f'サロン{n}',
+        '電話番号': phone,
+        '住所': '東京都渋谷区1-1',
+        'スタッフ数': 'スタイリスト3人',
+        '関連リンク': '',
+        '関連リンク数': 0,
+        'サロンURL': f'https://beauty.hotpepper.jp/slnH00000000{n}/',
+        'has_special_feature': True,
+    }
+
+
+class TestExtractSalonId:
+    def test_extracts_id(self):
+        assert extract_salon_id('https://beauty.hotpepper.jp/kr/slnH000123456/') == 'slnH000123456'
+
+    def test_returns_none_without_id(self):
+        assert extract_salon_id('https://beauty.hotpepper.jp/salon/') is None
+        assert extract_salon_id(None) is None
+
+
+class TestCanonicalSalonUrl:
+    def test_strips_query_and_subpages(self):
+        """クエリ文字列やサロン内のサブページを取り除き、サロンIDだけのURLにする。"""
+        canonical = 'https://beauty.hotpepper.jp/slnH000123456/'
+        assert canonical_salon_url('https://beauty.hotpepper.jp/slnH000123456/?cstt=3&vos=abc') == canonical
+        assert canonical_salon_url('https://beauty.hotpepper.jp/slnH000123456/coupon/#top') == canonical
+        assert canonical_salon_url('https://beauty.hotpepper.jp/slnH000123456') == canonical
+
+    def test_keeps_kr_prefix(self):
+        """エステ・リラクのURLは除外判定のため/kr/を残す。"""
+        assert canonical_salon_url('https://beauty.hotpepper.jp/kr/slnH000123456/?x=1') == (
+            'https://beauty.hotpepper.jp/kr/slnH000123456/'
+        )
+
+    def test_preferred_url_independent_of_order(self):
+        """同じサロンの/kr/あり・なしのURLは、渡す順によらず/kr/のURLを選ぶ。"""
+        hair = 'https://beauty.hotpepper.jp/slnH000123456/'
+        kirei = 'https://beauty.hotpepper.jp/kr/slnH000123456/'
+        assert preferred_salon_url(hair, kirei) == preferred_salon_url(kirei, hair) == kirei
+        assert preferred_salon_url(None, hair) == preferred_salon_url(hair, None) == hair
+
+    def test_url_without_id_unchanged(self):
+        assert canonical_salon_url('https://beauty.hotpepper.jp/salon/?slnH000123456') == (
+            'https://beauty.hotpepper.jp/salon/?slnH000123456'
+        )
+
+
+class TestSalonStore:
+    def test_round_trip(self, app_context):
+        """保存したサロン情報を同じ形式で読み出せる。"""
+        store = SalonStore(freshness_days=14)
+        assert store.save([_record(1), _record(2)]) == 2
+        fresh = store.load_fresh({'slnH000000001', 'slnH000000002', 'slnH000000003'})
+        assert set(fresh) == {'slnH000000001', 'slnH000000002'}
+        assert fresh['slnH000000001'] == _record(1)
+
+    def test_save_overwrites(self, app_context):
+        """同じサロンIDは上書きされる。"""
+        store = SalonStore(freshness_days=14)
+        store.save([_record(1)])
+        store.save([_record(1, phone='03-9999-9999')])
+        assert store.load_fresh({'slnH000000001'})['slnH000000001']['電話番号'] == '03-9999-9999'
+
+    def test_stale_rows_not_returned(self, app_context):
+        """鮮度期間を過ぎたサロンは返さない。"""
+        store = SalonStore(freshness_days=14)
+        store.save([_record(1), _record(2)])
+        db = get_db()
+        db.execute(
+            update(salons_table)
+            .where(salons_table.c.salon_id == 'slnH000000001')
+            .values(last_scraped_at=datetime.now() - timedelta(days=15))
+        )
+        db.commit()
+        assert set(store.load_fresh({'slnH000000001', 'slnH000000002'})) == {'slnH000000002'}
+
+    def test_rows_without_features_not_returned(self, app_context):
+        """除外判定用の特徴量がないサロンは再取得させる。"""
+        store = SalonStore(freshness_days=14)
+        store.save([dict(_record(1), has_special_feature=None)])
+        assert store.load_fresh({'slnH000000001'}) == {}
@@ -1,14 +1,31 @@
 import re
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from unittest.mock import patch, MagicMock
 
 import pandas as pd
+import pytest
+import requests
 
+from app.db import get_db, areas_table
 from app.main.services.scraping_service import ScrapingService
+from app.main.services.job_runner import JobStore, JobCheckpoint
+from app.main.services.result_files import render_download, read_result, result_path
 
 # 「髪質改善」のURLエンコード結果
 KAMI = '%E9%AB%AA%E8%B3%AA%E6%94%B9%E5%96%84'
 
 
+@pytest.fixture(params=['lxml', 'html.parser'])
+def html_parser(request):
+    """このモジュールのテストは全パーサーバックエンドで実行する。"""
+    return request.param
+
+
 class TestBuildFreewordUrl:
     def test_appends_freeword(self, app_context):
         """エリアURLにfreewordクエリを付与し、日本語が%XXエンコードされる。"""
@@ -71,7 +88,8 @@ class TestGetTotalPagesRedirect:
     def _response(self, url, text='<html><body>no pagination</body></html>'):
         fake = MagicMock()
         fake.url = url
-        fake.text = text
+        fake.content = text.encode('utf-8')
+        fake.encoding = 'utf-8'
         return fake
 
     def test_freeword_reapplied_when_redirect_drops_query(self, app_context):
@@ -111,39 +129,728 @@ class TestGetTotalPagesRedirect:
         assert final == url
 
 
-class TestExcelFilename:
-    def _df(self):
-        return pd.DataFrame({'サロン名': ['サロンA']})
+# --- ローカルスタブサイト ---
+
+STUB_PAGES = {
+    '/salon/': (
+        '<div class="preListHead"><p class="pa bottom0 right0">1/2ページ</p></div>'
+        '<ul class="slnCassetteList">'
+        '<li><h3 class="slnName"><a href="/slnH000000001/">A</a></h3></li>'
+        '<li><h3 class="slnName"><a href="/slnH000000002/">B</a></h3></li>'
+        '</ul>'
+    ),
+    '/salon/PN2.html': (
+        '<ul class="slnCassetteList">'
+        '<li><h3 class="slnName"><a href="/slnH000000003/">C</a></h3></li>'
+        '</ul>'
+    ),
+}
+# 隣接エリアの一覧（/salon/と重複するサロンを含む）
+STUB_PAGES['/area2/'] = (
+    '<ul class="slnCassetteList">'
+    '<li><h3 class="slnName"><a href="/slnH000000002/">B</a></h3></li>'
+    '<li><h3 class="slnName"><a href="/slnH000000003/">C</a></h3></li>'
+    '</ul>'
+)
+for _n in range(1, 4):
+    STUB_PAGES[f'/slnH00000000{_n}/'] = (
+        f'<p class="detailTitle"><a>サロン{_n}</a></p>'
+        f'<a href="/slnH00000000{_n}/tel/">電話番号</a>'
+        '<table class="slnDataTbl">'
+        '<tr><th>住所</th><td>東京都渋谷区1-1</td></tr>'
+        '<tr><th>スタッフ数</th><td>スタイリスト3人</td></tr>'
+        '</table>'
+        '<div id="jsiSpecialFeatureCarousel"></div>'
+    )
+    STUB_PAGES[f'/slnH00000000{_n}/tel/'] = f'<table><tr><td class="fs16 b">03-0000-000{_n}</td></tr></table>'
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    lock = threading.Lock()
+    active = 0
+    max_active = 0
+
+    def do_GET(self):
+        with _StubHandler.lock:
+            _StubHandler.active += 1
+            _StubHandler.max_active = max(_StubHandler.max_active, _StubHandler.active)
+        try:
+            if 'slow' in self.path:
+                time.sleep(0.05)
+            self._respond()
+        finally:
+            with _StubHandler.lock:
+                _StubHandler.active -= 1
+
+    def _respond(self):
+        body = STUB_PAGES.get(self.path.split('?')[0])
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        if self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        data = f'<html><body>{body}</body></html>'.encode('utf-8')
+        self.send_response(200)
+        self.send_header('ETag', '"v1"')
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_site():
+    """HPBを模したローカルHTTPサーバーを起動し、ベースURLを返す。"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def _events(generator):
+    """SSE文字列のジェネレータを(event, data)のリストに変換する。"""
+    events = []
+    for raw in generator:
+        event_type, data = None, None
+        for line in raw.strip().split('\n'):
+            if line.startswith('event: '):
+                event_type = line[7:]
+            elif line.startswith('data: '):
+                data = line[6:]
+        try:
+            data = json.loads(data)
+        except (json.JSONDecodeError, TypeError):
+            pass
+        events.append((event_type, data))
+    return events
+
+
+def _drain(generator):
+    """ジェネレータを最後まで実行し、yieldされた値のリストと戻り値を返す。"""
+    items = []
+    while True:
+        try:
+            items.append(next(generator))
+        except StopIteration as stop:
+            return items, stop.value
+
+
+class TestFetchEngines:
+    @pytest.mark.parametrize('mode', ['pipelined', 'phased'])
+    @pytest.mark.parametrize('engine', ['thread', 'async'])
+    def test_run_scraping_end_to_end(self, app_context, stub_site, engine, mode):
+        """どのエンジン・実行モードでも同じSSEイベントと結果を返す。"""
+        app_context.config.update({'FETCH_ENGINE': engine, 'SCRAPE_MODE': mode})
+        service = ScrapingService()
+        area = {'name': 'スタブ', 'url': f'{stub_site}/salon/'}
+        with patch.object(service, '_get_area_info', return_value=area):
+            events = _events(service.run_scraping('1', f'job-{engine}'))
+
+        types = [e[0] for e in events]
+        assert 'error' not in types
+        assert types.count('url_progress') == 2
+        assert types.count('progress') == 3
+        result = next(data for kind, data in events if kind == 'result')
+        df = pd.read_excel(render_download(app_context.config['OUTPUT_DIR'], result['file_name']))
+        assert sorted(df['電話番号']) == ['03-0000-0001', '03-0000-0002', '03-0000-0003']
+
+        # 営業対象リストの結果ファイルは、Excelを作成せずにそのまま読める
+        saved, _ = read_result(result_path(app_context.config['OUTPUT_DIR'], result['file_name']))
+        assert sorted(saved['電話番号']) == sorted(df['電話番号'])
+
+    def test_first_list_page_fetched_once(self, app_context, stub_site):
+        """総ページ数を調べたときの1ページ目の解析結果を使い、1ページ目を取得し直さない。"""
+        service = ScrapingService()
+        area = {'name': 'スタブ', 'url': f'{stub_site}/salon/'}
+        with patch.object(service, '_get_area_info', return_value=area), \
+                patch.object(service.session, 'get', wraps=service.session.get) as get:
+            events = _events(service.run_scraping('1', 'job-first-page'))
+
+        assert 'error' not in [kind for kind, _ in events]
+        assert [c.args[0] for c in get.call_args_list].count(f'{stub_site}/salon/') == 1
+        assert service._harvested_pages == {}
+
+    def test_concurrent_jobs_share_in_flight_request(self, app_context, stub_site):
+        """別のジョブが取得中のURLは、リクエストを送らずにその結果を使う。"""
+        services = [ScrapingService(), ScrapingService()]
+        url = f'{stub_site}/salon/?slow=1'
+        gets = [patch.object(service.session, 'get', wraps=service.session.get) for service in services]
+        with gets[0] as first, gets[1] as second, ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [executor.submit(service._make_request, url, f'job-{i}') for i, service in enumerate(services)]
+            responses = [future.result() for future in futures]
+
+        assert responses[0] is responses[1]
+        assert first.call_count + second.call_count == 1
+
+    def test_async_executor_limits_in_flight(self, app_context, stub_site):
+        """asyncエンジンの同時送信数がASYNC_MAX_IN_FLIGHTを超えない。"""
+        app_context.config.update({'FETCH_ENGINE': 'async', 'ASYNC_MAX_IN_FLIGHT': 2})
+        service = ScrapingService()
+        _StubHandler.max_active = 0
+        with service._create_executor() as executor:
+            futures = [
+                executor.submit(service._get_salon_urls_from_page_async, f'{stub_site}/salon/?slow={i}', 'job')
+                for i in range(6)
+            ]
+            results = [f.result() for f in futures]
+        assert all(len(urls) == 2 for urls in results)
+        assert _StubHandler.max_active <= 2
+
+
+class TestMultiAreaScraping:
+    @pytest.mark.parametrize('engine,mode', [('thread', 'pipelined'), ('thread', 'phased'), ('async', 'pipelined')])
+    def test_areas_share_dedup_and_output(self, app_context, stub_site, engine, mode):
+        """複数エリアのサロンを1つのリストにまとめ、重複するサロンは一度だけ取得してエリアを併記する。"""
+        app_context.config.update({'FETCH_ENGINE': engine, 'SCRAPE_MODE': mode})
+        service = ScrapingService()
+        areas = {
+            '1': {'name': 'スタブ', 'url': f'{stub_site}/salon/'},
+            '2': {'name': 'スタブ2', 'url': f'{stub_site}/area2/'},
+        }
+        detail_task = '_scrape_salon_details_async' if engine == 'async' else '_scrape_salon_details'
+        with patch.object(service, '_get_area_info', side_effect=areas.get), \
+                patch.object(service, detail_task, wraps=getattr(service, detail_task)) as detail:
+            events = _events(service.run_scraping(['1', '2'], 'job-multi'))
+
+        assert 'error' not in [kind for kind, _ in events]
+        assert sorted(c.args[0].rsplit('/', 2)[-2] for c in detail.call_args_list) == [
+            'slnH000000001', 'slnH000000002', 'slnH000000003'
+        ]
+        result = next(data for kind, data in events if kind == 'result')
+        assert result['file_name'].startswith('スタブほか1エリア_')
+        df = pd.read_excel(render_download(app_context.config['OUTPUT_DIR'], result['file_name']))
+        assert list(df.columns)[0] == 'エリア'
+        assert dict(zip(df['サロン名'], df['エリア'])) == {
+            'サロン1': 'スタブ', 'サロン2': 'スタブ、スタブ2', 'サロン3': 'スタブ、スタブ2',
+        }
+        saved, _ = read_result(result_path(app_context.config['OUTPUT_DIR'], result['file_name']))
+        assert list(saved.columns)[0] == 'エリア'
+
+    def test_search_lookups_follow_concurrency(self, app_context):
+        """総ページ数の確認は現在の同時取得数までしか並行せず、進捗をsearch_progressイベントで送る。"""
+        app_context.config.update({'MAX_WORKERS': 5, 'FETCH_INITIAL_CONCURRENCY': 2})
+        service = ScrapingService()
+        lock = threading.Lock()
+        active, peak = [0], [0]
+
+        def fake_total_pages(url, job_id, word):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.02)
+            with lock:
+                active[0] -= 1
+            return (None, None) if 'area3' in url else (2, url)
+
+        searches = [({'name': f'エリア{i}', 'url': f'https://example.com/area{i}/'}, None) for i in range(6)]
+        with patch.object(service, '_get_total_pages', side_effect=fake_total_pages):
+            events, search_pages = _drain(service._get_search_pages(searches, 'job'))
 
-    def test_target_filename_with_freeword(self, app_context):
-        """freeword指定時、ファイル名に {area}_{freeword}_ が含まれる。"""
+        assert peak[0] == 2
+        assert [area['name'] for area, _, _, _ in search_pages] == ['エリア0', 'エリア1', 'エリア2', 'エリア4', 'エリア5']
+        progress = [json.loads(event.split('data: ', 1)[1]) for event in events]
+        assert events[-1].startswith('event: search_progress')
+        assert (progress[-1]['current'], progress[-1]['total'], progress[-1]['concurrency']) == (6, 6, 2)
+
+    def test_cancel_during_search_lookups(self, app_context):
+        """総ページ数の確認中に中断すると、取得中の検索を待たずにcancelledイベントを送る。"""
+        service = ScrapingService()
+        release = threading.Event()
+
+        def slow_total_pages(url, job_id, word):
+            release.wait(timeout=5)
+            return 1, url
+
+        areas = {str(i): {'name': f'エリア{i}', 'url': f'https://example.com/area{i}/'} for i in range(3)}
+        threading.Timer(0.05, service.cancellation.request, args=('job',)).start()
+        with patch.object(service, '_get_area_info', side_effect=areas.get), \
+                patch.object(service, '_get_total_pages', side_effect=slow_total_pages):
+            generator = service.run_scraping(list(areas), 'job')
+            assert next(generator).startswith('event: message')
+            started = time.monotonic()
+            assert next(generator).startswith('event: cancelled')
+            assert time.monotonic() - started < 2
+            release.set()
+            assert list(generator) == []
+
+    def test_single_area_has_no_area_column(self, app_context, stub_site):
+        """エリアが1つの場合は従来どおりエリア列を出力しない。"""
         service = ScrapingService()
-        name = service._create_target_excel_file(self._df(), '青山・表参道・原宿', '髪質改善')
-        assert name.startswith('青山・表参道・原宿_髪質改善_')
-        assert name.endswith('.xlsx')
+        with patch.object(service, '_get_area_info', return_value={'name': 'スタブ', 'url': f'{stub_site}/salon/'}):
+            events = _events(service.run_scraping(['1'], 'job-single'))
+        result = next(data for kind, data in events if kind == 'result')
+        assert 'エリア' not in result['preview_data'][0]
 
-    def test_excluded_filename_with_freeword(self, app_context):
-        """除外リストも 除外リスト_{area}_{freeword}_ の形になる。"""
+    def test_freewords_share_detail_fetches(self, app_context):
+        """複数のフリーワードの一覧をまとめ、複数のキーワードで見つかったサロンも一度だけ取得する。"""
         service = ScrapingService()
-        df = pd.DataFrame({'サロン名': ['A'], 'exclusion_reason': ['EPRP']})
-        name = service._create_excluded_excel_file(df, 'エリア', '髪質改善')
-        assert name.startswith('除外リスト_エリア_髪質改善_')
+        hits = {'メンズ': ['slnH000000001', 'slnH000000002'], '縮毛矯正': ['slnH000000002', 'slnH000000003']}
+
+        def fake_list(page_url, job_id):
+            word = parse_qs(urlsplit(page_url).query)['freeword'][0]
+            return {f'https://example.com/{salon_id}/' for salon_id in hits[word]}
+
+        def fake_detail(salon_url, job_id):
+            salon_id = salon_url.rstrip('/').rsplit('/', 1)[-1]
+            return {'サロン名': salon_id, '電話番号': '03-0000-0000', 'サロンURL': salon_url,
+                    'スタッフ数': 'スタイリスト3人', 'has_special_feature': True}
+
+        with patch.object(service, '_get_area_info', return_value={'name': 'エリア', 'url': 'https://example.com/salon/'}), \
+                patch.object(service, '_get_total_pages', side_effect=lambda url, job_id, word: (1, url)), \
+                patch.object(service, '_get_salon_urls_from_page', side_effect=fake_list), \
+                patch.object(service, '_scrape_salon_details', side_effect=fake_detail) as detail:
+            events = _events(service.run_scraping('1', 'job-words', [' メンズ', '縮毛矯正', 'メンズ']))
+
+        assert detail.call_count == 3
+        result = next(data for kind, data in events if kind == 'result')
+        assert result['file_name'].startswith('エリア_メンズ・縮毛矯正_')
+        saved, _ = read_result(result_path(app_context.config['OUTPUT_DIR'], result['file_name']))
+        assert list(saved.columns)[0] == 'キーワード'
+        assert sorted(zip(saved['サロン名'], saved['キーワード'])) == [
+            ('slnH000000001', 'メンズ'), ('slnH000000002', 'メンズ、縮毛矯正'), ('slnH000000003', '縮毛矯正'),
+        ]
 
-    def test_filename_sanitizes_freeword(self, app_context):
-        """freeword中のファイル名禁止文字が除去される。"""
+    def test_prefecture_resolves_areas(self, app_context):
+        """都道府県を指定すると、その都道府県のエリアをID順に対象にする。"""
+        db = get_db()
+        db.execute(areas_table.insert(), [
+            {'id': 1, 'prefecture': '東京都', 'name': '渋谷', 'url': 'https://example.com/a/'},
+            {'id': 2, 'prefecture': '大阪府', 'name': '梅田', 'url': 'https://example.com/b/'},
+            {'id': 3, 'prefecture': '東京都', 'name': '新宿', 'url': 'https://example.com/c/'},
+        ])
+        db.commit()
         service = ScrapingService()
-        name = service._create_target_excel_file(self._df(), 'エリア', '髪/質:改善')
-        assert '/' not in name and ':' not in name
-        assert name.startswith('エリア_髪質改善_')
 
-    def test_symbol_only_freeword_falls_back(self, app_context):
-        """サニタイズ後に空になるfreewordはfreewordなしのファイル名にフォールバックする。"""
+        assert [area['name'] for area in service._get_areas(None, '東京都')] == ['渋谷', '新宿']
+        # 指定したエリアと都道府県のエリアが重なる場合は1つにまとめる
+        assert [area['name'] for area in service._get_areas(['3'], '東京都')] == ['新宿', '渋谷']
+        with pytest.raises(ValueError):
+            service._get_areas(None, '北海道')
+
+
+class TestHttpCacheIntegration:
+    def _run(self, app_context, stub_site, job_id):
         service = ScrapingService()
-        name = service._create_target_excel_file(self._df(), 'エリア', '///')
-        assert re.match(r'^エリア_\d{8}_\d{6}\.xlsx$', name)
+        area = {'name': 'スタブ', 'url': f'{stub_site}/salon/'}
+        with patch.object(service, '_get_area_info', return_value=area):
+            events = _events(service.run_scraping('1', job_id))
+        return next(data for kind, data in events if kind == 'result')
+
+    @pytest.mark.parametrize('engine', ['thread', 'async'])
+    def test_second_run_served_from_cache(self, app_context, stub_site, tmp_path, engine):
+        """2回目の実行はキャッシュから返され、resultにヒット数が含まれる。"""
+        app_context.config.update({'HTTP_CACHE_ENABLED': 1, 'FETCH_ENGINE': engine})
+        with patch.object(app_context, 'instance_path', str(tmp_path)):
+            first = self._run(app_context, stub_site, 'job-1')
+            second = self._run(app_context, stub_site, 'job-2')
+
+        assert first['cache_stats']['misses'] > 0
+        assert second['cache_stats']['misses'] == 0
+        assert second['cache_stats']['hits'] > 0
+        assert len(second['preview_data']) == 3
+
+    def test_expired_entries_revalidated_with_etag(self, app_context, stub_site, tmp_path):
+        """TTL切れのエントリはETagで再検証され、304なら保存済みの本文を使う。"""
+        app_context.config.update({
+            'HTTP_CACHE_ENABLED': 1, 'HTTP_CACHE_TTL_LIST': 0,
+            'HTTP_CACHE_TTL_DETAIL': 0, 'HTTP_CACHE_TTL_PHONE': 0,
+        })
+        with patch.object(app_context, 'instance_path', str(tmp_path)):
+            self._run(app_context, stub_site, 'job-1')
+            second = self._run(app_context, stub_site, 'job-2')
+
+        assert second['cache_stats']['misses'] == 0
+        assert second['cache_stats']['revalidated'] > 0
+        assert len(second['preview_data']) == 3
+
+
+class TestWorkQueue:
+    def test_details_start_before_listing_finishes(self, app_context):
+        """一覧ページの解析直後に詳細取得が始まる（全一覧ページの完了を待たない）。"""
+        service = ScrapingService()
+        first_detail_started = threading.Event()
+        waited = []
+
+        def fake_list(page_url, job_id):
+            if page_url.endswith('PN2.html'):
+                # 1ページ目のサロン詳細が始まるまで2ページ目を完了させない
+                waited.append(first_detail_started.wait(timeout=5))
+                return {'https://example.com/slnH000000002/'}
+            return {'https://example.com/slnH000000001/'}
+
+        def fake_detail(salon_url, job_id):
+            first_detail_started.set()
+            return {'サロンURL': salon_url}
+
+        with patch.object(service, '_get_salon_urls_from_page', side_effect=fake_list), \
+                patch.object(service, '_scrape_salon_details', side_effect=fake_detail):
+            events = _events(service._run_work_queue(
+                'job', page_urls=['https://example.com/salon/', 'https://example.com/salon/PN2.html']
+            ))
+
+        assert waited == [True]
+        progress = [data for kind, data in events if kind == 'progress']
+        assert len(progress) == 2
+        assert (progress[-1]['current'], progress[-1]['total']) == (2, 2)
+        assert 'pages_total' not in progress[-1]
+
+    def test_dedup_across_pages(self, app_context):
+        """複数の一覧ページに現れた同じサロンURLは一度だけ詳細取得する。"""
+        service = ScrapingService()
+        shared = 'https://example.com/slnH000000001/'
+        pages = {
+            'https://example.com/salon/': {shared, 'https://example.com/slnH000000002/'},
+            'https://example.com/salon/PN2.html': {shared},
+        }
+        with patch.object(service, '_get_salon_urls_from_page', side_effect=lambda url, job: pages[url]), \
+                patch.object(service, '_scrape_salon_details', side_effect=lambda url, job: {'サロンURL': url}) as detail:
+            list(service._run_work_queue('job', page_urls=list(pages)))
+
+        assert sorted(c.args[0] for c in detail.call_args_list) == sorted({shared, 'https://example.com/slnH000000002/'})
+
+    def test_dedup_by_salon_id_before_fetch(self, app_context):
+        """表記の異なる同じサロンのURLは、詳細ページを取得する前にサロンID単位でまとめる。"""
+        service = ScrapingService()
+        pages = {
+            'https://example.com/salon/': {'https://example.com/slnH000000001/?cstt=1'},
+            'https://example.com/salon/PN2.html': {'https://example.com/slnH000000001/?vos=2'},
+        }
+        with patch.object(service, '_get_salon_urls_from_page', side_effect=lambda url, job: pages[url]), \
+                patch.object(service, '_scrape_salon_details', side_effect=lambda url, job: {'サロンURL': url}) as detail:
+            events = _events(service._run_work_queue('job', page_urls=list(pages)))
+
+        detail.assert_called_once()
+        assert [data['total'] for kind, data in events if kind == 'progress'][-1] == 1
+
+    @pytest.mark.parametrize('kr_page', ['https://example.com/salon/', 'https://example.com/salon/PN2.html'])
+    def test_kr_url_preferred_regardless_of_order(self, app_context, kr_page):
+        """同じサロンが/kr/あり・なしのURLで見つかった場合、一覧の順によらず/kr/のURLで出力する。"""
+        service = ScrapingService()
+        pages = {
+            'https://example.com/salon/': {'https://example.com/slnH000000001/'},
+            'https://example.com/salon/PN2.html': {'https://example.com/slnH000000001/'},
+        }
+        pages[kr_page] = {'https://example.com/kr/slnH000000001/'}
+        with patch.object(service, '_get_salon_urls_from_page', side_effect=lambda url, job: pages[url]), \
+                patch.object(service, '_scrape_salon_details', side_effect=lambda url, job: {'サロンURL': url}) as detail:
+            _, salon_details = _drain(service._run_work_queue('job', page_urls=list(pages)))
+
+        detail.assert_called_once()
+        assert salon_details == [{'サロンURL': 'https://example.com/kr/slnH000000001/'}]
+
+    def test_list_page_urls_normalized(self, app_context):
+        """一覧ページのサロンリンクは、サロンIDだけを含む正規のURLにそろえる。"""
+        service = ScrapingService()
+        response = MagicMock(
+            content=(
+                '<html><body><ul class="slnCassetteList">'
+                '<li><h3 class="slnName"><a href="/slnH000000001/?cstt=1">A</a></h3></li>'
+                '<li><h3 class="slnName"><a href="https://beauty.hotpepper.jp/slnH000000001/?vos=x">A</a></h3></li>'
+                '<li><h3 class="slnName"><a href="/kr/slnH000000002/">B</a></h3></li>'
+                '</ul></body></html>'
+            ).encode('utf-8'),
+            encoding='utf-8',
+        )
+        urls = service._parse_salon_urls(response, 'https://beauty.hotpepper.jp/svcSA/salon/')
+        assert urls == {'https://beauty.hotpepper.jp/slnH000000001/', 'https://beauty.hotpepper.jp/kr/slnH000000002/'}
 
-    def test_no_freeword_filename_unchanged(self, app_context):
-        """freeword未指定時は従来通り {area}_{timestamp}.xlsx（後方互換）。"""
+    def test_phone_page_is_separate_task(self, app_context):
+        """電話番号ページは詳細タスクとは別に取得され、サロン情報に結合される。"""
         service = ScrapingService()
-        name = service._create_target_excel_file(self._df(), 'エリア', None)
-        assert re.match(r'^エリア_\d{8}_\d{6}\.xlsx$', name)
+        salon_url = 'https://example.com/slnH000000001/'
+        detail = {
+            'サロン名': 'A', '電話番号': '', 'サロンURL': salon_url,
+            'phone_page_url': f'{salon_url}tel/',
+        }
+        with patch.object(service, '_scrape_salon_details', return_value=detail), \
+                patch.object(service, '_scrape_phone_number', return_value='03-1111-2222') as mock_phone:
+            events, salon_details = _drain(service._run_work_queue('job', salon_urls=[salon_url]))
+
+        mock_phone.assert_called_with(f'{salon_url}tel/', 'job')
+        assert salon_details[0]['電話番号'] == '03-1111-2222'
+        assert 'phone_page_url' not in salon_details[0]
+        assert [kind for kind, _ in _events(events)] == ['progress']
+        assert service.fetch_stats['phone']['count'] == 1
+
+    def test_per_kind_concurrency_limit(self, app_context):
+        """PHONE_MAX_CONCURRENCYで電話番号ページの同時取得数を制限できる。"""
+        app_context.config['PHONE_MAX_CONCURRENCY'] = 1
+        service = ScrapingService()
+        lock = threading.Lock()
+        active, peak = [0], [0]
+
+        def fake_detail(salon_url, job_id):
+            return {'サロンURL': salon_url, '電話番号': '', 'phone_page_url': f'{salon_url}tel/'}
+
+        def fake_phone(url, job_id):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.02)
+            with lock:
+                active[0] -= 1
+            return '03-0000-0000'
+
+        urls = [f'https://example.com/slnH00000000{i}/' for i in range(5)]
+        with patch.object(service, '_scrape_salon_details', side_effect=fake_detail), \
+                patch.object(service, '_scrape_phone_number', side_effect=fake_phone):
+            list(service._run_work_queue('job', salon_urls=urls))
+
+        assert peak[0] == 1
+        assert service.fetch_stats['phone']['count'] == 5
+
+
+    def test_incremental_skips_fresh_salons(self, app_context):
+        """差分取得では、鮮度期間内のサロンを再取得せず保存済みデータを使う。"""
+        service = ScrapingService()
+        cached_url = 'https://example.com/slnH000000001/'
+        new_url = 'https://example.com/slnH000000002/'
+        service.salon_store.save([{'サロン名': 'A', '電話番号': '03-1111-1111', 'サロンURL': cached_url,
+                                   'has_special_feature': True}])
+
+        def fake_detail(salon_url, job_id):
+            return {'サロン名': 'B', '電話番号': '03-2222-2222', 'サロンURL': salon_url, 'has_special_feature': True}
+
+        with patch.object(service, '_scrape_salon_details', side_effect=fake_detail) as detail:
+            _, salon_details = _drain(service._run_work_queue('job', salon_urls=[cached_url, new_url], incremental=True))
+
+        detail.assert_called_once_with(new_url, 'job')
+        assert sorted(d['サロン名'] for d in salon_details) == ['A', 'B']
+        assert service.served_from_store == 1
+        # 新たに取得したサロンも保存される
+        assert set(service.salon_store.load_fresh({'slnH000000001', 'slnH000000002'})) == {
+            'slnH000000001', 'slnH000000002'
+        }
+
+    def test_failed_phone_fetch_not_stored(self, app_context):
+        """電話番号ページの取得に失敗したサロンは出力するが、salonsテーブルには保存しない。"""
+        service = ScrapingService()
+        urls = ['https://example.com/slnH000000001/', 'https://example.com/slnH000000002/']
+
+        def fake_detail(salon_url, job_id):
+            return {'サロンURL': salon_url, '電話番号': '', 'has_special_feature': True,
+                    'phone_page_url': f'{salon_url}tel/'}
+
+        def fake_phone(url, job_id):
+            return None if 'slnH000000001' in url else ''
+
+        with patch.object(service, '_scrape_salon_details', side_effect=fake_detail), \
+                patch.object(service, '_scrape_phone_number', side_effect=fake_phone):
+            _, salon_details = _drain(service._run_work_queue('job', salon_urls=urls))
+
+        assert sorted(d['サロンURL'] for d in salon_details) == urls
+        assert set(service.salon_store.load_fresh({'slnH000000001', 'slnH000000002'})) == {'slnH000000002'}
+
+    def test_non_incremental_rescrapes_all(self, app_context):
+        """差分取得でない場合は保存済みのサロンも再取得する。"""
+        service = ScrapingService()
+        url = 'https://example.com/slnH000000001/'
+        service.salon_store.save([{'サロン名': 'A', 'サロンURL': url, 'has_special_feature': True}])
+        with patch.object(service, '_scrape_salon_details', return_value={'サロンURL': url}) as detail:
+            list(service._run_work_queue('job', salon_urls=[url]))
+        detail.assert_called_once()
+
+    def test_tagged_records_held_until_listing_finishes(self, app_context):
+        """タグ付きの一覧では、後の一覧ページで見つかったタグも含めてからサロン情報を出力する。"""
+        service = ScrapingService()
+        shared = 'https://example.com/slnH000000001/'
+        first_detail_done = threading.Event()
+
+        def fake_list(page_url, job_id):
+            if page_url.endswith('b/'):
+                first_detail_done.wait(timeout=5)
+            return {shared}
+
+        def fake_detail(salon_url, job_id):
+            first_detail_done.set()
+            return {'サロンURL': salon_url}
+
+        pages = {'https://example.com/a/': {'エリア': 'A'}, 'https://example.com/b/': {'エリア': 'B'}}
+        with patch.object(service, '_get_salon_urls_from_page', side_effect=fake_list), \
+                patch.object(service, '_scrape_salon_details', side_effect=fake_detail) as detail:
+            _, salon_details = _drain(service._run_work_queue('job', page_urls=list(pages), page_tags=pages))
+
+        detail.assert_called_once()
+        assert salon_details == [{'サロンURL': shared, 'エリア': 'A、B'}]
+
+    def test_resume_from_checkpoint_skips_completed_work(self, app_context, tmp_path):
+        """チェックポイントから再開すると、保存済みのサロンは再取得せず待ち行列の続きだけを取得する。"""
+        app_context.config.update({'MAX_WORKERS': 1, 'CHECKPOINT_INTERVAL_SECONDS': 0})
+        store = JobStore(str(tmp_path))
+        store.create('job', 'scrape', {})
+        checkpoint = JobCheckpoint(store, 'job')
+        urls = [f'https://example.com/slnH00000000{i}/' for i in range(1, 4)]
+
+        service = ScrapingService()
+        with patch.object(service, '_scrape_salon_details', side_effect=lambda url, job: {'サロンURL': url}):
+            generator = service._run_work_queue('job', salon_urls=urls, checkpoint=checkpoint)
+            # 2件目の完了時点でワーカーが停止したものとする（1件目までがチェックポイントに保存済み）
+            progress = 0
+            for event in generator:
+                if event.startswith('event: progress'):
+                    progress += 1
+                    if progress == 2:
+                        break
+            generator.close()
+
+        state, records = checkpoint.load()
+        assert records == [{'サロンURL': urls[0]}]
+
+        service = ScrapingService()
+        with patch.object(service, '_scrape_salon_details', side_effect=lambda url, job: {'サロンURL': url}) as detail:
+            _, salon_details = _drain(service._run_work_queue(
+                'job', output=list(records), checkpoint=checkpoint, resume_state=state
+            ))
+
+        assert [c.args[0] for c in detail.call_args_list] == urls[1:]
+        assert [d['サロンURL'] for d in salon_details] == urls
+
+
+class TestAdaptiveConcurrency:
+    def _response(self, status_code):
+        response = requests.Response()
+        response.status_code = status_code
+        response.url = 'https://example.com/salon/'
+        response._content = b''
+        return response
+
+    def test_throttling_halves_concurrency(self, app_context):
+        """429を受けると同時取得数を半分にする。"""
+        app_context.config.update({'MAX_WORKERS': 8, 'FETCH_INITIAL_CONCURRENCY': 8, 'RETRY_COUNT': 1})
+        service = ScrapingService()
+        with patch.object(service.session, 'get', return_value=self._response(429)):
+            assert service._make_request('https://example.com/salon/', 'job') is None
+        assert service.concurrency.limit == 4
+
+    def test_simultaneous_throttles_halve_once(self, app_context):
+        """同時に送ったリクエストがまとめて429を受けても、同時取得数を半分にするのは1回だけ。"""
+        app_context.config.update({'MAX_WORKERS': 8, 'FETCH_INITIAL_CONCURRENCY': 8, 'RETRY_COUNT': 1})
+        service = ScrapingService()
+        barrier = threading.Barrier(8)
+
+        def throttled(url, **kwargs):
+            barrier.wait(timeout=5)
+            return self._response(429)
+
+        with patch.object(service.session, 'get', side_effect=throttled), ThreadPoolExecutor(max_workers=8) as executor:
+            futures = [
+                executor.submit(service._fetch, f'https://example.com/slnH00000000{i}/', 'job') for i in range(8)
+            ]
+            assert [future.result() for future in futures] == [None] * 8
+        assert service.concurrency.limit == 4
+
+    def test_default_initial_concurrency_can_increase(self, app_context):
+        """同時取得数の初期値のデフォルトは上限(MAX_WORKERS)より小さく、増やす余地がある。"""
+        assert app_context.config['FETCH_INITIAL_CONCURRENCY'] < app_context.config['MAX_WORKERS']
+        service = ScrapingService()
+        assert service.concurrency.limit < service.concurrency.maximum
+
+    def test_work_queue_follows_current_concurrency(self, app_context):
+        """ワークキューは現在の同時取得数までしかタスクを投入せず、進捗イベントに同時取得数を含める。"""
+        app_context.config.update({'MAX_WORKERS': 5, 'FETCH_INITIAL_CONCURRENCY': 2})
+        service = ScrapingService()
+        lock = threading.Lock()
+        active, peak = [0], [0]
+
+        def fake_detail(salon_url, job_id):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.02)
+            with lock:
+                active[0] -= 1
+            return {'サロンURL': salon_url}
+
+        urls = [f'https://example.com/slnH00000000{i}/' for i in range(6)]
+        with patch.object(service, '_scrape_salon_details', side_effect=fake_detail):
+            events = _events(service._run_work_queue('job', salon_urls=urls))
+
+        assert peak[0] == 2
+        assert {data['concurrency'] for kind, data in events if kind == 'progress'} == {2}
+
+
+class TestParseSalonDetails:
+    DETAIL_HTML = (
+        '<html><body>'
+        '<p class="detailTitle"><a> サロン　テスト </a></p>'
+        '<a href="/slnH000000001/tel/">電話番号</a>'
+        '<table class="slnDataTbl"><tbody>'
+        '<tr><th>住所</th><td><p>東京都渋谷区</p><p>1-1</p></td></tr>'
+        '<tr><th>スタッフ数</th><td>スタイリスト1人</td></tr>'
+        '</tbody></table>'
+        '<div class="mT30 mB20"><ul class="mT10"><li><a href="https://a.example/">a</a></li><li><a>no href</a></li></ul></div>'
+        '</body></html>'
+    )
+
+    def _response(self, html, encoding):
+        fake = MagicMock()
+        fake.content = html.encode(encoding or 'utf-8')
+        fake.encoding = encoding
+        return fake
+
+    @pytest.mark.parametrize('encoding', ['utf-8', 'shift_jis'])
+    def test_extracts_fields(self, app_context, encoding):
+        """どのバックエンド・文字コードでも同じサロン情報を抽出する。"""
+        service = ScrapingService()
+        doc = service._parse_html(self._response(self.DETAIL_HTML, encoding))
+        record = service._parse_salon_details(doc, 'https://beauty.hotpepper.jp/slnH000000001/?x=1')
+        assert record['サロン名'] == 'サロン　テスト'
+        assert record['住所'] == '東京都渋谷区 1-1'
+        assert record['スタッフ数'] == 'スタイリスト1人'
+        assert record['関連リンク'] == 'https://a.example/'
+        assert record['サロンURL'] == 'https://beauty.hotpepper.jp/slnH000000001/'
+        assert record['phone_page_url'] == 'https://beauty.hotpepper.jp/slnH000000001/tel/'
+        assert record['has_special_feature'] is False
+
+    def test_charset_from_meta_when_header_missing(self, app_context):
+        """ヘッダーに文字コードがない場合はmetaタグの宣言で解析する。"""
+        service = ScrapingService()
+        html = '<html><head><meta charset="shift_jis"></head><body><td class="fs16 b">03-1234-5678 代表</td></body></html>'
+        fake = MagicMock()
+        fake.content = html.encode('shift_jis')
+        fake.encoding = None
+        assert service._parse_phone_number(fake) == '03-1234-5678 代表'
+
+    def test_empty_document(self, app_context):
+        """空のレスポンスでも例外にならない。"""
+        service = ScrapingService()
+        assert service._parse_phone_number(self._response('', 'utf-8')) == ''
+
+
+class TestCancellation:
+    def test_retry_wait_interrupted(self, app_context):
+        """リトライ前の待機中にキャンセルされると、待機を打ち切ってNoneを返す。"""
+        app_context.config['REQUEST_WAIT_SECONDS'] = 30
+        service = ScrapingService()
+        threading.Timer(0.05, service.cancellation.request, args=('job',)).start()
+
+        started = time.monotonic()
+        with patch.object(service.session, 'get', side_effect=requests.exceptions.ConnectionError('down')):
+            assert service._make_request('https://example.com/salon/', 'job') is None
+        assert time.monotonic() - started < 5
+
+    def test_cancel_does_not_wait_for_in_flight_tasks(self, app_context):
+        """取得中のタスクが終わるのを待たずにcancelledイベントを送る。"""
+        service = ScrapingService()
+        release = threading.Event()
+
+        def slow_detail(salon_url, job_id):
+            release.wait(timeout=5)
+            return {'サロンURL': salon_url}
+
+        threading.Timer(0.05, service.cancellation.request, args=('job',)).start()
+        with patch.object(service, '_scrape_salon_details', side_effect=slow_detail):
+            generator = service._run_work_queue('job', salon_urls=['https://example.com/slnH000000001/'])
+            started = time.monotonic()
+            assert next(generator).startswith('event: cancelled')
+            assert time.monotonic() - started < 2
+            release.set()
+            list(generator)
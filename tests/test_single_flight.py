@@ -0,0 +1,102 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.main.services.single_flight import SingleFlight
+
+
+class TestSingleFlight:
+    def test_concurrent_calls_coalesced(self):
+        """実行中のキーへの呼び出しは処理を実行せず、同じ結果を受け取る。"""
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            started.set()
+            release.wait(timeout=5)
+            return 'response'
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            leader = executor.submit(flight.do, 'url', fetch)
+            started.wait(timeout=5)
+            follower = executor.submit(flight.do, 'url', fetch)
+            threading.Timer(0.05, release.set).start()
+            assert leader.result() == ('response', False)
+            assert follower.result() == ('response', True)
+        assert len(calls) == 1
+
+    def test_finished_call_not_reused(self):
+        """完了した処理の結果は保持せず、次の呼び出しで再び実行する。"""
+        flight = SingleFlight()
+        assert flight.do('url', lambda: 1) == (1, False)
+        assert flight.do('url', lambda: 2) == (2, False)
+
+    def test_error_shared_with_waiters(self):
+        """処理の例外は待機中の呼び出し元にも送出される。"""
+        flight = SingleFlight()
+        future, leader = flight._join('url')
+        assert leader
+        waiter = threading.Thread(target=lambda: pytest.raises(ValueError, flight.do, 'url', lambda: None))
+        waiter.start()
+        flight._finish('url', future, error=ValueError('failed'))
+        waiter.join(timeout=5)
+        assert not waiter.is_alive()
+
+    def test_wait_can_give_up(self):
+        """waitが未完了のまま戻った場合は、結果をNoneとして返す。"""
+        flight = SingleFlight()
+        flight._join('url')
+        assert flight.do('url', lambda: 'unused', wait=lambda future: None) == (None, True)
+
+    def test_async_waits_for_thread_leader(self):
+        """コルーチンからの呼び出しも、スレッドで実行中の処理の結果を共有する。"""
+        flight = SingleFlight()
+        future, _ = flight._join('url')
+        threading.Timer(0.05, flight._finish, args=('url', future, 'response')).start()
+
+        async def fetch():
+            raise AssertionError('should not be called')
+
+        assert asyncio.run(flight.do_async('url', fetch)) == ('response', True)
+
+    def test_cancelled_async_leader_not_propagated(self):
+        """処理を実行中のコルーチンがキャンセルされても、待機中の呼び出し元には結果をNoneとして返す。"""
+        flight = SingleFlight()
+
+        async def run():
+            started = asyncio.Event()
+
+            async def fetch():
+                started.set()
+                await asyncio.sleep(5)
+
+            leader = asyncio.create_task(flight.do_async('url', fetch))
+            await started.wait()
+            follower = asyncio.create_task(flight.do_async('url', fetch))
+            await asyncio.sleep(0)
+            leader.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await leader
+            return await follower
+
+        assert asyncio.run(run()) == (None, True)
+
+    def test_cancelled_async_waiter_does_not_cancel_call(self):
+        """待機中のコルーチンがキャンセルされても、他の呼び出し元は処理の結果を受け取る。"""
+        flight = SingleFlight()
+        future, _ = flight._join('url')
+
+        async def run():
+            waiters = [asyncio.create_task(flight.do_async('url', None)) for _ in range(2)]
+            await asyncio.sleep(0)
+            waiters[0].cancel()
+            await asyncio.sleep(0)
+            flight._finish('url', future, 'response')
+            return await waiters[1]
+
+        assert asyncio.run(run()) == ('response', True)